@@ -1,18 +1,330 @@
-from flask import Flask, render_template, request, send_file, abort
-import pandas as pd
+from flask import (Blueprint, Flask, Request, Response, render_template, request, send_file, abort, jsonify,
+                   redirect, g, current_app, has_app_context, has_request_context)
+from werkzeug.exceptions import RequestEntityTooLarge
 from io import BytesIO
-import numpy as np
 import zipfile
-# openpyxl is needed for manual worksheet manipulation (merging/centering)
-from openpyxl.styles import Alignment, Font 
-from openpyxl.chart import BarChart, Reference, Series 
-from openpyxl.chart.label import DataLabelList
-from openpyxl.utils import get_column_letter # Used for column width
-
-app = Flask(__name__)
-
-# holds the last generated Excel results in memory (per process)
-last_results_excel_bytes = None
+import os
+import json
+import shutil
+import hashlib
+import importlib.util
+import mmap
+import threading
+import time
+import secrets
+import sys
+import tempfile
+import tracemalloc
+import cProfile
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import MappingProxyType
+from urllib.parse import urlparse
+
+from job_queue import JOB_STAGES, JobQueue, QueueFullError
+from report_writers import REPORT_WRITERS, OpenpyxlReportWriter, XlsxWriterReportWriter
+from result_store import MemoryResultStore, SQLiteResultStore
+
+
+# --- Startup ---
+
+class LazyModule:
+    """Stands in for a heavy module (pandas, numpy) until it is first used.
+
+    The first attribute access imports the module and rebinds the module-level
+    name to it, so a worker that only serves the upload page never pays for
+    the import and later lookups skip this class altogether.
+    """
+
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def load(self):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+pd = LazyModule('pandas', 'pd')
+np = LazyModule('numpy', 'np')
+
+# imported up front by preload_heavy_modules; openpyxl and requests are
+# otherwise imported inside the export/validation and link-mode functions
+HEAVY_MODULES = ['numpy', 'pandas', 'openpyxl', 'openpyxl.chart', 'openpyxl.chart.label',
+                 'openpyxl.styles', 'openpyxl.utils', 'requests']
+
+
+def preload_heavy_modules():
+    """Imports HEAVY_MODULES now, e.g. in a gunicorn --preload master so forked workers share them."""
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    for alias in ('pd', 'np'):
+        if isinstance(globals()[alias], LazyModule):
+            globals()[alias].load()
+
+
+DEFAULT_CONFIG = dict(
+    # parsed-workbook cache (see ParseCache); the Parquet tier needs pyarrow
+    PARSE_CACHE_MAX_BYTES=256 * 1024 * 1024,
+    PARSE_CACHE_DIR=os.environ.get('COPO_PARSE_CACHE_DIR'),
+    PARSE_CACHE_DIR_MAX_BYTES=1024 * 1024 * 1024,
+    # per-calculation result downloads (see get_result_store); set
+    # COPO_RESULT_STORE to an SQLite file to share results between workers
+    RESULT_STORE_PATH=os.environ.get('COPO_RESULT_STORE'),
+    RESULT_STORE_MAX_ENTRIES=256,
+    RESULT_STORE_TTL_SECONDS=3600,
+    # link mode downloads (see UrlFetcher): (connect, read) timeouts in seconds,
+    # per-file size cap, and the ETag/Last-Modified revalidation cache size
+    URL_FETCH_TIMEOUT=(5, 30),
+    URL_FETCH_MAX_BYTES=50 * 1024 * 1024,
+    URL_CACHE_MAX_BYTES=256 * 1024 * 1024,
+    # upload validation (see validate_course_inputs): marks/survey rows sampled
+    # per file, and problems reported before giving up
+    VALIDATION_SAMPLE_ROWS=50,
+    VALIDATION_MAX_ERRORS=50,
+    # uploads (see SpooledUpload): whole request and per-file caps (413 past
+    # either), the cap for .zip archives (batch mode; None: up to the whole
+    # request), the part of each file kept in memory before it is spooled to
+    # a temp file, and the folder for those (the system temp folder if unset)
+    MAX_CONTENT_LENGTH=200 * 1024 * 1024,
+    UPLOAD_MAX_FILE_BYTES=50 * 1024 * 1024,
+    UPLOAD_MAX_ARCHIVE_BYTES=None,
+    UPLOAD_SPOOL_BYTES=1024 * 1024,
+    UPLOAD_SPOOL_DIR=os.environ.get('COPO_UPLOAD_SPOOL_DIR'),
+    # rows per chunk when aggregating survey CSVs (see aggregate_survey_csv)
+    SURVEY_CSV_CHUNK_ROWS=50000,
+    # workbook writer for reports, samples and exports (see REPORT_WRITERS):
+    # 'xlsxwriter', 'openpyxl', or unset for xlsxwriter whenever it is installed
+    REPORT_WRITER=os.environ.get('COPO_REPORT_WRITER'),
+    # students per chunk when streaming the per-student export
+    STUDENT_EXPORT_CHUNK_ROWS=2000,
+    # prepared courses kept per worker for the what-if API (see PreparedCourse)
+    WHATIF_MAX_COURSES=32,
+    # serialized /download_sample workbooks and ZIPs kept per worker, one per
+    # (sample, college, department, course code) header
+    SAMPLE_CACHE_MAX_ENTRIES=256,
+    # worker processes for one /calculate_batch run (see batch_pool_size); a
+    # max_workers form value is capped at this (batch.py --workers is not)
+    BATCH_MAX_WORKERS=os.cpu_count() or 1,
+    # program-level rollup database (see rollup_store.RollupStore)
+    ROLLUP_STORE_PATH=os.environ.get('COPO_ROLLUP_STORE'),
+    # background calculations (see JobQueue): SQLite queue file, worker
+    # threads per process, queued + running jobs accepted before answering 503,
+    # how often a worker marks its running job as alive, and how long a running
+    # job may go without that heartbeat (its worker died) before it is retried
+    JOB_QUEUE_PATH=os.environ.get('COPO_JOB_QUEUE'),
+    JOB_WORKERS=2,
+    JOB_QUEUE_MAX_PENDING=16,
+    JOB_HEARTBEAT_SECONDS=30,
+    JOB_STALE_SECONDS=120,
+    # instrumentation (see stage_span): Server-Timing/X-Timing response headers,
+    # traced peak memory per stage (tracemalloc, slows everything down), and
+    # per-request profiles (?profile=1 or an X-Profile: 1 header) written to PROFILE_DIR
+    TIMING_HEADERS=os.environ.get('COPO_TIMING_HEADERS') == '1',
+    METRICS_TRACE_MEMORY=os.environ.get('COPO_TRACE_MEMORY') == '1',
+    PROFILING_ENABLED=os.environ.get('COPO_PROFILING') == '1',
+    PROFILE_DIR=os.environ.get('COPO_PROFILE_DIR'),
+    # import pandas/numpy/openpyxl in create_app instead of on first use
+    # (set it for gunicorn --preload so the workers share those pages)
+    PRELOAD_HEAVY_MODULES=os.environ.get('COPO_PRELOAD') == '1',
+)
+
+# every route and request hook; create_app registers them on a new app
+bp = Blueprint('copo', __name__)
+
+
+def running_app():
+    """The app handling the current request or job, else the module's default `app` (batch.py, pool workers)."""
+    return current_app._get_current_object() if has_app_context() else app
+
+
+def endpoint_name():
+    """request.endpoint without the blueprint prefix ('calculate', not 'copo.calculate')."""
+    return (request.endpoint or 'unknown').rpartition('.')[2]
+
+
+# --- Instrumentation ---
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(m * 10 ** e for e in range(9) for m in (1, 2.5, 5))
+MEMORY_BUCKETS = tuple(2 ** e for e in range(16, 34, 2))  # 64 KiB .. 4 GiB
+
+
+class Histogram:
+    """One Prometheus histogram metric, with a series per label combination."""
+
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1  # last slot: above every bucket
+            totals[0] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), totals[0]) for key, (counts, totals) in self._series.items()]
+        for key, counts, total in sorted(series):
+            labels = ','.join(f'{name}="{prometheus_escape(value)}"' for name, value in zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+def prometheus_escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+STAGE_SECONDS = Histogram('copo_stage_seconds', 'Time spent in each calculation stage.',
+                          SECONDS_BUCKETS, ['stage'])
+STAGE_PEAK_MEMORY = Histogram('copo_stage_peak_memory_bytes',
+                              'Peak traced Python memory above the start of each stage (METRICS_TRACE_MEMORY).',
+                              MEMORY_BUCKETS, ['stage'])
+STAGE_INPUT_SIZE = Histogram('copo_stage_input_size', 'Input sizes (students, questions, COs, bytes) per stage.',
+                             SIZE_BUCKETS, ['stage', 'dimension'])
+REQUEST_SECONDS = Histogram('copo_request_seconds', 'Request handling time by endpoint and status code.',
+                            SECONDS_BUCKETS, ['endpoint', 'status'])
+METRICS = [STAGE_SECONDS, STAGE_PEAK_MEMORY, STAGE_INPUT_SIZE, REQUEST_SECONDS]
+
+_open_spans = threading.local()
+
+
+@contextmanager
+def stage_span(stage, **sizes):
+    """Times a block of work into copo_stage_seconds and the request's Server-Timing header.
+
+    Keyword arguments (and anything added to the yielded dict inside the block)
+    are recorded as input sizes. With METRICS_TRACE_MEMORY the traced peak
+    memory of the block is recorded as well; tracemalloc is process-wide, so
+    concurrent requests make it an upper bound.
+    """
+    trace_memory = running_app().config['METRICS_TRACE_MEMORY']
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    stack = _open_spans.__dict__.setdefault('stack', [])
+    span = {'start_memory': 0, 'peak_memory': 0}
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:  # the enclosing span's peak so far, before reset_peak forgets it
+            stack[-1]['peak_memory'] = max(stack[-1]['peak_memory'], peak)
+        tracemalloc.reset_peak()
+        span['start_memory'] = current
+    stack.append(span)
+    start = time.perf_counter()
+    try:
+        yield sizes
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        for dimension, value in sizes.items():
+            STAGE_INPUT_SIZE.observe(value, stage=stage, dimension=dimension)
+        if trace_memory and tracemalloc.is_tracing():
+            peak = max(span['peak_memory'], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]['peak_memory'] = max(stack[-1]['peak_memory'], peak)
+            STAGE_PEAK_MEMORY.observe(peak - span['start_memory'], stage=stage)
+        if has_request_context():
+            g.setdefault('stage_timings', []).append((stage, elapsed))
+
+
+def no_span(stage, **sizes):
+    """Stands in for stage_span where a stage repeats too often to time each run."""
+    return nullcontext(sizes)
+
+
+def process_memory_lines():
+    """Resident and peak resident memory gauges from /proc (Linux only)."""
+    fields = {'VmRSS': 'copo_process_resident_memory_bytes', 'VmHWM': 'copo_process_peak_resident_memory_bytes'}
+    lines = []
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key = line.split(':', 1)[0]
+                if key in fields:
+                    lines += [f'# TYPE {fields[key]} gauge', f'{fields[key]} {int(line.split()[1]) * 1024}']
+    except OSError:
+        pass
+    return lines
+
+
+def metrics_text():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return '\n'.join(lines + process_memory_lines()) + '\n'
+
+
+def profile_path(suffix):
+    directory = current_app.config['PROFILE_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f'{stamp}-{endpoint_name()}-{secrets.token_hex(3)}{suffix}')
+
+
+@bp.before_app_request
+def start_request_instrumentation():
+    g.request_start = time.perf_counter()
+    if current_app.config['PROFILING_ENABLED'] and (request.args.get('profile') == '1'
+                                                    or request.headers.get('X-Profile') == '1'):
+        # pyinstrument when installed (readable call tree), cProfile otherwise
+        if importlib.util.find_spec('pyinstrument') is not None:
+            from pyinstrument import Profiler
+            g.profiler = Profiler()
+            g.profiler.start()
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+
+@bp.after_app_request
+def finish_request_instrumentation(response):
+    REQUEST_SECONDS.observe(time.perf_counter() - g.get('request_start', time.perf_counter()),
+                            endpoint=endpoint_name(), status=response.status_code)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = profile_path('.prof')  # open with pstats or snakeviz
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = profile_path('.html')
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        response.headers['X-Profile-Report'] = os.path.basename(path)
+
+    timings = g.get('stage_timings')
+    if timings and current_app.config['TIMING_HEADERS']:
+        response.headers['Server-Timing'] = ', '.join(
+            f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings)
+        response.headers['X-Timing'] = ', '.join(
+            f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in timings)
+    return response
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
 
 
 def get_co_attainment_level(percentage_of_students, thr3_pct, thr2_pct, thr1_pct):
@@ -32,40 +344,141 @@ def get_co_attainment_level(percentage_of_students, thr3_pct, thr2_pct, thr1_pct
         return 0
 
 
-def calculate_tool_co_attainment(df_marks, df_tool_map_meta, tool_type,
-                                 threshold_percentage, thr3_pct, thr2_pct, thr1_pct):
-    # ... (unchanged)
-    df_tool_map = df_tool_map_meta[df_tool_map_meta['Tool_Question'].str.startswith(tool_type)]
-    if df_tool_map.empty or df_marks.empty:
-        return {}
-
-    co_results = {}
-    total_students = len(df_marks)
-    all_cos = df_tool_map['CO'].unique()
-
-    for co_name in all_cos:
-        co_questions = df_tool_map[df_tool_map['CO'] == co_name]
-        mark_cols_for_co = [
-            q + '_Marks' for q in co_questions['Tool_Question'].tolist()
-            if q + '_Marks' in df_marks.columns
-        ]
-        if not mark_cols_for_co:
-            co_results[co_name] = 0
-            continue
+def get_co_attainment_levels(percentages, thr3_pct, thr2_pct, thr1_pct):
+    """Array version of get_co_attainment_level (same cut-offs, element-wise)."""
+    p = np.asarray(percentages, dtype=float)
+    return np.select(
+        [p >= thr3_pct / 100.0, p >= thr2_pct / 100.0, p >= thr1_pct / 100.0],
+        [3, 2, 1],
+        default=0,
+    )
 
-        max_marks = co_questions['Max_Marks'].sum()
-        if max_marks == 0:
-            co_results[co_name] = 0
-            continue
 
-        obtained_marks_sum = df_marks[mark_cols_for_co].fillna(0).sum(axis=1)
-        threshold_score = max_marks * (threshold_percentage / 100.0)
-        students_above_threshold = (obtained_marks_sum >= threshold_score).sum()
-        percentage = students_above_threshold / total_students if total_students > 0 else 0
-        attainment_level = get_co_attainment_level(percentage, thr3_pct, thr2_pct, thr1_pct)
-        co_results[co_name] = attainment_level
+ToolCoIncidence = namedtuple('ToolCoIncidence', [
+    'used_cols',      # marks columns that feed at least one (tool, CO) cell
+    'incidence',      # len(used_cols) x n_cells question -> cell counts
+    'max_marks',      # max marks per cell (all mapped questions, even without a marks column)
+    'cols_per_cell',  # how many marks columns feed each cell
+    'cells',          # [(tool, co, cell_index)] in tool order, COs in order of appearance
+])
+
+
+def build_tool_co_incidence(df_tool_map_meta, marks_columns, tool_prefixes):
+    """Turns the tool map into a question x (tool, CO) incidence matrix.
+
+    A question belongs to every tool whose name it starts with (the same
+    str.startswith rule calculate_tool_co_attainment always used).
+    """
+    questions = df_tool_map_meta['Tool_Question']
+    in_tool = np.column_stack([questions.str.startswith(tool).to_numpy(dtype=bool)
+                               for tool in tool_prefixes])
+    co_codes, co_names = pd.factorize(df_tool_map_meta['CO'])
+    n_cos = len(co_names)
+    n_cells = len(tool_prefixes) * n_cos
+
+    # marks column used by each tool-map row (-1 when the column is missing)
+    mark_col_names = (questions + '_Marks').tolist()
+    used_cols = pd.unique(np.array([c for c in mark_col_names if c in marks_columns], dtype=object))
+    col_pos = pd.Index(used_cols).get_indexer(mark_col_names)
+
+    rows, tools = np.nonzero(in_tool)
+    cells = tools * n_cos + co_codes[rows]
+    has_col = col_pos[rows] >= 0
+
+    max_marks_per_row = df_tool_map_meta['Max_Marks'].to_numpy(dtype=float)
+    max_marks = np.zeros(n_cells)
+    np.add.at(max_marks, cells, np.nan_to_num(max_marks_per_row[rows], nan=0.0))
+    cols_per_cell = np.bincount(cells[has_col], minlength=n_cells)
+
+    incidence = np.zeros((len(used_cols), n_cells))
+    np.add.at(incidence, (col_pos[rows[has_col]], cells[has_col]), 1.0)
+
+    cell_list = [(tool, co_names[code], t * n_cos + code)
+                 for t, tool in enumerate(tool_prefixes)
+                 for code in pd.unique(co_codes[in_tool[:, t]])]
+    return ToolCoIncidence(list(used_cols), incidence, max_marks, cols_per_cell, cell_list)
+
+
+def calculate_all_tool_co_attainments(df_marks, df_tool_map_meta, tool_prefixes,
+                                      threshold_percentage, thr3_pct, thr2_pct, thr1_pct):
+    """Computes {tool: {co: level}} for every tool prefix in one pass.
+
+    df_marks is a CourseMarks (or a marks DataFrame). Every per-student
+    obtained sum comes out of a single matmul against the
+    build_tool_co_incidence matrix.
+    """
+    return calculate_section_tool_co_attainments(
+        df_marks, df_tool_map_meta, tool_prefixes,
+        threshold_percentage, thr3_pct, thr2_pct, thr1_pct
+    )[0]
+
+
+SectionGroups = namedtuple('SectionGroups', [
+    'names',   # sorted section labels
+    'order',   # student rows ordered by section (students without a section left out)
+    'starts',  # offset of each section's first row in `order`, for ufunc.reduceat
+    'sizes',   # students per section
+])
+
+
+def section_groups(sections):
+    """Groups students by their section label (None: no section) for one reduceat pass."""
+    if sections is None:
+        return SectionGroups([], np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp),
+                             np.zeros(0, dtype=np.intp))
+    codes, names = pd.factorize(pd.Series(sections, dtype=object), sort=True)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    sizes = np.bincount(codes[codes >= 0], minlength=len(names))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    return SectionGroups(list(names), order, starts, sizes)
+
+
+def calculate_section_tool_co_attainments(df_marks, df_tool_map_meta, tool_prefixes,
+                                          threshold_percentage, thr3_pct, thr2_pct, thr1_pct):
+    """({tool: {co: level}} for the whole course, {section: {tool: {co: level}}}).
+
+    Sections cost no extra matmul: the students-above-threshold matrix is
+    ordered by section once and summed per section with np.add.reduceat.
+    The section dict is empty when the marks sheet has no Section column.
+    """
+    tool_prefixes = list(tool_prefixes)
+    course_marks = as_course_marks(df_marks)
+    groups = section_groups(course_marks.sections)
+    results = [{tool: {} for tool in tool_prefixes} for _ in range(1 + len(groups.names))]
+    if df_tool_map_meta.empty or course_marks.empty or not tool_prefixes:
+        return results[0], dict(zip(groups.names, results[1:]))
+
+    inc = build_tool_co_incidence(df_tool_map_meta, course_marks.columns, tool_prefixes)
+    obtained = course_marks.obtained(inc.used_cols, inc.incidence)
+
+    threshold_scores = inc.max_marks * (threshold_percentage / 100.0)
+    above = obtained >= threshold_scores
+    # row 0 is the whole course, then one row per section
+    students_above_threshold = above.sum(axis=0)[None, :]
+    students = np.array([len(course_marks)])
+    if groups.names:
+        by_section = np.add.reduceat(above[groups.order], groups.starts, axis=0, dtype=np.intp)
+        students_above_threshold = np.vstack([students_above_threshold, by_section])
+        students = np.concatenate([students, groups.sizes])
+
+    levels = get_co_attainment_levels(students_above_threshold / students[:, None],
+                                      thr3_pct, thr2_pct, thr1_pct)
+    levels[:, (inc.cols_per_cell == 0) | (inc.max_marks == 0)] = 0
+
+    for result, row in zip(results, levels.tolist()):
+        for tool, co, cell in inc.cells:
+            result[tool][co] = int(row[cell])
+
+    return results[0], dict(zip(groups.names, results[1:]))
 
-    return co_results
+
+def calculate_tool_co_attainment(df_marks, df_tool_map_meta, tool_type,
+                                 threshold_percentage, thr3_pct, thr2_pct, thr1_pct):
+    return calculate_all_tool_co_attainments(
+        df_marks, df_tool_map_meta, [tool_type],
+        threshold_percentage, thr3_pct, thr2_pct, thr1_pct
+    )[tool_type]
 
 
 def calculate_final_direct_co_attainment_weighted(all_tool_attainments, df_tool_map_meta,
@@ -103,155 +516,292 @@ def calculate_final_direct_co_attainment_weighted(all_tool_attainments, df_tool_
     return final_direct_co
 
 
+# indirect attainment is reported on the 1-3 survey scale; other scales are mapped onto it
+SURVEY_SCALE = (1, 3)
+
+# long-format survey column -> accepted headers (any case)
+LONG_SURVEY_COLUMNS = {
+    'course': ('Course', 'Course_Code', 'Course Code'),
+    'co': ('CO',),
+    'rating': ('Rating',),
+    'weight': ('Weight',),
+    'responses': ('Responses',),
+    'scale_min': ('Scale_Min',),
+    'scale_max': ('Scale_Max',),
+}
+
+
+def survey_columns(columns):
+    """{long-format role: column name} for the LONG_SURVEY_COLUMNS present."""
+    lookup = {}
+    for col in columns:
+        lookup.setdefault(str(col).strip().lower(), col)
+    found = {}
+    for role, names in LONG_SURVEY_COLUMNS.items():
+        col = next((lookup[name.lower()] for name in names if name.lower() in lookup), None)
+        if col is not None:
+            found[role] = col
+    return found
+
+
+def is_long_survey(columns):
+    """One row per answer (CO and Rating columns) rather than one CO*_Rating column per CO."""
+    found = survey_columns(columns)
+    return 'co' in found and 'rating' in found
+
+
+def long_survey(df_survey, scale=None):
+    """Survey rows as (Course, CO, Rating, Weight, Responses), ratings mapped onto SURVEY_SCALE.
+
+    Long-format rows are taken as they are (USN is kept when present); the
+    wide layout is melted into one row per rating. A rating's scale comes
+    from its Scale_Min / Scale_Max cells, else from `scale` (default
+    SURVEY_SCALE, i.e. left unchanged). Weight defaults to 1.
+    """
+    cols = survey_columns(df_survey.columns)
+    if 'co' not in cols or 'rating' not in cols:
+        rating_cols = [col for col in df_survey.columns if 'CO' in col and '_Rating' in col]
+        id_cols = [col for col in df_survey.columns if col not in rating_cols]
+        df_survey = df_survey.melt(id_vars=id_cols, value_vars=rating_cols, var_name='CO', value_name='Rating')
+        df_survey['CO'] = df_survey['CO'].str.replace('_Rating', '')
+        cols = survey_columns(df_survey.columns)
+
+    def column(role, default):
+        return df_survey[cols[role]].astype(float).fillna(default) if role in cols else default
+
+    low, high = scale or SURVEY_SCALE
+    ratings = df_survey[cols['rating']].astype(float)
+    scale_min, scale_max = column('scale_min', low), column('scale_max', high)
+    if not (np.all(scale_min == SURVEY_SCALE[0]) and np.all(scale_max == SURVEY_SCALE[1])):
+        ratings = SURVEY_SCALE[0] + ((ratings - scale_min) * (SURVEY_SCALE[1] - SURVEY_SCALE[0])
+                                     / (scale_max - scale_min))
+
+    frame = pd.DataFrame({
+        'Course': df_survey[cols['course']].fillna('').astype(str).str.strip() if 'course' in cols else '',
+        'CO': df_survey[cols['co']].astype(str),
+        'Rating': ratings,
+        'Weight': column('weight', 1.0),
+        'Responses': column('responses', 1.0),
+    }, index=df_survey.index)
+    if STUDENT_ID_COLUMN in df_survey.columns:
+        frame.insert(1, STUDENT_ID_COLUMN, df_survey[STUDENT_ID_COLUMN])
+    return frame
+
+
+def survey_sums(df_long, by):
+    """Weighted rating sum, total weight and response count per `by` group, blank ratings skipped."""
+    answered = df_long[df_long['Rating'].notna()]
+    sums = pd.DataFrame({
+        'weighted': answered['Rating'] * answered['Weight'],
+        'weight': answered['Weight'],
+        'responses': answered['Responses'],
+    })
+    return sums.groupby([answered[key] for key in by], sort=False).sum()
+
+
 def calculate_indirect_co_attainment(df_survey):
-    # ... (unchanged)
-    indirect_results = {}
+    """{CO: average survey rating (1-3)}.
+
+    Takes the wide sheet (one CO*_Rating column per CO, plain mean of each)
+    or long-format rows (CO, Rating and optionally Weight, Scale_Min/Max;
+    see long_survey), whose ratings are averaged with their weights. The
+    already-aggregated frame aggregate_survey_csv returns is long format too.
+    """
+    if is_long_survey(df_survey.columns):
+        sums = survey_sums(long_survey(df_survey), ['CO'])
+        return {co: round(weighted / weight, 3) if weight else 0
+                for co, weighted, weight in zip(sums.index, sums['weighted'].tolist(), sums['weight'].tolist())}
+
     co_rating_columns = [col for col in df_survey.columns if 'CO' in col and '_Rating' in col]
     if df_survey.empty:
         return {col.replace('_Rating', ''): 0 for col in co_rating_columns}
 
-    for col in co_rating_columns:
-        avg_rating = df_survey[col].mean()
-        co_name = col.replace('_Rating', '')
-        indirect_results[co_name] = round(avg_rating, 3)
+    # every column's mean in one reduction
+    averages = df_survey[co_rating_columns].mean()
+    return {col.replace('_Rating', ''): round(avg_rating, 3)
+            for col, avg_rating in zip(co_rating_columns, averages.to_numpy())}
 
-    return indirect_results
 
+def round_levels(values, ndigits=3):
+    """Rounds arrays of attainment levels the way the per-value code does.
+
+    That code calls round() on np.float64 values, which is np.round (scale
+    by 10**ndigits, round half to even), not Python's exact decimal
+    rounding; the two disagree on a few percent of x.xxx5-ish values.
+    """
+    return np.round(np.asarray(values, dtype=np.float64), ndigits)
 
-def calculate_po_attainment(final_co_attainments, df_mapping):
-    # ... (unchanged)
-    po_results = {}
-    df_mapping_copy = df_mapping.copy()
-    if 'CO' in df_mapping_copy.columns:
-        df_mapping_copy.set_index('CO', inplace=True)
 
-    po_pso_cols = [col for col in df_mapping_copy.columns
+def co_po_mapping_matrix(df_mapping):
+    """Parses a CO-PO mapping sheet once into (row CO names, PO/PSO columns, float levels).
+
+    Cells calculate_po_attainment skips (non-numeric, NaN, zero or negative)
+    come back as 0, so they add nothing to a weighted sum.
+    """
+    df = df_mapping.set_index('CO') if 'CO' in df_mapping.columns else df_mapping
+    po_pso_cols = [col for col in df.columns
                    if col.startswith('PO') or col.startswith('PSO')]
 
-    for po_col in po_pso_cols:
-        numerator = 0
-        denominator = 0
-        for co_name, mapping_level in df_mapping_copy[po_col].items():
-            try:
-                mapping_level = float(mapping_level)
-            except (ValueError, TypeError):
-                continue
-            if pd.notna(mapping_level) and mapping_level > 0 and co_name in final_co_attainments:
-                numerator += final_co_attainments[co_name] * mapping_level
-                denominator += mapping_level
+    def to_level(value):
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            return 0.0
+        return value if value > 0 else 0.0  # NaN > 0 is False as well
+
+    levels = np.zeros((len(df), len(po_pso_cols)))
+    for j, col in enumerate(po_pso_cols):
+        column = df[col]
+        if pd.api.types.is_numeric_dtype(column):
+            values = column.to_numpy(dtype=float, na_value=np.nan)
+            levels[:, j] = np.where(values > 0, values, 0.0)
+        else:
+            # '-', blanks and other text in hand-edited sheets
+            levels[:, j] = [to_level(value) for value in column.tolist()]
+    return list(df.index), po_pso_cols, levels
+
+
+def po_weighted_sums(final_co, co_names, mapping, present=None):
+    """Numerator and denominator of the PO attainment for many stacked rows.
+
+    final_co is (rows, len(co_names)); `present` (same shape, default all
+    True) marks which COs each row actually has. mapping is the
+    co_po_mapping_matrix tuple; its CO names are looked up in co_names, so
+    courses with different mappings can be stacked by keying COs as
+    (course, CO) and concatenating their mappings. Returns two (rows, POs)
+    arrays: sum of CO level x mapping level, and sum of mapping levels.
+    """
+    mapping_cos, _, levels = mapping
+    final_co = np.asarray(final_co, dtype=float)
+    if present is None:
+        present = np.ones(final_co.shape, dtype=bool)
+    co_index = {co: i for i, co in enumerate(co_names)}
+
+    numerator = np.zeros((final_co.shape[0], levels.shape[1]))
+    denominator = np.zeros_like(numerator)
+    # one mapping row at a time, in sheet order, so every sum is added up in
+    # exactly the order the per-cell loop used and rounds the same way
+    for row, co in enumerate(mapping_cos):
+        i = co_index.get(co)
+        if i is None:
+            continue
+        rows_with_co = present[:, i:i + 1]
+        # only where the CO maps to the PO, so a CO without a level (NaN)
+        # leaves the POs it does not map to alone, as the loop skipped it
+        numerator += np.where(rows_with_co & (levels[row] > 0), final_co[:, i:i + 1] * levels[row], 0.0)
+        denominator += np.where(rows_with_co, levels[row], 0.0)
+    return numerator, denominator
+
+
+def po_levels_from_sums(numerator, denominator):
+    """Rounded numerator / denominator, 0 where nothing maps to the PO."""
+    has_mapping = denominator > 0
+    po = round_levels(numerator / np.where(has_mapping, denominator, 1.0))
+    return np.where(has_mapping, po, 0.0), has_mapping
+
+
+def po_attainment_matrix(final_co, co_names, mapping, present=None):
+    """PO/PSO attainment for many stacked courses or cohorts at once (see po_weighted_sums).
+
+    Returns (levels, has_mapping), both (rows, POs): levels use the same
+    arithmetic and rounding as calculate_po_attainment and are 0 where a
+    row maps nothing to that PO.
+    """
+    return po_levels_from_sums(*po_weighted_sums(final_co, co_names, mapping, present))
 
-        po_results[po_col] = round(numerator / denominator, 3) if denominator > 0 else 0
 
-    return po_results
+def course_po_weights(final_co_attainments, df_mapping):
+    """{PO/PSO: (weighted CO sum, mapping weight)} for one course, for program rollups."""
+    mapping = co_po_mapping_matrix(df_mapping)
+    co_names = list(final_co_attainments)
+    numerator, denominator = po_weighted_sums(
+        [[final_co_attainments[co] for co in co_names]], co_names, mapping)
+    return {po_col: (num, den)
+            for po_col, num, den in zip(mapping[1], numerator[0].tolist(), denominator[0].tolist())}
+
+
+def calculate_po_attainment(final_co_attainments, df_mapping):
+    """{PO/PSO: level}: mapping-level weighted average of the final CO levels."""
+    mapping = co_po_mapping_matrix(df_mapping)
+    co_names = list(final_co_attainments)
+    po, has_mapping = po_attainment_matrix(
+        [[final_co_attainments[co] for co in co_names]], co_names, mapping)
+    # np.float64 levels, as the per-PO loop returned them
+    return {po_col: level if mapped else 0
+            for po_col, level, mapped in zip(mapping[1], po[0], has_mapping[0].tolist())}
+
+
+# --- Report writers ---
+
+def pick_report_writer():
+    """REPORT_WRITER when set, else xlsxwriter when installed, otherwise openpyxl."""
+    name = running_app().config['REPORT_WRITER']
+    if name:
+        if name not in REPORT_WRITERS:
+            raise ValueError(f"Unknown REPORT_WRITER {name!r}; use one of {', '.join(REPORT_WRITERS)}.")
+        return REPORT_WRITERS[name]
+    if importlib.util.find_spec('xlsxwriter') is not None:
+        return XlsxWriterReportWriter
+    return OpenpyxlReportWriter
+
+
+def report_writer(output):
+    """A writer (see REPORT_WRITERS) for a new workbook in `output`; use it as a context manager."""
+    return pick_report_writer()(output)
 
 
 # --- Helper: Adds data and a chart to a sheet (Final version of helpers) ---
 
 def setup_results_sheet(writer, df, sheet_name, cn, dn, cc):
-    # ... (unchanged)
+    """Metadata header, the table from row 5 (A5), column widths and a bar chart of the levels."""
     col_count = len(df.columns)
     data_row_count = len(df)
-    
-    # 1. Write the DataFrame starting at row 5 (A5)
-    df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=4) 
-    
-    # 2. Write metadata header (writes to rows 1 and 2)
+
+    # 1. Write metadata header (rows 1 and 2), then the DataFrame starting at row 5 (A5)
     write_metadata_to_sheet(writer, sheet_name, cn, dn, cc, col_count)
-    
-    worksheet = writer.sheets[sheet_name]
-    start_row_for_data = 5 # Excel Row 5 is header, Data starts at Row 6
-
-    # --- 3. Auto-Size Columns ---
-    from openpyxl.utils import get_column_letter 
-    for col in range(1, col_count + 1):
-        max_length = 0
-        column = get_column_letter(col)
-        
-        max_length = max(len(str(worksheet.cell(row=start_row_for_data, column=col).value)), max_length)
-        for row in range(start_row_for_data + 1, start_row_for_data + data_row_count + 1):
-            length = len(str(worksheet.cell(row=row, column=col).value))
-            max_length = max(max_length, length)
-
-        worksheet.column_dimensions[column].width = max(max_length * 1.2, 10)
-    
-    worksheet.column_dimensions['A'].width = max(worksheet.column_dimensions['A'].width, 15)
-    
-    # --- 4. Add Chart (The FINAL Working Logic) ---
+    writer.write_table(sheet_name, df, startrow=4)
+
+    # 2. Auto-Size Columns
+    widths = column_widths(df)
+    if widths:
+        widths[0] = max(widths[0], 15)
+    writer.set_column_widths(sheet_name, widths)
+
+    # 3. Add Chart
     if data_row_count == 0:
         return
+    chart_anchor = cell_name(5, col_count + 2)  # two columns right of the table
+    writer.add_bar_chart(sheet_name, f"{sheet_name.replace('_', ' ')} Attainment Levels",
+                         header_row=4, rows=data_row_count, anchor=chart_anchor)
+
+
+def column_widths(df, index=False, scale=1.2, min_width=10):
+    """Excel widths for df as written by to_excel: longest str() per column (header included).
+
+    Works on the DataFrame instead of worksheet cells, and formats each distinct
+    value only once, so repetitive columns (marks, levels) stay cheap.
+    """
+    frame = df.reset_index() if index else df
+    widths = []
+    for pos in range(frame.shape[1]):
+        values = pd.unique(frame.iloc[:, pos].to_numpy())
+        # empty cells read back as None, which is what the old cell-by-cell loop measured
+        lengths = [len(str(None if pd.isna(v) else v)) for v in values] if len(values) else [0]
+        max_length = max(len(str(frame.columns[pos])), max(lengths))
+        widths.append(max(max_length * scale, min_width))
+    return widths
 
-    chart = BarChart()
-    chart.type = "col"
-    chart.style = 10
-    chart.title = f"{sheet_name.replace('_', ' ')} Attainment Levels"
-    chart.y_axis.title = "Attainment Level (0-3 Scale)"
-    chart.y_axis.scaling.max = 3.0
-    chart.shape = 4
-    
-    chart_anchor = f'{chr(ord("A") + col_count + 2)}5' 
-
-    # 1. Data Range: Attainment Level column (B5 to B[end])
-    data_range = Reference(worksheet, min_col=2, min_row=start_row_for_data, 
-                           max_col=2, max_row=start_row_for_data + data_row_count)
-    
-    # 2. Categories Range: Course Outcome column (A6 to A[end])
-    cats_col_ref = Reference(worksheet, min_col=1, min_row=start_row_for_data + 1, 
-                             max_col=1, max_row=start_row_for_data + data_row_count)
-    
-    # Add data: titles_from_data=True uses row 5 (B5) as the series title.
-    chart.add_data(data_range, titles_from_data=True) 
-    
-    # Set categories (This provides the CO1, CO2 labels on the X-axis)
-    chart.set_categories(cats_col_ref)
-    
-    # --- CRITICAL FINAL TWEAKS TO ENABLE VISIBILITY ---
-    
-    # 1. Remove the Redundant Legend
-    chart.legend = None
-
-    # 2. Enable Data Labels (THE FINAL FIX)
-    if chart.series:
-        # The series titles (the header 'Attainment Level') is redundant, remove it
-        chart.series[0].title = None
-        
-        # Add the Data Labels to the primary series
-        chart.series[0].dLbls = DataLabelList() 
-        chart.series[0].dLbls.showVal = True    # Show the Value (2.4, 0.4, 0.6)
-        chart.series[0].dLbls.showCat = True    # Show the Category Name (CO1, CO2, CO3)
-        chart.series[0].dLbls.showSerName = False # Hide Series Name
-        
-        # Fix for X-axis labels (already correct, just for robustness)
-        if chart.x_axis:
-            chart.x_axis.delete = False
-            chart.x_axis.tickLblPos = 'low' 
-    
-    # Position the chart
-    worksheet.add_chart(chart, chart_anchor) 
+
+def autosize_columns(writer, sheet_name, df, index=False, first_col=0):
+    """Applies column_widths(df) to the columns of sheet_name holding df."""
+    writer.set_column_widths(sheet_name, column_widths(df, index=index), first_col)
 
 
 def write_metadata_to_sheet(writer, sheet_name, cn, dn, cc, col_count):
     """Writes metadata headers to the sheet, with the left-aligned look from the screenshot."""
-    worksheet = writer.sheets[sheet_name]
-    
-    # Define a left-aligned style for the header text
-    left_align = Alignment(horizontal='left', vertical='center', wrap_text=True) 
-    header_font = Font(bold=True, size=12)
-    
-    # 1. College Name and Department (Merged on A1:B1 for two columns)
-    worksheet.merge_cells('A1:B1')
-    worksheet['A1'].value = f'{cn} - {dn}'
-    worksheet['A1'].alignment = left_align
-    worksheet['A1'].font = header_font
-    
-    # 2. Course Code (Merged on A2:B2)
-    worksheet.merge_cells('A2:B2')
-    worksheet['A2'].value = f'Course Code: {cc}'
-    worksheet['A2'].alignment = left_align
-    worksheet['A2'].font = header_font
-    
+    writer.write_metadata(sheet_name, cn, dn, cc)
     # Data is expected to start at row 5 (A5), so return 5
-    return 5 
-
+    return 5
 
 
 def run_calculation_pipeline(
@@ -260,28 +810,109 @@ def run_calculation_pipeline(
     thr3_pct=70, thr2_pct=55, thr1_pct=40,
     cie_weight=60, see_weight=40,
     direct_weight=0.8, indirect_weight=0.2,
-    # --- METADATA ARGUMENTS ---
-    cn='College Name', dn='Department Name', cc='Course Code'
 ):
-    
-    # ensure types
-    df_tool_map_meta['CO'] = df_tool_map_meta['CO'].astype(str)
+    """(direct CO, indirect CO, final CO, final PO) DataFrames for the whole course.
+
+    The DataFrames are built fresh on every call, so callers may change them.
+    """
+    return run_section_pipeline(
+        df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, threshold_percentage,
+        thr3_pct, thr2_pct, thr1_pct, cie_weight, see_weight, direct_weight, indirect_weight,
+    ).combined.frames()
+
+
+class AttainmentTables(namedtuple('AttainmentTables', ['direct_co', 'indirect_co', 'final_co', 'final_po'])):
+    """One pipeline result: four read-only {outcome: level} mappings.
+
+    Nothing in it can be changed after the fact, so the same result can be
+    handed to any number of threads; frames() builds DataFrames from it.
+    """
+
+    __slots__ = ()
+
+    HEADERS = {
+        'direct_co': ['Course Outcome', 'Attainment Level'],
+        'indirect_co': ['Course Outcome', 'Attainment Level'],
+        'final_co': ['Course Outcome', 'Attainment Level'],
+        'final_po': ['Program/Skill Outcome', 'Attainment Level'],
+    }
+
+    @classmethod
+    def from_levels(cls, *tables):
+        """From four {outcome: level} dicts; each table's levels get one type, as in a DataFrame column."""
+        return cls(*(MappingProxyType(dict(zip(levels, pd.Series(list(levels.values())).tolist())))
+                     for levels in tables))
+
+    def frame(self, table, columns=None):
+        """A new two-column DataFrame of one table (HEADERS unless `columns` are given)."""
+        return pd.DataFrame(list(getattr(self, table).items()), columns=columns or self.HEADERS[table])
+
+    def frames(self):
+        """(direct CO, indirect CO, final CO, final PO) as new DataFrames."""
+        return tuple(self.frame(table) for table in self._fields)
+
+
+CourseAttainment = namedtuple('CourseAttainment', [
+    'combined',  # AttainmentTables for the whole course
+    'sections',  # read-only {section: AttainmentTables}, empty without a Section column
+])
+
+
+def run_section_pipeline(
+    df_marks, df_tool_map_meta, df_co_po_mapping, df_survey,
+    threshold_percentage,
+    thr3_pct=70, thr2_pct=55, thr1_pct=40,
+    cie_weight=60, see_weight=40,
+    direct_weight=0.8, indirect_weight=0.2,
+):
+    """CourseAttainment: the whole-course AttainmentTables and one per section.
+
+    The marks go through the tool/CO pass once for the course and every
+    section together (calculate_section_tool_co_attainments). The section
+    mapping is empty when the marks sheet has no Section column.
+
+    None of the inputs is modified and no module state is touched, so any
+    number of threads can run this at once, each on its own course.
+    """
+    # ensure types (on a new frame; the caller's, possibly a cached one, is left as it is)
+    df_tool_map_meta = df_tool_map_meta.assign(CO=df_tool_map_meta['CO'].astype(str))
     tool_prefixes = df_tool_map_meta['Tool_Question'].str.split('_', expand=True)[0].unique()
 
-    # per-tool attainment
-    all_tool_attainments = {}
-    for tool in tool_prefixes:
-        tool_attainments = calculate_tool_co_attainment(
-            df_marks, df_tool_map_meta, tool,
+    # per-tool attainment (all tools and COs, course and sections, in one matrix pass)
+    with stage_span('tool_co_attainment', students=len(df_marks), questions=len(df_tool_map_meta),
+                    cos=df_tool_map_meta['CO'].nunique()):
+        all_tool_attainments, section_tool_attainments = calculate_section_tool_co_attainments(
+            df_marks, df_tool_map_meta, tool_prefixes,
             threshold_percentage, thr3_pct, thr2_pct, thr1_pct
         )
-        all_tool_attainments[tool] = tool_attainments
 
+    weights = (cie_weight, see_weight, direct_weight, indirect_weight)
+    combined = attainment_tables(all_tool_attainments, df_tool_map_meta, df_co_po_mapping, df_survey,
+                                 *weights)
+
+    sections = {}
+    if section_tool_attainments:
+        with stage_span('sections', sections=len(section_tool_attainments)):
+            surveys = section_surveys(df_survey, df_marks)
+            for section, tool_attainments in section_tool_attainments.items():
+                # sections without survey responses of their own use the course's
+                sections[section] = attainment_tables(
+                    tool_attainments, df_tool_map_meta, df_co_po_mapping,
+                    surveys.get(section, df_survey), *weights, span=no_span)
+
+    return CourseAttainment(combined, MappingProxyType(sections))
+
+
+def attainment_tables(all_tool_attainments, df_tool_map_meta, df_co_po_mapping, df_survey,
+                      cie_weight, see_weight, direct_weight, indirect_weight, span=stage_span):
+    """Direct, indirect, final CO and final PO AttainmentTables from per-tool CO levels."""
     # direct and indirect
-    final_direct_co = calculate_final_direct_co_attainment_weighted(
-        all_tool_attainments, df_tool_map_meta, cie_weight, see_weight
-    )
-    indirect_co = calculate_indirect_co_attainment(df_survey)
+    with span('direct_co'):
+        final_direct_co = calculate_final_direct_co_attainment_weighted(
+            all_tool_attainments, df_tool_map_meta, cie_weight, see_weight
+        )
+    with span('indirect_co', students=len(df_survey)):
+        indirect_co = calculate_indirect_co_attainment(df_survey)
 
     # normalize direct/indirect weights
     total_di = float(direct_weight + indirect_weight) if (direct_weight + indirect_weight) != 0 else 1.0
@@ -296,386 +927,2290 @@ def run_calculation_pipeline(
         final_val = (dw * direct_val) + (iw * indirect_val)
         final_co[co] = round(final_val, 3)
 
-    final_po = calculate_po_attainment(final_co, df_co_po_mapping)
+    with span('po_attainment', cos=len(df_co_po_mapping)):
+        final_po = calculate_po_attainment(final_co, df_co_po_mapping)
+
+    # The Excel report is built separately (build_results_workbook), only when it is downloaded
+    return AttainmentTables.from_levels(final_direct_co, indirect_co, final_co, final_po)
+
+
+def section_surveys(df_survey, df_marks):
+    """{section: survey rows} from the survey's own Section column, or by USN via the marks sheet."""
+    column = section_column(df_survey.columns)
+    if column is not None:
+        labels = [section_label(value) for value in df_survey[column].tolist()]
+    else:
+        course_marks = as_course_marks(df_marks)
+        if (STUDENT_ID_COLUMN not in df_survey.columns or course_marks.usns is None
+                or course_marks.sections is None):
+            return {}
+        section_of = dict(zip(course_marks.usns.tolist(), course_marks.sections.tolist()))
+        labels = [section_of.get(usn) for usn in df_survey[STUDENT_ID_COLUMN].tolist()]
+    groups = section_groups(labels)
+    return {name: df_survey.iloc[groups.order[start:start + size]]
+            for name, start, size in zip(groups.names, groups.starts.tolist(), groups.sizes.tolist())}
+
+
+# form field -> (run_calculation_pipeline argument, default)
+PIPELINE_PARAM_FIELDS = {
+    'threshold': ('threshold_percentage', 60),
+    'level3_pct': ('thr3_pct', 70),
+    'level2_pct': ('thr2_pct', 55),
+    'level1_pct': ('thr1_pct', 40),
+    'cie_weight': ('cie_weight', 60),
+    'see_weight': ('see_weight', 40),
+    'direct_weight': ('direct_weight', 0.8),
+    'indirect_weight': ('indirect_weight', 0.2),
+}
+
+
+def read_pipeline_params(form, defaults=None):
+    """Reads the threshold/weight inputs shared by /calculate, /calculate_batch and the what-if API.
+
+    `defaults` (pipeline argument -> value) replaces the built-in defaults for missing fields.
+    """
+    return {
+        name: float(form.get(field, default if defaults is None else defaults[name]))
+        for field, (name, default) in PIPELINE_PARAM_FIELDS.items()
+    }
+
+
+# --- Upload ingestion ---
+
+class MappedFile(mmap.mmap):
+    """A read-only memory map that zipfile and pandas accept as a file (mmap has no seekable() before 3.13)."""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+
+class SpooledUpload:
+    """One uploaded file, written chunk by chunk by Werkzeug's form parser (see UploadRequest).
+
+    The size is checked as the chunks arrive (413 as soon as the file passes
+    max_bytes) and they are hashed on the way, so the parse cache never reads
+    the file again to key it. The first spool_bytes stay in memory; a larger
+    file moves to an anonymous temp file, which open() memory-maps for the
+    parsers instead of copying it into the worker's heap.
+    """
+
+    def __init__(self, filename=None, max_bytes=None, spool_bytes=1024 * 1024, spool_dir=None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir
+        self.size = 0
+        self.head = b''  # the first bytes, for is_csv_source
+        self._sha256 = hashlib.sha256()
+        self._file = BytesIO()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"{self.filename or 'An uploaded file'} is larger than the "
+                                        f"{self.max_bytes // 2 ** 20} MB allowed per file.")
+        self._sha256.update(data)
+        if len(self.head) < 8:
+            self.head += data[:8 - len(self.head)]
+        if isinstance(self._file, BytesIO) and self.size > self.spool_bytes:
+            spooled = tempfile.TemporaryFile(dir=self.spool_dir)
+            spooled.write(self._file.getbuffer())
+            self._file = spooled
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/close... for FileStorage and anything reading the upload as a file
+        return getattr(self._file, name)
+
+    def __len__(self):
+        return self.size
+
+    def __bytes__(self):
+        with self.open() as view:
+            return view.read()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def open(self):
+        """A read-only file over the content, for a with block: the in-memory buffer or a MappedFile."""
+        if isinstance(self._file, BytesIO):
+            return BytesIO(self._file.getvalue())
+        self._file.flush()
+        return MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class UploadRequest(Request):
+    """Flask's request, with uploads streamed into SpooledUpload under the UPLOAD_* limits."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        max_bytes = config['UPLOAD_MAX_FILE_BYTES']
+        if filename and filename.lower().endswith('.zip'):
+            # a batch ZIP carries every course's workbooks at once
+            max_bytes = config['UPLOAD_MAX_ARCHIVE_BYTES']
+        return SpooledUpload(filename, max_bytes, config['UPLOAD_SPOOL_BYTES'], config['UPLOAD_SPOOL_DIR'])
+
+
+def upload_source(file):
+    """What the parsers take for an uploaded FileStorage: its SpooledUpload, else its bytes."""
+    return file.stream if isinstance(file.stream, SpooledUpload) else file.read()
+
+
+def is_raw_source(src):
+    """True for file content (bytes or a SpooledUpload) rather than a path, URL or file object."""
+    return isinstance(src, (bytes, SpooledUpload))
+
+
+def source_file(src):
+    """A file object over src for a with block: BytesIO for bytes, SpooledUpload.open(), else src itself."""
+    if isinstance(src, bytes):
+        return BytesIO(src)
+    if isinstance(src, SpooledUpload):
+        return src.open()
+    return nullcontext(src)
+
+
+@bp.before_app_request
+def read_uploads():
+    """Reads multipart bodies before the view, so an upload over the limits gets a 413 page.
+
+    (A view's own error handling would otherwise report it as a failed calculation.)
+    """
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge(f"The upload is larger than the {limit // 2 ** 20} MB allowed per request.")
+    if request.mimetype == 'multipart/form-data':
+        request.files  # parses the body into SpooledUploads
+
+
+@bp.app_errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    message = e.description
+    if message == RequestEntityTooLarge.description:  # Werkzeug's own, e.g. for a chunked body
+        message = "The upload is larger than the server accepts. Please upload smaller files."
+    if request.path.startswith('/api/') or wants_json():
+        return jsonify(error=message), 413
+    return render_template('error.html', error=message), 413
+
+
+# --- Parse cache ---
+
+class ParseCache:
+    """Parsed workbooks keyed by the SHA-256 of the file bytes.
+
+    An in-memory LRU (bounded by DataFrame memory) sits on top of an optional
+    on-disk Parquet directory that survives restarts and is shared by every
+    worker pointing at it. Both tiers evict least recently used entries first.
+
+    Keys are '<file SHA-256>-<variant>' (see parse_cached), the variant naming
+    what was extracted from the file:
+        student-sections  marks (Section column included) and tool map sheets
+                          of a student workbook; the name changed when the
+                          Section column was first kept, so older entries
+                          without it are never read
+        first             the first sheet of a CO-PO mapping or survey workbook
+        survey-csv        a survey CSV export, aggregated
+    and '<SHA-256 of three files' digests>-validated' for an entry with no
+    sheets that marks those files as having passed validation
+    (validation_cache_key).
+    """
+
+    def __init__(self, max_bytes, cache_dir=None, max_dir_bytes=0):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_dir_bytes = max_dir_bytes
+        self._entries = OrderedDict()  # key -> (sheets, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+        sheets = self._load_from_disk(key)
+        if sheets is not None:
+            self._remember(key, sheets)
+        return sheets
+
+    def put(self, key, sheets):
+        self._remember(key, sheets)
+        self._save_to_disk(key, sheets)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remember(self, key, sheets):
+        size = sum(int(df.memory_usage(index=True, deep=True).sum()) for df in sheets.values())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (sheets, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    # -- Parquet tier: one folder per key holding <n>.parquet plus the sheet names --
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'sheets.json')) as f:
+                names = json.load(f)
+            sheets = {name: pd.read_parquet(os.path.join(entry_dir, f'{i}.parquet'))
+                      for i, name in enumerate(names)}
+            os.utime(entry_dir)
+        except (OSError, ValueError, ImportError):
+            return None
+        return sheets
+
+    def _save_to_disk(self, key, sheets):
+        if not self.cache_dir:
+            return
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f'{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for i, df in enumerate(sheets.values()):
+                df.to_parquet(os.path.join(tmp_dir, f'{i}.parquet'))
+            with open(os.path.join(tmp_dir, 'sheets.json'), 'w') as f:
+                json.dump(list(sheets), f)
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            # Parquet is best effort (pyarrow missing, mixed-type columns, non-string headers...)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_dir_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+
+def get_parse_cache():
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            config = running_app().config
+            _parse_cache = ParseCache(config['PARSE_CACHE_MAX_BYTES'], config['PARSE_CACHE_DIR'],
+                                      config['PARSE_CACHE_DIR_MAX_BYTES'])
+    return _parse_cache
+
+
+def source_digest(data):
+    """SHA-256 hex of bytes or a SpooledUpload (whose hash was taken as it was uploaded)."""
+    return data.sha256 if isinstance(data, SpooledUpload) else hashlib.sha256(data).hexdigest()
+
+
+def parse_cached(data, variant, parse):
+    """Runs parse(file over data) -> {sheet: DataFrame} through the parse cache.
+
+    `data` is bytes or a SpooledUpload, whose hash was taken as it was
+    uploaded. `variant` names what `parse` extracts, so different
+    projections of the same file never collide.
+    """
+    key = f"{source_digest(data)}-{variant}"
+    cache = get_parse_cache()
+    sheets = cache.get(key)
+    if sheets is None:
+        with source_file(data) as f:
+            sheets = parse(f)
+        cache.put(key, sheets)
+    # shallow copies so callers can add/replace columns without touching the cached frames
+    return {name: df.copy(deep=False) for name, df in sheets.items()}
+
+
+# --- URL ingestion ---
+
+class UrlFetcher:
+    """Downloads workbook links over one pooled HTTP session.
+
+    Every download has connect/read timeouts and a size cap. Responses that
+    carry an ETag or Last-Modified header are kept, and the next request for
+    the same URL is a conditional GET, so unchanged files come back as a 304.
+    """
+
+    def __init__(self, timeout, max_bytes, cache_max_bytes):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._cache = OrderedDict()  # url -> (validator headers, data)
+        self._cache_size = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        if urlparse(url).scheme not in ('http', 'https'):
+            raise ValueError(f"Only http(s) links are supported: {url}")
+        with self._lock:
+            cached = self._cache.get(url)
+        headers = {}
+        if cached:
+            validators = cached[0]
+            if 'ETag' in validators:
+                headers['If-None-Match'] = validators['ETag']
+            if 'Last-Modified' in validators:
+                headers['If-Modified-Since'] = validators['Last-Modified']
+
+        with self._session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304:
+                if not cached:
+                    # the request was not conditional, so there is no copy the 304 could refer to
+                    raise ValueError(f"{url} answered 304 Not Modified to a plain download; "
+                                     f"the file could not be fetched.")
+                with self._lock:
+                    if url in self._cache:
+                        self._cache.move_to_end(url)
+                return cached[1]
+            response.raise_for_status()
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise ValueError(self._too_large(url))
+            chunks, size = [], 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(self._too_large(url))
+                chunks.append(chunk)
+            data = b''.join(chunks)
+            validators = {k: response.headers[k] for k in ('ETag', 'Last-Modified')
+                          if k in response.headers}
+
+        if validators:
+            self._remember(url, validators, data)
+        return data
+
+    def fetch_all(self, urls):
+        """Fetches several URLs in parallel, returning their bytes in the same order."""
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            return list(pool.map(self.fetch, urls))
+
+    def _too_large(self, url):
+        return f"{url} is larger than the {self.max_bytes // (1024 * 1024)} MB download limit."
+
+    def _remember(self, url, validators, data):
+        if len(data) > self.cache_max_bytes:
+            return
+        with self._lock:
+            if url in self._cache:
+                self._cache_size -= len(self._cache.pop(url)[1])
+            self._cache[url] = (validators, data)
+            self._cache_size += len(data)
+            while self._cache_size > self.cache_max_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+
+_url_fetcher = None
+_url_fetcher_lock = threading.Lock()
+
+
+def get_url_fetcher():
+    global _url_fetcher
+    with _url_fetcher_lock:
+        if _url_fetcher is None:
+            config = running_app().config
+            _url_fetcher = UrlFetcher(config['URL_FETCH_TIMEOUT'], config['URL_FETCH_MAX_BYTES'],
+                                      config['URL_CACHE_MAX_BYTES'])
+    return _url_fetcher
+
+
+# --- Workbook loading ---
+
+MARKS_SHEET = '1_Student_Marks'
+TOOL_MAP_SHEET = '2_Tool_CO_Mapping'
+STUDENT_ID_COLUMN = 'USN'
+# optional student grouping column; 'Cohort' is accepted too, in any case
+SECTION_COLUMN = 'Section'
+SECTION_COLUMN_NAMES = ('section', 'cohort')
+
+
+def pick_excel_engine():
+    """python-calamine (Rust) when installed and pandas knows it (>= 2.2), otherwise openpyxl.
+
+    pandas already opens openpyxl workbooks in read-only (streaming) mode.
+    """
+    pandas_version = tuple(int(part) for part in pd.__version__.split('.')[:2])
+    if pandas_version >= (2, 2) and importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return 'openpyxl'
+
+
+EXCEL_ENGINE = None  # picked on first read, pick_excel_engine() needs pandas
+
+
+def excel_engine():
+    global EXCEL_ENGINE
+    if EXCEL_ENGINE is None:
+        EXCEL_ENGINE = pick_excel_engine()
+    return EXCEL_ENGINE
+
+
+def is_section_column(col):
+    return str(col).strip().lower() in SECTION_COLUMN_NAMES
+
+
+def section_column(columns):
+    """The first Section/Cohort column name, or None."""
+    return next((col for col in columns if is_section_column(col)), None)
+
+
+def section_label(value):
+    """A section cell as text: None when blank, whole numbers without a trailing '.0'."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def is_marks_column(col):
+    return col == STUDENT_ID_COLUMN or is_section_column(col) or str(col).endswith('_Marks')
+
+
+class CourseMarks:
+    """One course's marks as a single compact matrix instead of a wide DataFrame.
+
+    `marks` is (students, questions): uint8 when every mark is a whole number
+    from 0 to 255, float32 when every mark is exact in it (halves, quarters),
+    float64 otherwise (see compact_marks). Blank (absent) marks are stored as 0,
+    which is what every calculation counts them as. `columns` holds the
+    *_Marks column names, `question_index` maps each to its column offset and
+    `usns` holds the interned student IDs (None when the sheet has no USN) and
+    `sections` each student's section label (None when there is no Section
+    column; a None entry for a student with a blank section).
+
+    `marks` is read-only, so one CourseMarks can be shared between threads.
+    """
+
+    __slots__ = ('marks', 'columns', 'question_index', 'usns', 'sections')
+
+    def __init__(self, marks, columns, usns=None, sections=None):
+        self.marks = marks.view()
+        self.marks.flags.writeable = False
+        self.columns = pd.Index(columns)
+        self.question_index = {col: i for i, col in enumerate(self.columns)}
+        self.usns = usns
+        self.sections = sections
+
+    @classmethod
+    def from_frame(cls, df_marks):
+        """Wraps a marks DataFrame; a frame made by to_frame() is wrapped without copying."""
+        mark_cols = [col for col in df_marks.columns if str(col).endswith('_Marks')]
+        values = df_marks[mark_cols].to_numpy()
+        if values.dtype != np.uint8 and not (
+                values.dtype == np.float32 and not np.isnan(values.sum(dtype=np.float64))):
+            values = compact_marks(values)
+
+        usns = None
+        if STUDENT_ID_COLUMN in df_marks.columns:
+            usns = np.array([sys.intern(usn) if isinstance(usn, str) else usn
+                             for usn in df_marks[STUDENT_ID_COLUMN].tolist()], dtype=object)
+
+        sections = None
+        column = section_column(df_marks.columns)
+        if column is not None:
+            labels = [section_label(value) for value in df_marks[column].tolist()]
+            sections = np.array([sys.intern(label) if label else None for label in labels], dtype=object)
+        return cls(values, mark_cols, usns, sections)
+
+    def to_frame(self):
+        """USN + Section + *_Marks DataFrame sharing this object's matrix (what the parse cache stores)."""
+        df = pd.DataFrame(self.marks, columns=self.columns, copy=False)
+        if self.sections is not None:
+            df.insert(0, SECTION_COLUMN, self.sections)
+        if self.usns is not None:
+            df.insert(0, STUDENT_ID_COLUMN, self.usns)
+        return df
+
+    def __len__(self):
+        return self.marks.shape[0]
+
+    @property
+    def empty(self):
+        return self.marks.size == 0
+
+    def obtained(self, columns, weights, rows=slice(None), block_rows=2048):
+        """marks[rows][:, columns] @ weights as float64.
+
+        Works through block_rows students at a time, so only one block is
+        ever widened to float64, never the whole matrix.
+        """
+        positions = np.array([self.question_index[col] for col in columns], dtype=np.intp)
+        all_columns = np.array_equal(positions, np.arange(self.marks.shape[1]))
+        marks = self.marks[rows]
+        out = np.empty((marks.shape[0], weights.shape[1]))
+        # every block is widened into the same buffer and multiplied straight into `out`
+        widened = np.empty((min(block_rows, marks.shape[0]), len(positions)))
+        for start in range(0, marks.shape[0], block_rows):
+            block = marks[start:start + block_rows]
+            if not all_columns:
+                block = block[:, positions]
+            buffer = widened[:len(block)]
+            np.copyto(buffer, block)
+            np.matmul(buffer, weights, out=out[start:start + block_rows])
+        return out
+
+
+def compact_marks(values):
+    """Blank -> 0, then uint8 if every mark fits, float32 if every mark survives it exactly, else float64.
+
+    Marks like 5.2 are not exact in float32 and would move sums across a
+    threshold (5.2 + 0.4 against 40% of 14), so those stay float64.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    if not values.size or (values.min() >= 0 and values.max() <= 255
+                           and np.array_equal(values, np.round(values))):
+        return values.astype(np.uint8)
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), values):
+        return narrow
+    return values
+
+
+def as_course_marks(df_marks):
+    """CourseMarks for either a CourseMarks or a plain marks DataFrame."""
+    return df_marks if isinstance(df_marks, CourseMarks) else CourseMarks.from_frame(df_marks)
+
+
+def parse_student_workbook(src, source_label='Student Data'):
+    """Reads only the marks and tool-map sheets, keeping just USN, Section and the *_Marks columns.
+
+    The marks come back as one block (see CourseMarks.to_frame), narrowed
+    only where every mark stays exact (compact_marks).
+    """
+    with pd.ExcelFile(src, engine=excel_engine()) as xls:
+        if MARKS_SHEET not in xls.sheet_names or TOOL_MAP_SHEET not in xls.sheet_names:
+            raise ValueError(f"{source_label} must have sheets '{MARKS_SHEET}' and '{TOOL_MAP_SHEET}'.")
+        df_marks = xls.parse(MARKS_SHEET, usecols=is_marks_column)
+        df_tool_map_meta = xls.parse(TOOL_MAP_SHEET)
+    return {MARKS_SHEET: CourseMarks.from_frame(df_marks).to_frame(), TOOL_MAP_SHEET: df_tool_map_meta}
+
+
+def read_student_data(src, source_label='Student Data'):
+    """(CourseMarks, tool map DataFrame) for a student data workbook."""
+    if is_raw_source(src):
+        sheets = parse_cached(src, 'student-sections', lambda f: parse_student_workbook(f, source_label))
+    else:
+        sheets = parse_student_workbook(src, source_label)
+    return CourseMarks.from_frame(sheets[MARKS_SHEET]), sheets[TOOL_MAP_SHEET]
+
+
+def read_first_sheet(src):
+    if is_raw_source(src):
+        return parse_cached(src, 'first', lambda f: {0: pd.read_excel(f, engine=excel_engine())})[0]
+    return pd.read_excel(src, engine=excel_engine())
+
+
+def is_csv_source(src):
+    """True for CSV content or a .csv path (workbooks start with a ZIP or OLE signature)."""
+    if isinstance(src, SpooledUpload):
+        src = src.head
+    if isinstance(src, bytes):
+        return not src.startswith((b'PK\x03\x04', b'\xd0\xcf\x11\xe0'))
+    return isinstance(src, (str, os.PathLike)) and os.fspath(src).lower().endswith('.csv')
+
+
+def aggregate_survey_csv(src, scale=None, chunk_rows=None):
+    """Weighted mean rating per (Course, CO) of a survey CSV, read chunk_rows rows at a time.
+
+    Takes long-format exports (Course, CO, Rating and optionally USN, Weight,
+    Scale_Min, Scale_Max: one row per answer, many courses per file) as well
+    as the wide survey layout. Only the running per-(course, CO) sums are
+    kept between chunks, so memory does not grow with the number of
+    responses. Returns long-format rows (Course, CO, Rating, Weight,
+    Responses) that calculate_indirect_co_attainment reads like raw answers.
+    """
+    chunk_rows = chunk_rows or running_app().config['SURVEY_CSV_CHUNK_ROWS']
+    totals = None
+    with source_file(src) as f, pd.read_csv(f, chunksize=chunk_rows, skipinitialspace=True) as chunks:
+        for chunk in chunks:
+            sums = survey_sums(long_survey(chunk, scale), ['Course', 'CO'])
+            totals = sums if totals is None else totals.add(sums, fill_value=0)
+    if totals is None or totals.empty:
+        return pd.DataFrame(columns=['Course', 'CO', 'Rating', 'Weight', 'Responses'])
+    totals = totals.reset_index()
+    return pd.DataFrame({
+        'Course': totals['Course'],
+        'CO': totals['CO'],
+        'Rating': totals['weighted'] / totals['weight'].where(totals['weight'] != 0),
+        'Weight': totals['weight'],
+        'Responses': totals['responses'].astype(int),
+    })
+
+
+def course_survey(df_survey, course_code):
+    """The rows of a multi-course survey that belong to course_code (matched ignoring case)."""
+    cols = survey_columns(df_survey.columns)
+    if 'course' not in cols or course_code is None:
+        return df_survey
+    courses = df_survey[cols['course']].astype(str).str.strip()
+    if courses.nunique() <= 1:
+        return df_survey
+    rows = df_survey[courses.str.lower() == str(course_code).strip().lower()]
+    if rows.empty:
+        raise ValueError(f"The survey has no responses for course '{course_code}'; it covers "
+                         f"{', '.join(sorted(courses.unique())[:10])}.")
+    return rows
+
+
+def read_survey(src, course_code=None):
+    """The survey as a DataFrame: a workbook's first sheet, or a CSV through aggregate_survey_csv.
+
+    A DataFrame (e.g. a course's slice of a shared CSV in batch mode) is used
+    as it is. Multi-course surveys are narrowed to course_code.
+    """
+    if isinstance(src, pd.DataFrame):
+        df_survey = src
+    elif not is_csv_source(src):
+        df_survey = read_first_sheet(src)
+    elif is_raw_source(src):
+        df_survey = parse_cached(src, 'survey-csv', lambda f: {0: aggregate_survey_csv(f)})[0]
+    else:
+        df_survey = aggregate_survey_csv(src)
+    return course_survey(df_survey, course_code)
+
+
+def load_course_inputs(all_data_src, co_po_mapping_src, survey_src, source_label='Student Data',
+                       course_code=None):
+    """Parses one course's three workbooks (raw bytes, uploads, paths, URLs or file objects) into DataFrames.
+
+    The survey may also be a CSV (see read_survey); course_code picks the
+    course's rows out of a survey that covers several. Raises
+    InputValidationError, before anything is parsed, for files that would fail later.
+    """
+    with stage_span('validate'):
+        validate_course_inputs(all_data_src, co_po_mapping_src, survey_src, source_label)
+    df_marks, df_tool_map_meta = read_student_data(all_data_src, source_label)
+    df_co_po_mapping = read_first_sheet(co_po_mapping_src)
+    df_survey = read_survey(survey_src, course_code)
+    return df_marks, df_tool_map_meta, df_co_po_mapping, df_survey
+
+
+class MissingInputError(ValueError):
+    """A required upload or URL was not provided (shown to the user as-is)."""
+
+
+UPLOAD_FIELDS = ['all_data_file', 'co_po_mapping_file', 'survey_file']
+LINK_FIELDS = ['all_data_url', 'co_po_mapping_url', 'survey_url']
+
+
+def request_sources(input_method, form=None):
+    """The current request's three inputs: the uploaded bytes, or the three URLs in link mode.
+
+    The URLs are read from `form` when given (e.g. a JSON body), else from the request's form.
+    """
+    if input_method == 'upload':
+        files = request.files
+        if not all(f in files and files[f].filename for f in UPLOAD_FIELDS):
+            raise MissingInputError("Please upload all three required files: Student Data, CO-PO Mapping, and Survey.")
+        # spooled and hashed as they arrived, so re-submitting the same files hits the parse cache
+        return [upload_source(files[f]) for f in UPLOAD_FIELDS]
+
+    urls = request.form if form is None else form
+    if not all(urls.get(u) for u in LINK_FIELDS):
+        raise MissingInputError("Please provide all three required URLs: Student Data, CO-PO Mapping, and Survey.")
+    return [urls[u] for u in LINK_FIELDS]
+
+
+def load_sources(input_method, sources, course_code=None):
+    """Parses what request_sources returned (downloading the URLs first in link mode)."""
+    if input_method == 'upload':
+        return load_course_inputs(*sources, course_code=course_code)
+    # download all three in parallel; the bytes then go through the parse cache
+    return load_course_inputs(*get_url_fetcher().fetch_all(sources), source_label='Student Data URL',
+                              course_code=course_code)
+
+
+def load_request_inputs(input_method):
+    """Loads the current request's three workbooks, from uploads or from links."""
+    return load_sources(input_method, request_sources(input_method))
+
+
+# --- Input validation ---
+
+CellError = namedtuple('CellError', ['file', 'sheet', 'cell', 'message'])
+
+TOOL_MAP_COLUMNS = ['Tool_Question', 'CO', 'Max_Marks', 'Assessment_Type']
+ASSESSMENT_TYPES = {'CIE', 'SEE'}
+# how far down to look for a header row that was not put on row 1
+HEADER_SEARCH_ROWS = 10
+
+
+class InputValidationError(ValueError):
+    """The workbooks failed validate_course_inputs; `errors` holds a CellError per problem."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        shown = '; '.join(format_cell_error(error) for error in self.errors[:3])
+        more = f' (and {len(self.errors) - 3} more)' if len(self.errors) > 3 else ''
+        super().__init__(f"The files have {len(self.errors)} problem(s): {shown}{more}")
+
+
+def format_cell_error(error):
+    where = ', '.join(part for part in (error.file, error.sheet, error.cell and f'cell {error.cell}') if part)
+    return f'{where}: {error.message}'
+
+
+def cell_name(row, col):
+    """'C7' for 1-based row and 0-based column."""
+    from openpyxl.utils import get_column_letter
+
+    return f'{get_column_letter(col + 1)}{row}'
+
+
+def row_value(values, col):
+    """values[col] for a read-only row tuple, which stops at its last filled cell."""
+    return values[col] if col < len(values) else None
+
+
+def cell_number(value):
+    """float(value) for a number or numeric text, None for an empty cell.
+
+    Raises ValueError for anything pandas could not turn into a float later.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(value)
+    return float(value)
+
+
+@contextmanager
+def streaming_workbook(src):
+    """openpyxl read-only workbook for raw bytes, an upload or a path.
+
+    Yields None for anything openpyxl cannot open (other sources, .xls, broken
+    files); the pandas parse that follows reports those as before.
+    """
+    if not is_raw_source(src) and not isinstance(src, (str, os.PathLike)):
+        yield None
+        return
+    from openpyxl import load_workbook
+
+    with source_file(src) as f:
+        try:
+            workbook = load_workbook(f, read_only=True, data_only=True)
+        except Exception:
+            yield None
+            return
+        try:
+            yield workbook
+        finally:
+            workbook.close()
+
+
+class FrameSheet:
+    """The part of an openpyxl read-only worksheet the validators use, over a DataFrame.
+
+    The column names are row 1 and the DataFrame rows follow from row 2, as
+    if the table had been opened in a spreadsheet; blank values are None.
+    """
 
-    # DataFrames (Use consistent names for headers for chart setup)
-    df_direct_co = pd.DataFrame(list(final_direct_co.items()),
-                                columns=['Course Outcome', 'Attainment Level'])
-    df_indirect_co = pd.DataFrame(list(indirect_co.items()),
-                                  columns=['Course Outcome', 'Attainment Level'])
-    df_final_co = pd.DataFrame(list(final_co.items()),
-                               columns=['Course Outcome', 'Attainment Level'])
-    df_final_po = pd.DataFrame(list(final_po.items()),
-                               columns=['Program/Skill Outcome', 'Attainment Level'])
+    def __init__(self, title, df):
+        self.title = title
+        self.df = df
 
-    # Build Excel in memory
+    def reset_dimensions(self):
+        pass
+
+    def iter_rows(self, min_row=1, max_row=None, values_only=True):
+        if min_row <= 1:
+            yield tuple(self.df.columns)
+        rows = self.df.iloc[max(min_row, 2) - 2:None if max_row is None else max(max_row - 1, 0)]
+        for values in rows.astype(object).itertuples(index=False, name=None):
+            yield tuple(None if pd.isna(value) else value for value in values)
+
+
+class FrameWorkbook:
+    """DataFrames standing in for a read-only workbook, so pre-parsed tables go through the same checks."""
+
+    def __init__(self, sheets):
+        self.sheetnames = list(sheets)
+        self.worksheets = [FrameSheet(name, df) for name, df in sheets.items()]
+
+    def __getitem__(self, name):
+        return self.worksheets[self.sheetnames.index(name)]
+
+
+def streaming_sheet(workbook, name_or_index):
+    """A read-only worksheet that does not trust the file's recorded dimensions (as pandas does)."""
+    if isinstance(name_or_index, int):
+        worksheet = workbook.worksheets[name_or_index]
+    else:
+        worksheet = workbook[name_or_index]
+    worksheet.reset_dimensions()
+    return worksheet
+
+
+class WorkbookChecker:
+    """Collects CellErrors and stops the validation once max_errors are found."""
+
+    class Full(Exception):
+        pass
+
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.errors = []
+
+    def add(self, file, sheet, cell, message):
+        self.errors.append(CellError(file, sheet, cell, message))
+        if len(self.errors) >= self.max_errors:
+            raise self.Full()
+
+    def header(self, file, worksheet, required=(), any_of=None):
+        """Row 1 as {name: column}, or None after reporting what is missing.
+
+        Every `required` name must be in row 1, and with any_of=(description,
+        predicate) at least one name must match the predicate.
+        """
+        rows = list(worksheet.iter_rows(min_row=1, max_row=HEADER_SEARCH_ROWS, values_only=True))
+
+        def complete(names):
+            return (all(name in names for name in required)
+                    and (any_of is None or any(any_of[1](name) for name in names)))
+
+        columns = {}
+        for col, value in enumerate(rows[0] if rows else ()):
+            if value is not None:
+                columns.setdefault(str(value), col)
+        if complete(columns):
+            return columns
+
+        # the usual causes: headers below a title block, or a stray space / wrong case
+        for row, values in enumerate(rows[1:], start=2):
+            if complete({str(value) for value in values if value is not None}):
+                self.add(file, worksheet.title, f'A{row}',
+                         f"the column headers are on row {row}; they must be on row 1 "
+                         f"(delete the rows above them)")
+                return None
+        near = {name.strip().lower(): name for name in columns}
+        for name in required:
+            if name not in columns:
+                found = near.get(name.lower())
+                hint = f" (found '{found}')" if found is not None else ''
+                self.add(file, worksheet.title, None, f"missing column '{name}' in row 1{hint}")
+        if any_of is not None and not any(any_of[1](name) for name in columns):
+            self.add(file, worksheet.title, None, f"no {any_of[0]} columns in row 1")
+        return None
+
+
+def validate_student_sheets(checker, workbook, label, sample_rows):
+    """Checks the tool map (every row) and the first sample_rows students' marks.
+
+    Returns the tool map's CO names, or None when the sheets are too broken to tell.
+    """
+    missing = [name for name in (MARKS_SHEET, TOOL_MAP_SHEET) if name not in workbook.sheetnames]
+    if missing:
+        checker.add(label, None, None, f"must have sheets '{MARKS_SHEET}' and '{TOOL_MAP_SHEET}' "
+                                       f"(missing {', '.join(repr(name) for name in missing)})")
+        return None
+
+    tool_map = streaming_sheet(workbook, TOOL_MAP_SHEET)
+    columns = checker.header(label, tool_map, TOOL_MAP_COLUMNS)
+    marks_sheet = streaming_sheet(workbook, MARKS_SHEET)
+    marks_columns = checker.header(label, marks_sheet, any_of=('*_Marks', lambda name: name.endswith('_Marks')))
+    if columns is None or marks_columns is None:
+        return None
+
+    question_col, co_col, max_col, type_col = (columns[name] for name in TOOL_MAP_COLUMNS)
+    max_marks = {}  # marks column -> largest Max_Marks mapped to it
+    co_names = set()
+    for row, values in enumerate(tool_map.iter_rows(min_row=2, values_only=True), start=2):
+        if all(value is None for value in values):
+            continue
+        question, co, max_mark, kind = (row_value(values, col)
+                                        for col in (question_col, co_col, max_col, type_col))
+
+        if question is None:
+            checker.add(label, TOOL_MAP_SHEET, cell_name(row, question_col), "Tool_Question is empty")
+        elif f'{question}_Marks' not in marks_columns:
+            checker.add(label, TOOL_MAP_SHEET, cell_name(row, question_col),
+                        f"no '{question}_Marks' column in '{MARKS_SHEET}'")
+        if co is None:
+            checker.add(label, TOOL_MAP_SHEET, cell_name(row, co_col), "CO is empty")
+        else:
+            co_names.add(str(co))
+        try:
+            number = cell_number(max_mark)
+        except ValueError:
+            number = None
+            checker.add(label, TOOL_MAP_SHEET, cell_name(row, max_col),
+                        f"Max_Marks {max_mark!r} is not a number")
+        else:
+            if number is None:
+                checker.add(label, TOOL_MAP_SHEET, cell_name(row, max_col), "Max_Marks is empty")
+            elif not number > 0:
+                checker.add(label, TOOL_MAP_SHEET, cell_name(row, max_col),
+                            f"Max_Marks {max_mark!r} must be above 0")
+        if kind not in ASSESSMENT_TYPES:
+            checker.add(label, TOOL_MAP_SHEET, cell_name(row, type_col),
+                        f"Assessment_Type {kind!r} must be CIE or SEE")
+        if question is not None and number:
+            key = f'{question}_Marks'
+            max_marks[key] = max(max_marks.get(key, 0), number)
+
+    checks = [(col, name, max_marks.get(name)) for name, col in marks_columns.items()
+              if name.endswith('_Marks')]
+    for row, values in enumerate(marks_sheet.iter_rows(min_row=2, max_row=sample_rows + 1,
+                                                       values_only=True), start=2):
+        for col, name, limit in checks:
+            value = row_value(values, col)
+            try:
+                number = cell_number(value)
+            except ValueError:
+                checker.add(label, MARKS_SHEET, cell_name(row, col), f"{name} {value!r} is not a number")
+                continue
+            if number is None:
+                continue
+            if number < 0:
+                checker.add(label, MARKS_SHEET, cell_name(row, col), f"{name} {value!r} is negative")
+            elif limit is not None and number > limit:
+                checker.add(label, MARKS_SHEET, cell_name(row, col),
+                            f"{name} {value!r} is more than its Max_Marks ({limit:g})")
+    return co_names
+
+
+def survey_co_names(checker, workbook, label, sample_rows):
+    """Checks the survey's first sample_rows ratings; returns the COs it rates.
+
+    Long-format surveys name their COs in the rows, not the header, so for
+    those only the ratings are checked and None comes back.
+    """
+    survey = streaming_sheet(workbook, 0)
+    columns = checker.header(label, survey)
+    long_columns = survey_columns(columns)
+    if is_long_survey(columns):
+        ratings = [(columns[str(long_columns['rating'])], str(long_columns['rating']))]
+    else:
+        ratings = [(col, name) for name, col in columns.items() if 'CO' in name and '_Rating' in name]
+    for row, values in enumerate(survey.iter_rows(min_row=2, max_row=sample_rows + 1,
+                                                  values_only=True), start=2):
+        for col, name in ratings:
+            value = row_value(values, col)
+            try:
+                cell_number(value)
+            except ValueError:
+                checker.add(label, survey.title, cell_name(row, col), f"{name} {value!r} is not a number")
+    if is_long_survey(columns):
+        return None
+    return {name.replace('_Rating', '') for _, name in ratings}
+
+
+def validate_co_po_mapping(checker, workbook, label, known_cos):
+    """Checks the CO-PO matrix: a CO column, PO/PSO columns, 0-3 levels and COs the course has."""
+    mapping = streaming_sheet(workbook, 0)
+    columns = checker.header(label, mapping, ['CO'],
+                             any_of=('PO/PSO', lambda name: name.startswith(('PO', 'PSO'))))
+    if columns is None:
+        return
+    po_cols = [(col, name) for name, col in columns.items() if name.startswith(('PO', 'PSO'))]
+    co_col = columns['CO']
+    for row, values in enumerate(mapping.iter_rows(min_row=2, values_only=True), start=2):
+        if all(value is None for value in values):
+            continue
+        co = row_value(values, co_col)
+        if co is None:
+            checker.add(label, mapping.title, cell_name(row, co_col), "CO is empty")
+        elif known_cos is not None and str(co) not in known_cos:
+            checker.add(label, mapping.title, cell_name(row, co_col),
+                        f"{co} is not in the tool map or the survey")
+        for col, name in po_cols:
+            value = row_value(values, col)
+            if value is None or (isinstance(value, str) and value.strip() in ('', '-')):
+                continue
+            try:
+                number = cell_number(value)
+            except ValueError:
+                number = None
+            if number is None or not 0 <= number <= 3:
+                checker.add(label, mapping.title, cell_name(row, col),
+                            f"{name} level {value!r} must be 0, 1, 2, 3 or '-'")
+
+
+def validate_course_inputs(all_data_src, co_po_mapping_src, survey_src, source_label='Student Data'):
+    """Checks one course's three workbooks before they are parsed; raises InputValidationError.
+
+    Streams the headers, the whole (small) tool map and CO-PO matrix, and the
+    first VALIDATION_SAMPLE_ROWS rows of marks and survey with openpyxl in
+    read-only mode, so a bad file is turned away without parsing every
+    student. Stops after VALIDATION_MAX_ERRORS problems.
+
+    A pass is recorded in the parse cache (see validation_cache_key), so the
+    same three files are not read again when they come back.
+    """
+    key = validation_cache_key((all_data_src, co_po_mapping_src, survey_src), source_label)
+    if key is not None and get_parse_cache().get(key) is not None:
+        return
+    with streaming_workbook(all_data_src) as student_workbook, \
+            streaming_workbook(co_po_mapping_src) as co_po_workbook, \
+            streaming_workbook(survey_src) as survey_workbook:
+        validate_course_workbooks(student_workbook, co_po_workbook, survey_workbook, source_label)
+    if key is not None:
+        get_parse_cache().put(key, {})
+
+
+def validation_cache_key(sources, source_label):
+    """Parse cache key recording that these three files passed validation; None unless all are raw content.
+
+    Covers the three digests together (a file can pass with one mapping and
+    fail with another), the label the errors would name and the sample size.
+    """
+    if not all(is_raw_source(src) for src in sources):
+        return None
+    sample_rows = running_app().config['VALIDATION_SAMPLE_ROWS']
+    parts = [source_digest(src) for src in sources] + [source_label, str(sample_rows)]
+    return f"{hashlib.sha256(chr(0).join(parts).encode()).hexdigest()}-validated"
+
+
+def validate_course_workbooks(student_workbook, co_po_workbook, survey_workbook, source_label='Student Data'):
+    """The checks of validate_course_inputs on opened workbooks (or FrameWorkbooks); None skips one."""
+    config = running_app().config
+    sample_rows = config['VALIDATION_SAMPLE_ROWS']
+    checker = WorkbookChecker(config['VALIDATION_MAX_ERRORS'])
+    try:
+        tool_map_cos = student_workbook and validate_student_sheets(
+            checker, student_workbook, source_label, sample_rows)
+        rated_cos = survey_workbook and survey_co_names(checker, survey_workbook, 'Survey', sample_rows)
+        if co_po_workbook:
+            # a CSV or long-format survey may add COs that only it knows about
+            known_cos = None if tool_map_cos is None or rated_cos is None else tool_map_cos | rated_cos
+            validate_co_po_mapping(checker, co_po_workbook, 'CO-PO Mapping', known_cos)
+    except WorkbookChecker.Full:
+        pass
+    if checker.errors:
+        raise InputValidationError(checker.errors)
+
+
+# --- Result store ---
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store():
+    global _result_store
+    with _result_store_lock:
+        if _result_store is None:
+            config = running_app().config
+            if config['RESULT_STORE_PATH']:
+                _result_store = SQLiteResultStore(config['RESULT_STORE_PATH'],
+                                                  config['RESULT_STORE_MAX_ENTRIES'],
+                                                  config['RESULT_STORE_TTL_SECONDS'])
+            else:
+                _result_store = MemoryResultStore(config['RESULT_STORE_MAX_ENTRIES'],
+                                                  config['RESULT_STORE_TTL_SECONDS'])
+    return _result_store
+
+
+def store_result(data):
+    """Saves one calculation's download and returns its (unguessable) result ID."""
+    result_id = secrets.token_urlsafe(16)
+    get_result_store().put(result_id, data)
+    return result_id
+
+
+def build_results_workbook(results_dfs, cn, dn, cc):
+    """Renders the downloadable report: one sheet (table + bar chart) per results DataFrame."""
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        
-        results_dfs = {
-            'Direct_CO': df_direct_co,
-            'Indirect_CO': df_indirect_co,
-            'Final_CO': df_final_co,
-            'Final_PO': df_final_po,
-        }
-        
-        for sheet_name, df in results_dfs.items():
-            # Call the unified setup function to write headers, data, and chart
-            setup_results_sheet(writer, df, sheet_name, cn, dn, cc)
-            
-    output.seek(0)
-    excel_bytes = output.getvalue()
+    with stage_span('report', sheets=len(results_dfs)):
+        with report_writer(output) as writer:
+            for sheet_name, df in results_dfs.items():
+                # Call the unified setup function to write headers, data, and chart
+                setup_results_sheet(writer, df, sheet_name, cn, dn, cc)
+    return output.getvalue()
+
+
+def save_pending_report(results_dfs, cn, dn, cc):
+    """Stores what build_results_workbook needs and returns the result ID.
+
+    The workbook itself is only rendered on the first download (see get_report_bytes).
+    """
+    spec = {
+        'cn': cn, 'dn': dn, 'cc': cc,
+        'sheets': {name: {'columns': list(df.columns), 'rows': df.values.tolist()}
+                   for name, df in results_dfs.items()},
+    }
+    return store_result(json.dumps(spec).encode())
+
+
+def get_report_bytes(result_id):
+    """Returns the report for a result ID, building it on first use.
+
+    The built report replaces its spec under the same ID, so a result keeps
+    taking one RESULT_STORE_MAX_ENTRIES slot after it is downloaded.
+    """
+    store = get_result_store()
+    data = store.get(result_id)
+    # an xlsx file is a ZIP archive; a pending spec is JSON
+    if data is None or data.startswith(b'PK\x03\x04'):
+        return data
+    spec = json.loads(data)
+    results_dfs = {name: pd.DataFrame(sheet['rows'], columns=sheet['columns'])
+                   for name, sheet in spec['sheets'].items()}
+    excel_bytes = build_results_workbook(results_dfs, spec['cn'], spec['dn'], spec['cc'])
+    store.put(result_id, excel_bytes)
+    return excel_bytes
+
+
+# --- What-if recalculation ---
+
+class PreparedCourse:
+    """The parts of a calculation that thresholds and weights cannot change, computed once.
+
+    Holds every student's obtained marks per (tool, CO) (sorted per cell, so the
+    count above any threshold is a binary search), max marks, the CIE/SEE
+    tool layout, indirect attainment and the parsed CO-PO matrix. evaluate()
+    then redoes levels, direct, final CO and PO for many parameter sets at once,
+    with the same arithmetic as run_calculation_pipeline.
+    """
+
+    def __init__(self, df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, params):
+        self.params = dict(params)
+        df_tool_map_meta = df_tool_map_meta.assign(CO=df_tool_map_meta['CO'].astype(str))
+        tool_prefixes = list(df_tool_map_meta['Tool_Question'].str.split('_', expand=True)[0].unique())
+        self.co_names = list(df_tool_map_meta['CO'].unique())
+        course_marks = as_course_marks(df_marks)
+        self.n_students = len(course_marks)
+        n_tools, n_cos = len(tool_prefixes), len(self.co_names)
+
+        if df_tool_map_meta.empty or course_marks.empty or not tool_prefixes:
+            self.sorted_obtained = np.zeros((0, n_tools * n_cos))
+            self.max_marks = np.zeros(n_tools * n_cos)
+            self.valid_cells = np.zeros(n_tools * n_cos, dtype=bool)
+        else:
+            inc = build_tool_co_incidence(df_tool_map_meta, course_marks.columns, tool_prefixes)
+            obtained = course_marks.obtained(inc.used_cols, inc.incidence)
+            self.sorted_obtained = np.sort(obtained, axis=0)
+            self.max_marks = inc.max_marks
+            self.valid_cells = (inc.cols_per_cell > 0) & (inc.max_marks > 0)
+        self.grid_shape = (n_tools, n_cos)
+
+        # same tool selection as calculate_final_direct_co_attainment_weighted
+        by_type = df_tool_map_meta.groupby('Assessment_Type')['Tool_Question']
+        cie_tools = set(by_type.get_group('CIE').str.split('_').str[0]) if 'CIE' in by_type.groups else set()
+        see_tools = by_type.get_group('SEE').str.split('_').str[0].unique() if 'SEE' in by_type.groups else []
+        self.cie_mask = np.array([tool in cie_tools for tool in tool_prefixes], dtype=bool)
+        self.see_index = tool_prefixes.index(see_tools[0]) if len(see_tools) else None
+
+        self.indirect_co = calculate_indirect_co_attainment(df_survey)
+        self.final_co_names = sorted(set(self.co_names) | set(self.indirect_co))
+        self.mapping = co_po_mapping_matrix(df_co_po_mapping)
+        self.po_names = self.mapping[1]
+
+    def evaluate(self, params_list):
+        """Results for each parameter dict (run_calculation_pipeline argument names)."""
+        def column(name):
+            return np.array([float(p[name]) for p in params_list])[:, None]
+
+        n_tools, n_cos = self.grid_shape
+
+        # per-tool levels, (scenarios, tools * COs)
+        threshold_scores = self.max_marks[None, :] * (column('threshold_percentage') / 100.0)
+        above = np.empty(threshold_scores.shape)
+        for cell in range(threshold_scores.shape[1]):
+            above[:, cell] = self.n_students - np.searchsorted(
+                self.sorted_obtained[:, cell], threshold_scores[:, cell], side='left')
+        percentages = above / self.n_students if self.n_students else above
+        p = percentages
+        levels = np.select(
+            [p >= column('thr3_pct') / 100.0, p >= column('thr2_pct') / 100.0, p >= column('thr1_pct') / 100.0],
+            [3, 2, 1],
+            default=0,
+        )
+        levels[:, ~self.valid_cells] = 0
+        levels = levels.reshape(len(params_list), n_tools, n_cos)
+
+        # direct CO
+        cie_weight, see_weight = column('cie_weight'), column('see_weight')
+        total = np.where(cie_weight + see_weight != 0, cie_weight + see_weight, 1.0)
+        avg_cie = levels[:, self.cie_mask, :].mean(axis=1) if self.cie_mask.any() else 0
+        see = levels[:, self.see_index, :] if self.see_index is not None else 0
+        direct = round_levels((cie_weight / total) * avg_cie + (see_weight / total) * see)
+        direct = np.broadcast_to(direct, (len(params_list), n_cos))
+
+        # final CO
+        direct_weight, indirect_weight = column('direct_weight'), column('indirect_weight')
+        total_di = np.where(direct_weight + indirect_weight != 0, direct_weight + indirect_weight, 1.0)
+        co_pos = {co: i for i, co in enumerate(self.co_names)}
+        direct_cols = np.column_stack(
+            [direct[:, co_pos[co]] if co in co_pos else np.zeros(len(params_list))
+             for co in self.final_co_names]) if self.final_co_names else np.zeros((len(params_list), 0))
+        indirect_row = np.array([self.indirect_co.get(co, 0) for co in self.final_co_names], dtype=float)
+        final = round_levels((direct_weight / total_di) * direct_cols + (indirect_weight / total_di) * indirect_row)
+
+        po, _ = po_attainment_matrix(final, self.final_co_names, self.mapping)
+
+        return [
+            {
+                'direct_co': dict(zip(self.co_names, direct[i].tolist())),
+                'indirect_co': dict(self.indirect_co),
+                'final_co': dict(zip(self.final_co_names, final[i].tolist())),
+                'final_po': dict(zip(self.po_names, po[i].tolist())),
+            }
+            for i in range(len(params_list))
+        ]
 
-    # Re-set HTML headers to be descriptive (match expected results.html headers)
-    df_direct_co.columns = ['Course Outcome', 'Attainment Level (60%CIE+40%SEE)']
-    df_indirect_co.columns = ['Course Outcome', 'Attainment Level (Survey Avg 1-3)']
-    df_final_co.columns = ['Course Outcome', 'Final Attainment Level (80%D+20%I)']
-    df_final_po.columns = ['Program/Skill Outcome', 'Attainment Level']
 
-    return df_direct_co, df_indirect_co, df_final_co, df_final_po, excel_bytes
+# form field, label, min, max, step for the sliders on the results page
+WHATIF_SLIDERS = [
+    ('threshold', 'Threshold %', 0, 100, 1),
+    ('level3_pct', 'Level 3 %', 0, 100, 1),
+    ('level2_pct', 'Level 2 %', 0, 100, 1),
+    ('level1_pct', 'Level 1 %', 0, 100, 1),
+    ('cie_weight', 'CIE weight', 0, 100, 1),
+    ('see_weight', 'SEE weight', 0, 100, 1),
+    ('direct_weight', 'Direct weight', 0, 1, 0.05),
+    ('indirect_weight', 'Indirect weight', 0, 1, 0.05),
+]
+
+
+def whatif_fields(params):
+    """Slider rows for results.html, starting at the values the course was calculated with."""
+    return [(field, label, params[PIPELINE_PARAM_FIELDS[field][0]], lo, hi, step)
+            for field, label, lo, hi, step in WHATIF_SLIDERS]
+
+
+_prepared_courses = None
+_prepared_courses_lock = threading.Lock()
+
+
+def get_prepared_courses():
+    """Per-process LRU of PreparedCourse objects, keyed by result ID."""
+    global _prepared_courses
+    with _prepared_courses_lock:
+        if _prepared_courses is None:
+            config = running_app().config
+            _prepared_courses = MemoryResultStore(config['WHATIF_MAX_COURSES'],
+                                                  config['RESULT_STORE_TTL_SECONDS'])
+    return _prepared_courses
+
+
+# --- Per-student export ---
+
+STUDENT_EXPORT_COLUMNS = ['USN', 'Tool', 'CO', 'Obtained', 'Max_Marks', 'Threshold_Marks', 'Status']
+
+
+def iter_student_co_scores(df_marks, df_tool_map_meta, threshold_percentage, chunk_rows=2000):
+    """Per-student, per-(tool, CO) obtained vs threshold rows, chunk_rows students at a time.
+
+    The tool map is checked up front (so bad inputs fail before a response
+    starts streaming); the returned generator then builds one chunk at a time.
+    Uses the same incidence matrix and threshold rule as calculate_all_tool_co_attainments,
+    so 'Pass' rows are exactly the students counted towards the attainment level.
+    """
+    course_marks = as_course_marks(df_marks)
+    if df_tool_map_meta.empty or course_marks.empty:
+        return iter(())
+    df_tool_map_meta = df_tool_map_meta.assign(CO=df_tool_map_meta['CO'].astype(str))
+    tool_prefixes = list(df_tool_map_meta['Tool_Question'].str.split('_', expand=True)[0].unique())
+
+    inc = build_tool_co_incidence(df_tool_map_meta, course_marks.columns, tool_prefixes)
+    # cells without marks columns or max marks have nothing to report per student
+    cells = [(tool, co, cell) for tool, co, cell in inc.cells
+             if inc.cols_per_cell[cell] > 0 and inc.max_marks[cell] > 0]
+    if not cells:
+        return iter(())
+    cell_idx = np.array([cell for _, _, cell in cells])
+    incidence = inc.incidence[:, cell_idx]
+    max_marks = inc.max_marks[cell_idx]
+    threshold_scores = max_marks * (threshold_percentage / 100.0)
+    tools = np.array([tool for tool, _, _ in cells], dtype=object)
+    cos = np.array([co for _, co, _ in cells], dtype=object)
+
+    if course_marks.usns is not None:
+        student_ids = course_marks.usns
+    else:
+        student_ids = np.arange(1, len(course_marks) + 1)
+
+    n_cells = len(cells)
+
+    def build_chunk(start):
+        obtained = course_marks.obtained(inc.used_cols, incidence, rows=slice(start, start + chunk_rows))
+        n = len(obtained)
+        return pd.DataFrame({
+            'USN': np.repeat(student_ids[start:start + n], n_cells),
+            'Tool': np.tile(tools, n),
+            'CO': np.tile(cos, n),
+            'Obtained': obtained.ravel(),
+            'Max_Marks': np.tile(max_marks, n),
+            'Threshold_Marks': np.tile(np.round(threshold_scores, 3), n),
+            'Status': np.where(obtained.ravel() >= np.tile(threshold_scores, n), 'Pass', 'Fail'),
+        }, columns=STUDENT_EXPORT_COLUMNS)
+
+    return (build_chunk(start) for start in range(0, len(course_marks), chunk_rows))
+
+
+def stream_student_csv(chunks):
+    yield ','.join(STUDENT_EXPORT_COLUMNS) + '\n'
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False)
+
+
+def stream_student_xlsx(chunks, cn, dn, cc, writer_class=None):
+    """Streaming workbook: rows go to the writer's temp files as they come, never a full sheet in memory.
+
+    xlsxwriter's constant_memory mode when writer_class (default:
+    pick_report_writer()) is XlsxWriterReportWriter, otherwise an openpyxl
+    write-only workbook. Pick the writer before the response starts
+    streaming; the generator runs outside the request.
+    """
+    # same layout as the other reports: metadata in rows 1-2, table header on row 5
+    head = [[f'{cn} - {dn}'], [f'Course Code: {cc}'], [], [], STUDENT_EXPORT_COLUMNS]
+    rows = (row for chunk in chunks for row in chunk.itertuples(index=False, name=None))
+    with tempfile.TemporaryFile() as tmp:
+        if (writer_class or pick_report_writer()) is XlsxWriterReportWriter:
+            with XlsxWriterReportWriter(tmp) as writer:
+                writer.write_rows('Student_CO_Attainment', head)
+                writer.write_rows('Student_CO_Attainment', rows, startrow=len(head))
+        else:
+            from openpyxl import Workbook
+
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet('Student_CO_Attainment')
+            for row in head:
+                ws.append(row)
+            for row in rows:
+                ws.append(row)
+            wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            block = tmp.read(64 * 1024)
+            if not block:
+                break
+            yield block
 
 
 # --- Routes ---
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 
-@app.route('/calculate', methods=['POST'])
-def calculate():
-    global last_results_excel_bytes
+def calculate_course(form, input_method, sources, progress=None):
+    """Parses, computes and stores one course; returns the results.html context.
+
+    Shared by /calculate and the background jobs. `progress` is called with
+    each stage name ('parsing', 'computing', 'rendering') as it starts.
+    """
+    progress = progress or (lambda stage: None)
+
+    # --- Retrieve Metadata for Excel Branding (from hidden inputs) ---
+    college_name = form.get('college_name_calc', 'College Name')
+    dept_name = form.get('department_name_calc', 'Department Name')
+    course_code = form.get('course_code_calc', 'Course Code')
+
+    # configuration inputs
+    params = read_pipeline_params(form)
+
+    # load files
+    progress('parsing')
+    with stage_span('parse') as sizes:
+        if input_method == 'upload':
+            sizes['bytes'] = sum(len(source) for source in sources)
+        df_marks, df_tool_map_meta, df_co_po_mapping, df_survey = load_sources(
+            input_method, sources, course_code)
+        sizes.update(students=len(df_marks), questions=len(df_tool_map_meta))
+
+    # run pipeline (per section as well when the marks sheet has a Section column)
+    progress('computing')
+    with stage_span('pipeline'):
+        combined, sections = run_section_pipeline(
+            df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, **params
+        )
+
+    # keep the results for download_results; the workbook is built on first download
+    with stage_span('store'):
+        results_dfs = dict(zip(['Direct_CO', 'Indirect_CO', 'Final_CO', 'Final_PO'], combined.frames()))
+        results_dfs.update(section_report_sheets(sections))
+        result_id = save_pending_report(results_dfs, cn=college_name, dn=dept_name, cc=course_code)
+
+        rollup_key = read_rollup_key(form)
+        if rollup_key:
+            final_co = dict(combined.final_co)
+            get_rollup_store().save_courses(*rollup_key, [{
+                'course': course_code,
+                'students': len(df_marks),
+                'direct_co': dict(combined.direct_co),
+                'indirect_co': dict(combined.indirect_co),
+                'final_co': final_co,
+                'final_po': dict(combined.final_po),
+                'po_weights': course_po_weights(final_co, df_co_po_mapping),
+            }])
+
+        # marks are already summed per (tool, CO); the what-if API only redoes the cheap part
+        get_prepared_courses().put(
+            result_id, PreparedCourse(df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, params))
+
+    progress('rendering')
+    with stage_span('to_html'):
+        context = {
+            'result_id': result_id,
+            'whatif_fields': whatif_fields(params),
+            'section_co_table': None,
+            'section_po_table': None,
+        }
+        # descriptive headers for results.html
+        for table, columns in RESULTS_HTML_HEADERS.items():
+            context[f'{table}_table'] = combined.frame(table, columns).to_html(
+                classes='table table-hover table-sm', index=False)
+        if sections:
+            df_section_co, df_section_po = section_summary(combined, sections, df_marks)
+            context['section_co_table'] = df_section_co.to_html(classes='table table-hover table-sm', index=False)
+            context['section_po_table'] = df_section_po.to_html(classes='table table-hover table-sm', index=False)
+        return context
+
+
+# AttainmentTables field -> column headers of its results.html table
+RESULTS_HTML_HEADERS = {
+    'direct_co': ['Course Outcome', 'Attainment Level (60%CIE+40%SEE)'],
+    'indirect_co': ['Course Outcome', 'Attainment Level (Survey Avg 1-3)'],
+    'final_co': ['Course Outcome', 'Final Attainment Level (80%D+20%I)'],
+    'final_po': ['Program/Skill Outcome', 'Attainment Level'],
+}
+
+
+SHEET_NAME_INVALID = str.maketrans({c: '-' for c in '[]:*?/\\'})
+
+
+def section_report_sheets(sections):
+    """{sheet name: DataFrame}: a Final CO and a Final PO sheet per section.
+
+    Excel sheet names are at most 31 characters and cannot contain []:*?/\\,
+    so labels are cleaned and shortened, and numbered if two end up the same.
+    """
+    sheets = {}
+    for section, tables in sections.items():
+        label = str(section).translate(SHEET_NAME_INVALID)[:22]
+        base, n = label, 2
+        while f'{label}_Final_CO' in sheets:
+            label = f'{base[:22 - len(str(n)) - 1]}~{n}'
+            n += 1
+        sheets[f'{label}_Final_CO'] = tables.frame('final_co')
+        sheets[f'{label}_Final_PO'] = tables.frame('final_po')
+    return sheets
+
+
+def section_summary(combined, sections, df_marks):
+    """(final CO, final PO) DataFrames with a row per section under the whole-course row."""
+    students = pd.Series(as_course_marks(df_marks).sections).value_counts()
+    rows = [('All students', len(df_marks), combined)]
+    rows += [(section, int(students[section]), tables) for section, tables in sections.items()]
+
+    def summary(table):
+        frame = pd.DataFrame([dict(getattr(tables, table)) for _, _, tables in rows])
+        frame.insert(0, 'Students', [count for _, count, _ in rows])
+        frame.insert(0, 'Section', [name for name, _, _ in rows])
+        return frame
+
+    return summary('final_co'), summary('final_po')
+
 
+def calculation_error_message(e):
+    if isinstance(e, (MissingInputError, InputValidationError)):
+        return str(e)
+    return f"A critical error occurred: {e}. Please check your files and configuration inputs."
+
+
+@bp.route('/calculate', methods=['POST'])
+def calculate():
     try:
-        # basic
-        threshold_percentage = float(request.form.get('threshold', 60))
         input_method = request.form.get('input_method', 'upload')
+        context = calculate_course(request.form, input_method, request_sources(input_method))
+        with stage_span('template'):
+            return render_template('results.html', **context)
+    except InputValidationError as e:
+        return render_template('error.html', error=calculation_error_message(e), validation_errors=e.errors)
+    except Exception as e:
+        return render_template('error.html', error=calculation_error_message(e))
 
-        # --- Retrieve Metadata for Excel Branding (from hidden inputs) ---
+
+@bp.route('/download_results', methods=['GET'], defaults={'result_id': None})
+@bp.route('/download_results/<result_id>', methods=['GET'])
+def download_results(result_id):
+    excel_bytes = get_report_bytes(result_id) if result_id else None
+    if not excel_bytes:
+        return render_template('error.html',
+                               error="No results available for this calculation (they may have expired). Please run the calculation again.")
+    # hand the stored bytes straight to the response instead of wrapping them in a file object
+    response = Response(
+        excel_bytes,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename='CO_PO_Attainment_Results.xlsx')
+    return response
+
+@bp.route('/api/whatif/<result_id>', methods=['POST'])
+def whatif(result_id):
+    """Recomputes a /calculate result for new thresholds/weights without re-reading the files.
+
+    Body: one object with any of the form fields (threshold, level3_pct, ...,
+    indirect_weight), or {"scenarios": [...]} with many of them for a sweep.
+    Missing fields keep the values the course was calculated with.
+    """
+    prepared = get_prepared_courses().get(result_id)
+    if prepared is None:
+        return jsonify(error="Unknown or expired result. Please run the calculation again."), 404
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error="Expected a JSON object."), 400
+    scenarios = body.get('scenarios', [body])
+    if not isinstance(scenarios, list) or not all(isinstance(s, dict) for s in scenarios):
+        return jsonify(error="'scenarios' must be a list of objects."), 400
+    try:
+        params_list = [read_pipeline_params(s, defaults=prepared.params) for s in scenarios]
+    except (TypeError, ValueError) as e:
+        return jsonify(error=f"Invalid parameter value: {e}"), 400
+
+    with stage_span('whatif', scenarios=len(params_list)):
+        results = prepared.evaluate(params_list) if params_list else []
+    if 'scenarios' in body:
+        return jsonify(scenarios=[dict(r, params=p) for r, p in zip(results, params_list)])
+    return jsonify(dict(results[0], params=params_list[0]))
+
+@bp.route('/export_student_attainment', methods=['POST'])
+def export_student_attainment():
+    """Per-student CO scores and pass/fail flags for remediation lists, streamed as CSV or Excel."""
+    try:
+        input_method = request.form.get('input_method', 'upload')
+        export_format = request.form.get('export_format', 'csv')
         college_name = request.form.get('college_name_calc', 'College Name')
         dept_name = request.form.get('department_name_calc', 'Department Name')
         course_code = request.form.get('course_code_calc', 'Course Code')
-        
-        # configuration inputs
-        thr3_pct = float(request.form.get('level3_pct', 70))
-        thr2_pct = float(request.form.get('level2_pct', 55))
-        thr1_pct = float(request.form.get('level1_pct', 40))
+        threshold_percentage = read_pipeline_params(request.form)['threshold_percentage']
 
-        cie_weight = float(request.form.get('cie_weight', 60))
-        see_weight = float(request.form.get('see_weight', 40))
+        df_marks, df_tool_map_meta, _, _ = load_request_inputs(input_method)
+        chunks = iter_student_co_scores(df_marks, df_tool_map_meta, threshold_percentage,
+                                        chunk_rows=current_app.config['STUDENT_EXPORT_CHUNK_ROWS'])
 
-        direct_weight = float(request.form.get('direct_weight', 0.8))
-        indirect_weight = float(request.form.get('indirect_weight', 0.2))
+    except MissingInputError as e:
+        return render_template('error.html', error=str(e))
+    except InputValidationError as e:
+        return render_template('error.html', error=str(e), validation_errors=e.errors)
+    except Exception as e:
+        error_message = f"A critical error occurred: {e}. Please check your files and configuration inputs."
+        return render_template('error.html', error=error_message)
 
-        # load files
-        if input_method == 'upload':
-            files = request.files
-            required_files = ['all_data_file', 'co_po_mapping_file', 'survey_file']
-            if not all(f in files and files[f].filename for f in required_files):
-                return render_template('error.html',
-                                       error="Please upload all three required files: Student Data, CO-PO Mapping, and Survey.")
-            all_sheets = pd.read_excel(files['all_data_file'], sheet_name=None)
-            df_marks = all_sheets.get('1_Student_Marks')
-            df_tool_map_meta = all_sheets.get('2_Tool_CO_Mapping')
-            if df_marks is None or df_tool_map_meta is None:
-                raise ValueError("Student Data must have sheets '1_Student_Marks' and '2_Tool_CO_Mapping'.")
-            df_co_po_mapping = pd.read_excel(files['co_po_mapping_file'])
-            df_survey = pd.read_excel(files['survey_file'])
-
-        else:  # link
-            urls = request.form
-            required_urls = ['all_data_url', 'co_po_mapping_url', 'survey_url']
-            if not all(urls.get(u) for u in required_urls):
-                return render_template('error.html',
-                                       error="Please provide all three required URLs: Student Data, CO-PO Mapping, and Survey.")
-            all_sheets = pd.read_excel(urls['all_data_url'], sheet_name=None)
-            df_marks = all_sheets.get('1_Student_Marks')
-            df_tool_map_meta = all_sheets.get('2_Tool_CO_Mapping')
-            if df_marks is None or df_tool_map_meta is None:
-                raise ValueError("Student Data URL must have sheets '1_Student_Marks' and '2_Tool_CO_Mapping'.")
-            df_co_po_mapping = pd.read_excel(urls['co_po_mapping_url'])
-            df_survey = pd.read_excel(urls['survey_url'])
-
-        # run pipeline
-        (df_direct_co, df_indirect_co,
-         df_final_co, df_final_po,
-         excel_bytes) = run_calculation_pipeline(
-            df_marks, df_tool_map_meta, df_co_po_mapping, df_survey,
-            threshold_percentage,
-            thr3_pct, thr2_pct, thr1_pct,
-            cie_weight, see_weight,
-            direct_weight, indirect_weight,
-            # Pass metadata to the pipeline
-            cn=college_name, dn=dept_name, cc=course_code 
+    if export_format == 'xlsx':
+        response = Response(
+            stream_student_xlsx(chunks, college_name, dept_name, course_code, pick_report_writer()),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
+        filename = f'{course_code}_student_co_attainment.xlsx'
+    else:
+        response = Response(stream_student_csv(chunks), mimetype='text/csv')
+        filename = f'{course_code}_student_co_attainment.csv'
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
+
+
+# --- Calculation API ---
+
+# pre-parsed inputs: the student workbook's two sheets, the CO-PO matrix and the survey
+API_TABLE_FIELDS = ['marks', 'tool_map', 'co_po_mapping', 'survey']
+API_RESULT_TABLES = ['direct_co', 'indirect_co', 'final_co', 'final_po']
+API_FORMATS = {'json': 'application/json', 'csv': 'text/csv'}
+
+
+def read_api_table(field, value):
+    """A pre-parsed table: a list of row objects (JSON), or CSV as an upload or inline text."""
+    if isinstance(value, list) and all(isinstance(row, dict) for row in value):
+        return pd.DataFrame.from_records(value)
+    if isinstance(value, str):
+        value = value.encode()
+    elif hasattr(value, 'stream'):
+        value = upload_source(value)
+    if not is_raw_source(value):
+        raise InputValidationError([CellError(field, None, None, "must be a list of row objects or CSV text")])
+    try:
+        with source_file(value) as f:
+            return pd.read_csv(f, skipinitialspace=True)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise InputValidationError([CellError(field, None, None, f"is not a readable CSV table ({e})")])
+
+
+def load_api_inputs(form, files, course_code):
+    """The four input frames of an /api/v1/calculate request.
+
+    Takes the three /calculate uploads, the three /calculate URLs, or the
+    four tables of API_TABLE_FIELDS pre-parsed (see read_api_table), checked
+    like the workbooks they stand for.
+    """
+    if any(field in files for field in UPLOAD_FIELDS):
+        return load_sources('upload', request_sources('upload'), course_code)
+    if any(form.get(field) for field in LINK_FIELDS):
+        return load_sources('link', request_sources('link', form), course_code)
+
+    missing = [field for field in API_TABLE_FIELDS if field not in files and field not in form]
+    if missing:
+        raise MissingInputError(
+            "Please send the three workbooks (as for /calculate), their URLs, or the tables "
+            f"{', '.join(API_TABLE_FIELDS)} (missing {', '.join(missing)}).")
+    df_marks, df_tool_map_meta, df_co_po_mapping, df_survey = (
+        read_api_table(field, files[field] if field in files else form[field]) for field in API_TABLE_FIELDS)
+    with stage_span('validate'):
+        validate_course_workbooks(
+            FrameWorkbook({MARKS_SHEET: df_marks, TOOL_MAP_SHEET: df_tool_map_meta}),
+            FrameWorkbook({'CO_PO_Mapping': df_co_po_mapping}),
+            FrameWorkbook({'Survey': df_survey}),
+        )
+    return CourseMarks.from_frame(df_marks), df_tool_map_meta, df_co_po_mapping, course_survey(df_survey, course_code)
+
+
+def outcome_levels(levels):
+    """JSON-ready copy of one {outcome: level} table; None where there is no level."""
+    return {str(name): None if pd.isna(level) else float(level) for name, level in levels.items()}
+
+
+def api_result(course_code, df_marks, params, combined, sections):
+    """The JSON-ready result: the four tables as {outcome: level}, whole course and per section."""
+    result = {'course_code': course_code, 'students': len(df_marks), 'params': params}
+    result.update(zip(API_RESULT_TABLES, map(outcome_levels, combined)))
+    result['sections'] = {}
+    if sections:
+        students = pd.Series(as_course_marks(df_marks).sections).value_counts()
+        for section, tables in sections.items():
+            result['sections'][section] = dict(zip(API_RESULT_TABLES, map(outcome_levels, tables)),
+                                               students=int(students[section]))
+    return result
+
+
+def api_json(obj):
+    """Compact JSON bytes: orjson when it is installed, else the json module."""
+    if importlib.util.find_spec('orjson') is not None:
+        import orjson
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), allow_nan=False).encode()
+
+
+def api_csv(result):
+    """One section,result,outcome,level row per level; the whole course is section 'All students'."""
+    rows = [('All students', table, outcome, level)
+            for table in API_RESULT_TABLES for outcome, level in result[table].items()]
+    rows += [(section, table, outcome, level)
+             for section, tables in result['sections'].items()
+             for table in API_RESULT_TABLES for outcome, level in tables[table].items()]
+    return pd.DataFrame(rows, columns=['section', 'result', 'outcome', 'level']).to_csv(index=False).encode()
+
+
+# module -> exception of a lazily imported library that means an unreadable input, not a server fault
+API_INPUT_ERROR_TYPES = {
+    'requests': 'RequestException',  # a link that could not be fetched
+    'python_calamine': 'CalamineError',  # not a workbook the Excel engine can open
+    'openpyxl.utils.exceptions': 'InvalidFileException',
+}
+
+
+def api_input_errors():
+    """Exception types that mean a bad /api/v1/calculate request (400) rather than a server fault (500)."""
+    # MissingInputError and InputValidationError are ValueErrors
+    return (ValueError, zipfile.BadZipFile) + tuple(
+        getattr(sys.modules[module], name) for module, name in API_INPUT_ERROR_TYPES.items() if module in sys.modules)
+
+
+def api_format():
+    """'json' or 'csv': ?format=, else the Accept header; JSON unless CSV is asked for."""
+    name = request.args.get('format')
+    if name:
+        if name not in API_FORMATS:
+            raise ValueError(f"Unknown format {name!r}; use one of {', '.join(API_FORMATS)}.")
+        return name
+    best = request.accept_mimetypes.best_match(list(API_FORMATS.values()), default=API_FORMATS['json'])
+    return 'csv' if best == API_FORMATS['csv'] else 'json'
+
+
+@bp.route('/api/v1/calculate', methods=['POST'])
+def calculate_api():
+    """/calculate for programs: the same inputs (or pre-parsed tables), the results as JSON or CSV.
+
+    Nothing is rendered, no workbook is built and nothing is stored; errors
+    come back as JSON, with status 400 for bad input (api_input_errors) and
+    500 for anything else.
+    """
+    try:
+        output_format = api_format()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        if request.is_json:
+            form, files = request.get_json(silent=True), {}
+            if not isinstance(form, dict):
+                return jsonify(error="Expected a JSON object."), 400
+        else:
+            form, files = request.form, request.files
+        course_code = form.get('course_code_calc', form.get('course_code', 'Course Code'))
+        params = read_pipeline_params(form)
+
+        with stage_span('parse'):
+            df_marks, df_tool_map_meta, df_co_po_mapping, df_survey = load_api_inputs(form, files, course_code)
+        with stage_span('pipeline'):
+            combined, sections = run_section_pipeline(
+                df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, **params
+            )
+        with stage_span('serialize'):
+            result = api_result(course_code, df_marks, params, combined, sections)
+            body = api_csv(result) if output_format == 'csv' else api_json(result)
+    except InputValidationError as e:
+        return jsonify(error=str(e), errors=[error._asdict() for error in e.errors]), 400
+    except api_input_errors() as e:
+        return jsonify(error=calculation_error_message(e)), 400
+    except Exception as e:
+        return jsonify(error=f"The calculation failed on the server: {e}"), 500
+    return Response(body, mimetype=API_FORMATS[output_format])
+
+
+# --- Batch / department mode ---
+
+# filename marker -> load_course_inputs argument, matching the sample file names
+BATCH_FILE_ROLES = {
+    'student_data': 'all_data',
+    'co_po_mapping': 'co_po_mapping',
+    'survey': 'survey',
+}
+BATCH_RESULT_SHEETS = {
+    'direct_co': 'Direct_CO',
+    'indirect_co': 'Indirect_CO',
+    'final_co': 'Final_CO',
+    'final_po': 'Final_PO',
+}
+
+
+def group_batch_files(paths):
+    """Groups workbook paths into {course_code: {role: path}}.
+
+    The course code is the part of the filename before the role marker
+    (e.g. CS82_student_data.xlsx), or the parent folder name when the
+    filename has no prefix (e.g. CS82/survey.xlsx). Surveys may also be CSV files.
+    """
+    courses = {}
+    for path in paths:
+        folder, _, filename = path.replace('\\', '/').rpartition('/')
+        lower = filename.lower()
+        if not lower.endswith(('.xlsx', '.csv')) or lower.startswith('~$'):
+            continue
+        for marker, role in BATCH_FILE_ROLES.items():
+            pos = lower.find(marker)
+            if pos == -1 or (lower.endswith('.csv') and role != 'survey'):
+                continue
+            course_code = filename[:pos].strip('_- ') or folder.rpartition('/')[2] or 'Course'
+            courses.setdefault(course_code, {})[role] = path
+            break
+    return dict(sorted(courses.items()))
+
+
+def attach_shared_survey(courses, survey_src, scale=None):
+    """Gives each course without a survey of its own its rows of one multi-course survey CSV.
+
+    The CSV is aggregated once for every course (aggregate_survey_csv) and
+    each course gets its small slice as a DataFrame. Returns the courses.
+    """
+    aggregated = aggregate_survey_csv(survey_src, scale=scale)
+    by_course = {course.lower(): rows.reset_index(drop=True)
+                 for course, rows in aggregated.groupby('Course', sort=False)}
+    for course_code, sources in courses.items():
+        rows = by_course.get(course_code.strip().lower())
+        if 'survey' not in sources and rows is not None:
+            sources['survey'] = rows
+    return courses
+
+
+def run_batch_course(course_code, sources, params):
+    """Process-pool worker: runs one course and returns plain, picklable results.
+
+    `sources` maps each role to a file path or the raw workbook bytes. Failures
+    are returned as an 'error' result so one bad course never stops the batch.
+    """
+    result = {'course': course_code, 'status': 'ok', 'error': '', 'students': 0}
+    try:
+        missing = [marker for marker, role in BATCH_FILE_ROLES.items() if role not in sources]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)} workbook")
+        df_marks, df_tool_map_meta, df_co_po_mapping, df_survey = load_course_inputs(
+            sources['all_data'], sources['co_po_mapping'], sources['survey'], course_code=course_code
+        )
+        combined = run_section_pipeline(
+            df_marks, df_tool_map_meta, df_co_po_mapping, df_survey, **params
+        ).combined
+        result['students'] = len(df_marks)
+        for key, levels in zip(BATCH_RESULT_SHEETS, combined):
+            result[key] = dict(levels)
+        result['po_weights'] = course_po_weights(result['final_co'], df_co_po_mapping)
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    return result
+
+
+def run_batch(courses, params, max_workers=None):
+    """Fans run_batch_course out over a process pool; results keep the course order."""
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(course_code, pool.submit(run_batch_course, course_code, sources, params))
+                   for course_code, sources in courses.items()]
+        for course_code, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:  # worker crashed (e.g. killed for memory)
+                results.append({'course': course_code, 'status': 'error',
+                                'error': str(e) or type(e).__name__, 'students': 0})
+    return results
+
 
-        # store Excel bytes for download_results
-        last_results_excel_bytes = excel_bytes
-
-        # Re-set HTML headers to be descriptive (match expected results.html headers)
-        df_direct_co.columns = ['Course Outcome', 'Attainment Level (60%CIE+40%SEE)']
-        df_indirect_co.columns = ['Course Outcome', 'Attainment Level (Survey Avg 1-3)']
-        df_final_co.columns = ['Course Outcome', 'Final Attainment Level (80%D+20%I)']
-        df_final_po.columns = ['Program/Skill Outcome', 'Attainment Level']
-
-        return render_template(
-            'results.html',
-            direct_co_table=df_direct_co.to_html(classes='table table-hover table-sm', index=False),
-            indirect_co_table=df_indirect_co.to_html(classes='table table-hover table-sm', index=False),
-            final_co_table=df_final_co.to_html(classes='table table-hover table-sm', index=False),
-            final_po_table=df_final_po.to_html(classes='table table-hover table-sm', index=False)
+def batch_pool_size(requested, n_courses):
+    """Worker processes for a /calculate_batch run: `requested` (default: as many as allowed),
+    capped at BATCH_MAX_WORKERS and at one per course."""
+    cap = running_app().config['BATCH_MAX_WORKERS']
+    return max(1, min(requested or cap, cap, n_courses))
+
+
+def build_batch_workbook(results, cn='College Name', dn='Department Name'):
+    """Consolidated workbook: a per-course Summary sheet plus one course x outcome sheet per result."""
+    df_summary = pd.DataFrame(
+        [[r['course'], r['status'], r['students'], r['error']] for r in results],
+        columns=['Course Code', 'Status', 'Students', 'Error']
+    )
+    ok_results = [r for r in results if r['status'] == 'ok']
+    label = f'Batch ({len(ok_results)} of {len(results)} courses)'
+
+    output = BytesIO()
+    with report_writer(output) as writer:
+        write_metadata_to_sheet(writer, 'Summary', cn, dn, label, len(df_summary.columns))
+        writer.write_table('Summary', df_summary, startrow=4)
+        autosize_columns(writer, 'Summary', df_summary)
+        for key, sheet_name in BATCH_RESULT_SHEETS.items():
+            df = pd.DataFrame([r[key] for r in ok_results],
+                              index=pd.Index([r['course'] for r in ok_results], name='Course Code'))
+            write_metadata_to_sheet(writer, sheet_name, cn, dn, label, len(df.columns) + 1)
+            writer.write_table(sheet_name, df, startrow=4, index=True)
+            autosize_columns(writer, sheet_name, df, index=True)
+    return output.getvalue()
+
+
+@bp.route('/calculate_batch', methods=['POST'])
+def calculate_batch():
+    try:
+        batch_file = request.files.get('batch_file')
+        if not batch_file or not batch_file.filename:
+            return render_template('error.html',
+                                   error="Please upload a ZIP file with one Student Data, CO-PO Mapping and Survey workbook per course.")
+        params = read_pipeline_params(request.form)
+        max_workers = request.form.get('max_workers', '').strip()
+        if max_workers and not (max_workers.isdigit() and int(max_workers) >= 1):
+            return render_template('error.html',
+                                   error=f"Max workers must be a whole number of at least 1 (got '{max_workers}').")
+
+        with zipfile.ZipFile(batch_file) as z:
+            courses = group_batch_files(z.namelist())
+            courses = {course_code: {role: z.read(name) for role, name in sources.items()}
+                       for course_code, sources in courses.items()}
+        # optional: one long-format survey export covering every course
+        survey_csv = request.files.get('survey_csv')
+        if survey_csv and survey_csv.filename:
+            attach_shared_survey(courses, upload_source(survey_csv))
+        if not courses:
+            return render_template('error.html',
+                                   error="No course workbooks found in the ZIP file.")
+
+        results = run_batch(courses, params,
+                            max_workers=batch_pool_size(int(max_workers) if max_workers else None, len(courses)))
+        rollup_key = read_rollup_key(request.form)
+        if rollup_key:
+            get_rollup_store().save_courses(*rollup_key, [r for r in results if r['status'] == 'ok'])
+        excel_bytes = build_batch_workbook(
+            results,
+            cn=request.form.get('college_name_calc', 'College Name'),
+            dn=request.form.get('department_name_calc', 'Department Name'),
         )
 
     except Exception as e:
         error_message = f"A critical error occurred: {e}. Please check your files and configuration inputs."
         return render_template('error.html', error=error_message)
 
-
-@app.route('/download_results', methods=['GET'])
-def download_results():
-    # ... (unchanged)
-    global last_results_excel_bytes
-    if not last_results_excel_bytes:
-        return render_template('error.html',
-                               error="No results available yet. Please run a calculation first.")
-    buf = BytesIO(last_results_excel_bytes)
-    buf.seek(0)
     return send_file(
-        buf,
+        BytesIO(excel_bytes),
         as_attachment=True,
-        download_name='CO_PO_Attainment_Results.xlsx',
+        download_name='CO_PO_Batch_Results.xlsx',
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
 
-# --- Sample file generators (unchanged) ---
 
-@app.route('/download_sample/<sample_name>')
-def download_sample(sample_name):
-    # ... (unchanged)
-    name = sample_name.lower()
-    
-    # --- Retrieve metadata from query parameters ---
-    course_code = request.args.get('cc', 'sample') 
-    college_name = request.args.get('cn', 'Sample College')
-    dept_name = request.args.get('dn', 'Sample Dept')
-    
-    if name == 'student':
-        # --- NEW DETAILED SAMPLE DATA ---
-        df_marks = pd.DataFrame({
-            "USN": ["1RV01", "1RV02", "1RV03"],
-            "STUDENT NAME": ["Student A", "Student B", "Student C"],
-            "T1_Q1a_Marks": [6, 4, 3],
-            "T1_Q1b_Marks": [4, 2, 1],
-            "T1_Q2a_Marks": [5, 4, 2],
-            "T1_Q2b_Marks": [5, 5, 3],
-            "T2_Q1a_Marks": [6, 5, 4],
-            "T2_Q1b_Marks": [4, 3, 2],
-            "T2_Q2a_Marks": [5, 4, 3],
-            "T2_Q2b_Marks": [5, 4, 2],
-            "ASSIGN_Q1_Marks": [10, 8, 5],
-            "ASSIGN_Q2_Marks": [10, 7, 4],
-            "SEE_Q1a_Marks": [6, 5, 4],
-            "SEE_Q1b_Marks": [4, 3, 2],
-            "SEE_Q1c_Marks": [10, 8, 6],
-            "SEE_Q2a_Marks": [10, 7, 5]
-        })
-        df_tool_map = pd.DataFrame({
-            "Tool_Question": ["T1_Q1a", "T1_Q1b", "T1_Q2a", "T1_Q2b", 
-                              "T2_Q1a", "T2_Q1b", "T2_Q2a", "T2_Q2b", 
-                              "ASSIGN_Q1", "ASSIGN_Q2", 
-                              "SEE_Q1a", "SEE_Q1b", "SEE_Q1c", "SEE_Q2a"],
-            "CO": ["CO1", "CO1", "CO2", "CO2",
-                   "CO1", "CO1", "CO3", "CO3",
-                   "CO1", "CO2",
-                   "CO1", "CO1", "CO2", "CO3"],
-            "Max_Marks": [6, 4, 5, 5, 
-                          6, 4, 5, 5, 
-                          10, 10, 
-                          6, 4, 10, 10],
-            "Assessment_Type": ["CIE", "CIE", "CIE", "CIE",
-                                "CIE", "CIE", "CIE", "CIE",
-                                "CIE", "CIE",
-                                "SEE", "SEE", "SEE", "SEE"]
-        })
-        # --- END NEW DETAILED SAMPLE DATA ---
-        
-        buf = BytesIO()
-        with pd.ExcelWriter(buf, engine='openpyxl') as writer:
-            # Write Student Marks Data
-            sheet_marks_name = "1_Student_Marks"
-            df_marks.to_excel(writer, sheet_name=sheet_marks_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_marks_name, college_name, dept_name, course_code, len(df_marks.columns))
-            
-            # Write Tool Mapping Data
-            sheet_map_name = "2_Tool_CO_Mapping"
-            df_tool_map.to_excel(writer, sheet_name=sheet_map_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_map_name, college_name, dept_name, course_code, len(df_tool_map.columns))
-            
-        buf.seek(0)
-        filename = f"{course_code}_student_data_sample.xlsx"
-
-    elif name in ('copomatrix', 'copomap'):
-        # --- NEW DEFAULT: 11 POs and 2 PSOs ---
-        po_names = [f'PO{i}' for i in range(1, 12)]
-        pso_names = [f'PSO{i}' for i in range(1, 3)]
-        all_cols = ['CO'] + po_names + pso_names
-        
-        # Create data with some sample mapping levels (1, 2, or 3)
-        data = {
-            'CO': ['CO1', 'CO2', 'CO3'],
-            'PO1': [3, 1, 0], 'PO2': [1, 2, 3], 'PO3': [2, 3, 1], 'PO4': [0, 1, 2],
-            'PO5': [1, 0, 3], 'PO6': [3, 2, 1], 'PO7': [2, 1, 0], 'PO8': [1, 3, 2],
-            'PO9': [2, 0, 1], 'PO10': [0, 2, 3], 'PO11': [3, 1, 2],
-            'PSO1': [2, 3, 1], 'PSO2': [1, 1, 2]
-        }
-        df_copom = pd.DataFrame(data, columns=all_cols)
-        # --- END NEW DEFAULT ---
+# --- Program rollup ---
+
+_rollup_store = None
+_rollup_store_lock = threading.Lock()
+
+
+def get_rollup_store():
+    global _rollup_store
+    with _rollup_store_lock:
+        if _rollup_store is None:
+            from rollup_store import RollupStore  # imports pandas
+
+            flask_app = running_app()
+            path = flask_app.config['ROLLUP_STORE_PATH']
+            if not path:
+                os.makedirs(flask_app.instance_path, exist_ok=True)
+                path = os.path.join(flask_app.instance_path, 'rollup.sqlite3')
+            _rollup_store = RollupStore(path, po_levels_from_sums)
+    return _rollup_store
+
+
+def read_rollup_key(form):
+    """(program, batch year) from the form, or None when the course should not be rolled up."""
+    program = form.get('program', '').strip()
+    year = form.get('batch_year', '').strip()
+    return (program, year) if program and year else None
+
+
+@bp.route('/rollup', methods=['GET'])
+@bp.route('/rollup/<program>/<year>', methods=['GET'])
+def rollup(program=None, year=None):
+    store = get_rollup_store()
+    summary = course_pos = None
+    if program is not None:
+        summary = store.program_summary(program, year)
+        if summary.empty:
+            return render_template('error.html', error=f"No courses stored for {program} ({year}).")
+        course_pos = store.course_matrix(program, year)
+    return render_template(
+        'rollup.html',
+        programs=store.programs(),
+        program=program,
+        year=year,
+        summary=summary,
+        course_pos=course_pos,
+    )
 
+
+@bp.route('/api/rollup/<program>/<year>', methods=['GET'])
+def rollup_api(program, year):
+    store = get_rollup_store()
+    summary = store.program_summary(program, year)
+    if summary.empty:
+        return jsonify(error=f"No courses stored for {program} ({year})."), 404
+    course_pos = store.course_matrix(program, year)
+    return jsonify(
+        program=program,
+        year=year,
+        program_po=summary.to_dict(orient='records'),
+        course_po={course: {po: level for po, level in row.items() if pd.notna(level)}
+                   for course, row in course_pos.iterrows()},
+    )
+
+
+# --- Background jobs ---
+
+def run_calculation_job(form, blobs, progress):
+    """JobQueue handler: calculate_course plus the Excel report, so the download is ready too."""
+    input_method = form.get('input_method', 'upload')
+    sources = blobs if input_method == 'upload' else [form[u] for u in LINK_FIELDS]
+    context = calculate_course(form, input_method, sources, progress)
+    get_report_bytes(context['result_id'])
+    return context
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            flask_app = running_app()
+            config = flask_app.config
+            path = config['JOB_QUEUE_PATH']
+            if not path:
+                os.makedirs(flask_app.instance_path, exist_ok=True)
+                path = os.path.join(flask_app.instance_path, 'jobs.sqlite3')
+
+            def handler(form, blobs, progress):
+                # worker threads have no app context of their own
+                with flask_app.app_context():
+                    return run_calculation_job(form, blobs, progress)
+
+            _job_queue = JobQueue(path, config['JOB_WORKERS'], config['JOB_QUEUE_MAX_PENDING'],
+                                  config['JOB_STALE_SECONDS'], config['RESULT_STORE_TTL_SECONDS'], handler,
+                                  config['JOB_HEARTBEAT_SECONDS'], calculation_error_message)
+    return _job_queue
+
+
+def wants_json():
+    return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+
+
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Same form as /calculate, but queued: answers straight away with the job's page."""
+    try:
+        input_method = request.form.get('input_method', 'upload')
+        sources = request_sources(input_method)
+        if input_method == 'upload':
+            # turn bad files away now instead of after they have waited in the queue
+            validate_course_inputs(*sources)
+        # the queue keeps the files in its database, past the request's spool files
+        blobs = [bytes(source) for source in sources] if input_method == 'upload' else (None, None, None)
+        job_id = get_job_queue().submit(request.form.to_dict(), blobs)
+    except QueueFullError:
+        message = "The server is busy with other calculations. Please try again in a minute."
+        body = jsonify(error=message) if wants_json() else render_template('error.html', error=message)
+        return body, 503, {'Retry-After': '30'}
+    except InputValidationError as e:
+        if wants_json():
+            return jsonify(error=str(e), errors=[error._asdict() for error in e.errors]), 400
+        return render_template('error.html', error=str(e), validation_errors=e.errors)
+    except Exception as e:
+        if wants_json():
+            return jsonify(error=calculation_error_message(e)), 400
+        return render_template('error.html', error=calculation_error_message(e))
+
+    if wants_json():
+        return jsonify(job_id=job_id, status_url=f'/api/jobs/{job_id}', result_url=f'/jobs/{job_id}'), 202
+    return redirect(f'/jobs/{job_id}', code=303)
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return jsonify(error="Unknown or expired job."), 404
+    result = status.pop('result')
+    if result:
+        status['result_id'] = result['result_id']
+        status['result_url'] = f'/jobs/{job_id}'
+    return jsonify(job_id=job_id, **status)
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def job_page(job_id):
+    """The results page once the job is done; until then a page that polls /api/jobs/<id>."""
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return render_template('error.html', error="Unknown or expired calculation. Please run it again.")
+    if status['status'] == 'done':
+        return render_template('results.html', **status['result'])
+    if status['status'] == 'error':
+        return render_template('error.html', error=status['error'])
+    return render_template('job.html', job_id=job_id, stages=JOB_STAGES[1:-1], **status)
+
+
+# --- Sample files ---
+
+# Every sample is the same literal data with a two-line metadata header
+# (college/department and course code) on top. Each workbook is serialized
+# once per header and kept in get_sample_cache().
+SAMPLE_MARKS = {
+    "USN": ["1RV01", "1RV02", "1RV03"],
+    "STUDENT NAME": ["Student A", "Student B", "Student C"],
+    "T1_Q1a_Marks": [6, 4, 3],
+    "T1_Q1b_Marks": [4, 2, 1],
+    "T1_Q2a_Marks": [5, 4, 2],
+    "T1_Q2b_Marks": [5, 5, 3],
+    "T2_Q1a_Marks": [6, 5, 4],
+    "T2_Q1b_Marks": [4, 3, 2],
+    "T2_Q2a_Marks": [5, 4, 3],
+    "T2_Q2b_Marks": [5, 4, 2],
+    "ASSIGN_Q1_Marks": [10, 8, 5],
+    "ASSIGN_Q2_Marks": [10, 7, 4],
+    "SEE_Q1a_Marks": [6, 5, 4],
+    "SEE_Q1b_Marks": [4, 3, 2],
+    "SEE_Q1c_Marks": [10, 8, 6],
+    "SEE_Q2a_Marks": [10, 7, 5]
+}
+
+SAMPLE_TOOL_MAP = {
+    "Tool_Question": ["T1_Q1a", "T1_Q1b", "T1_Q2a", "T1_Q2b",
+                      "T2_Q1a", "T2_Q1b", "T2_Q2a", "T2_Q2b",
+                      "ASSIGN_Q1", "ASSIGN_Q2",
+                      "SEE_Q1a", "SEE_Q1b", "SEE_Q1c", "SEE_Q2a"],
+    "CO": ["CO1", "CO1", "CO2", "CO2",
+           "CO1", "CO1", "CO3", "CO3",
+           "CO1", "CO2",
+           "CO1", "CO1", "CO2", "CO3"],
+    "Max_Marks": [6, 4, 5, 5,
+                  6, 4, 5, 5,
+                  10, 10,
+                  6, 4, 10, 10],
+    "Assessment_Type": ["CIE", "CIE", "CIE", "CIE",
+                        "CIE", "CIE", "CIE", "CIE",
+                        "CIE", "CIE",
+                        "SEE", "SEE", "SEE", "SEE"]
+}
+
+# 11 POs and 2 PSOs, with some sample mapping levels (0-3)
+SAMPLE_CO_PO_MAPPING = {
+    'CO': ['CO1', 'CO2', 'CO3'],
+    'PO1': [3, 1, 0], 'PO2': [1, 2, 3], 'PO3': [2, 3, 1], 'PO4': [0, 1, 2],
+    'PO5': [1, 0, 3], 'PO6': [3, 2, 1], 'PO7': [2, 1, 0], 'PO8': [1, 3, 2],
+    'PO9': [2, 0, 1], 'PO10': [0, 2, 3], 'PO11': [3, 1, 2],
+    'PSO1': [2, 3, 1], 'PSO2': [1, 1, 2]
+}
+
+SAMPLE_SURVEY = {
+    "USN": ["1RV01", "1RV02", "1RV03"],
+    "CO1_Rating": [3, 2, 3],
+    "CO2_Rating": [2, 1, 2],
+    "CO3_Rating": [3, 2, 3]
+}
+
+# sample name -> (file name suffix, [(sheet name, table), ...]), in ZIP order
+SAMPLE_WORKBOOKS = {
+    'student': ('student_data_sample.xlsx',
+                [(MARKS_SHEET, SAMPLE_MARKS), (TOOL_MAP_SHEET, SAMPLE_TOOL_MAP)]),
+    'copomatrix': ('co_po_mapping_sample.xlsx', [('CO_PO_Mapping', SAMPLE_CO_PO_MAPPING)]),
+    'survey': ('survey_data_sample.xlsx', [('Survey', SAMPLE_SURVEY)]),
+}
+SAMPLE_ALIASES = {'copomap': 'copomatrix'}
+
+
+def sample_header():
+    """The (college, department, course code) header from the query string."""
+    return (request.args.get('cn', 'Sample College'),
+            request.args.get('dn', 'Sample Dept'),
+            request.args.get('cc', 'sample'))
+
+
+def sample_filename(sample, cc):
+    return f'{cc}_{SAMPLE_WORKBOOKS[sample][0]}'
+
+
+_sample_cache = None
+_sample_cache_lock = threading.Lock()
+
+
+def get_sample_cache():
+    """Per-process LRU of serialized sample workbooks/ZIPs, keyed by (sample, cn, dn, cc)."""
+    global _sample_cache
+    with _sample_cache_lock:
+        if _sample_cache is None:
+            _sample_cache = MemoryResultStore(running_app().config['SAMPLE_CACHE_MAX_ENTRIES'],
+                                              float('inf'))
+    return _sample_cache
+
+
+def sample_workbook_bytes(sample, cn, dn, cc):
+    """The xlsx bytes of one sample: each table at row 6 under the metadata header."""
+    key = (sample, cn, dn, cc)
+    data = get_sample_cache().get(key)
+    if data is None:
         buf = BytesIO()
-        with pd.ExcelWriter(buf, engine='openpyxl') as writer:
-            sheet_name = "CO_PO_Mapping"
-            df_copom.to_excel(writer, sheet_name=sheet_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_name, college_name, dept_name, course_code, len(df_copom.columns))
-            
-        buf.seek(0)
-        filename = f"{course_code}_co_po_mapping_sample.xlsx"
-
-    elif name == 'survey':
-        # NOTE: Updated survey to include CO3
-        df_survey = pd.DataFrame({
-            "USN": ["1RV01", "1RV02", "1RV03"],
-            "CO1_Rating": [3, 2, 3],
-            "CO2_Rating": [2, 1, 2],
-            "CO3_Rating": [3, 2, 3]
-        })
+        with report_writer(buf) as writer:
+            for sheet_name, table in SAMPLE_WORKBOOKS[sample][1]:
+                df = pd.DataFrame(table)
+                write_metadata_to_sheet(writer, sheet_name, cn, dn, cc, len(df.columns))
+                writer.write_table(sheet_name, df, startrow=5)
+                autosize_columns(writer, sheet_name, df)
+        data = buf.getvalue()
+        get_sample_cache().put(key, data)
+    return data
+
+
+def sample_zip_bytes(cn, dn, cc):
+    """All samples in one ZIP, assembled from the (cached) per-sample workbooks."""
+    key = ('all', cn, dn, cc)
+    data = get_sample_cache().get(key)
+    if data is None:
         buf = BytesIO()
-        with pd.ExcelWriter(buf, engine='openpyxl') as writer:
-            sheet_name = "Survey"
-            df_survey.to_excel(writer, sheet_name=sheet_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_name, college_name, dept_name, course_code, len(df_survey.columns))
-            
-        buf.seek(0)
-        filename = f"{course_code}_survey_data_sample.xlsx"
+        with zipfile.ZipFile(buf, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+            for sample in SAMPLE_WORKBOOKS:
+                z.writestr(sample_filename(sample, cc), sample_workbook_bytes(sample, cn, dn, cc))
+        data = buf.getvalue()
+        get_sample_cache().put(key, data)
+    return data
 
-    else:
+
+def sample_response(data, mimetype, filename):
+    # the bytes only depend on the URL, so repeat downloads can be answered with a 304
+    return send_file(BytesIO(data), as_attachment=True, download_name=filename, mimetype=mimetype,
+                     etag=hashlib.sha256(data).hexdigest()[:32])
+
+
+@bp.route('/download_sample/<sample_name>')
+def download_sample(sample_name):
+    name = sample_name.lower()
+    name = SAMPLE_ALIASES.get(name, name)
+    if name not in SAMPLE_WORKBOOKS:
         return abort(404, description="Sample not found")
 
-    return send_file(
-        buf,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    cn, dn, cc = sample_header()
+    return sample_response(
+        sample_workbook_bytes(name, cn, dn, cc),
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        sample_filename(name, cc),
     )
 
 
-@app.route('/download_sample/all')
+@bp.route('/download_sample/all')
 def download_all_samples():
-    # ... (unchanged)
-    # --- Retrieve metadata from query parameters ---
-    course_code = request.args.get('cc', 'sample')
-    college_name = request.args.get('cn', 'Sample College')
-    dept_name = request.args.get('dn', 'Sample Dept')
-    
-    mem_zip = BytesIO()
-    with zipfile.ZipFile(mem_zip, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
-        
-        # 1. Student Data (Marks + Mapping)
-        sb = BytesIO()
-        # --- NEW DETAILED SAMPLE DATA ---
-        df_marks = pd.DataFrame({
-            "USN": ["1RV01", "1RV02", "1RV03"],
-            "STUDENT NAME": ["Student A", "Student B", "Student C"],
-            "T1_Q1a_Marks": [6, 4, 3],
-            "T1_Q1b_Marks": [4, 2, 1],
-            "T1_Q2a_Marks": [5, 4, 2],
-            "T1_Q2b_Marks": [5, 5, 3],
-            "T2_Q1a_Marks": [6, 5, 4],
-            "T2_Q1b_Marks": [4, 3, 2],
-            "T2_Q2a_Marks": [5, 4, 3],
-            "T2_Q2b_Marks": [5, 4, 2],
-            "ASSIGN_Q1_Marks": [10, 8, 5],
-            "ASSIGN_Q2_Marks": [10, 7, 4],
-            "SEE_Q1a_Marks": [6, 5, 4],
-            "SEE_Q1b_Marks": [4, 3, 2],
-            "SEE_Q1c_Marks": [10, 8, 6],
-            "SEE_Q2a_Marks": [10, 7, 5]
-        })
-        df_tool_map = pd.DataFrame({
-            "Tool_Question": ["T1_Q1a", "T1_Q1b", "T1_Q2a", "T1_Q2b", 
-                              "T2_Q1a", "T2_Q1b", "T2_Q2a", "T2_Q2b", 
-                              "ASSIGN_Q1", "ASSIGN_Q2", 
-                              "SEE_Q1a", "SEE_Q1b", "SEE_Q1c", "SEE_Q2a"],
-            "CO": ["CO1", "CO1", "CO2", "CO2",
-                   "CO1", "CO1", "CO3", "CO3",
-                   "CO1", "CO2",
-                   "CO1", "CO1", "CO2", "CO3"],
-            "Max_Marks": [6, 4, 5, 5, 
-                          6, 4, 5, 5, 
-                          10, 10, 
-                          6, 4, 10, 10],
-            "Assessment_Type": ["CIE", "CIE", "CIE", "CIE",
-                                "CIE", "CIE", "CIE", "CIE",
-                                "CIE", "CIE",
-                                "SEE", "SEE", "SEE", "SEE"]
-        })
-        # --- END NEW DETAILED SAMPLE DATA ---
-
-        with pd.ExcelWriter(sb, engine='openpyxl') as writer:
-            # Write Marks
-            sheet_marks_name = "1_Student_Marks"
-            df_marks.to_excel(writer, sheet_name=sheet_marks_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_marks_name, college_name, dept_name, course_code, len(df_marks.columns))
-            
-            # Write Tool Mapping
-            sheet_map_name = "2_Tool_CO_Mapping"
-            df_tool_map.to_excel(writer, sheet_name=sheet_map_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_map_name, college_name, dept_name, course_code, len(df_tool_map.columns))
-
-        sb.seek(0)
-        z.writestr(f'{course_code}_student_data_sample.xlsx', sb.getvalue()) 
-
-        # 2. CO-PO Mapping
-        cb = BytesIO()
-        po_names = [f'PO{i}' for i in range(1, 12)]
-        pso_names = [f'PSO{i}' for i in range(1, 3)]
-        all_cols = ['CO'] + po_names + pso_names
-        data = {
-            'CO': ['CO1', 'CO2', 'CO3'],
-            'PO1': [3, 1, 0], 'PO2': [1, 2, 3], 'PO3': [2, 3, 1], 'PO4': [0, 1, 2],
-            'PO5': [1, 0, 3], 'PO6': [3, 2, 1], 'PO7': [2, 1, 0], 'PO8': [1, 3, 2],
-            'PO9': [2, 0, 1], 'PO10': [0, 2, 3], 'PO11': [3, 1, 2],
-            'PSO1': [2, 3, 1], 'PSO2': [1, 1, 2]
-        }
-        df_copom = pd.DataFrame(data, columns=all_cols)
-
-        with pd.ExcelWriter(cb, engine='openpyxl') as writer:
-            sheet_name = "CO_PO_Mapping"
-            df_copom.to_excel(writer, sheet_name=sheet_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_name, college_name, dept_name, course_code, len(df_copom.columns))
-            
-        cb.seek(0)
-        z.writestr(f'{course_code}_co_po_mapping_sample.xlsx', cb.getvalue()) 
-
-        # 3. Survey
-        sb2 = BytesIO()
-        df_survey = pd.DataFrame({
-            "USN": ["1RV01", "1RV02", "1RV03"],
-            "CO1_Rating": [3, 2, 3],
-            "CO2_Rating": [2, 1, 2],
-            "CO3_Rating": [3, 2, 3]
-        })
-        with pd.ExcelWriter(sb2, engine='openpyxl') as writer:
-            sheet_name = "Survey"
-            df_survey.to_excel(writer, sheet_name=sheet_name, index=False, startrow=5)
-            write_metadata_to_sheet(writer, sheet_name, college_name, dept_name, course_code, len(df_survey.columns))
-            
-        sb2.seek(0)
-        z.writestr(f'{course_code}_survey_data_sample.xlsx', sb2.getvalue()) 
-
-    mem_zip.seek(0)
-    return send_file(mem_zip, as_attachment=True,
-                     download_name=f'{course_code}_all_samples.zip', 
-                     mimetype='application/zip')
+    cn, dn, cc = sample_header()
+    return sample_response(sample_zip_bytes(cn, dn, cc), 'application/zip', f'{cc}_all_samples.zip')
+
+
+def create_app(config=None):
+    """Application factory: a Flask app with DEFAULT_CONFIG, then `config`, and every route.
+
+    Importing this module stays cheap (pandas, numpy and openpyxl load on
+    first use); with PRELOAD_HEAVY_MODULES they are imported here instead,
+    which is what a pre-forking server wants:
+        gunicorn --preload -w 4 'app:create_app({"PRELOAD_HEAVY_MODULES": True})'
+    The caches, stores and job queue are per process and configured by the
+    first app that uses them, so run one app per process.
+    """
+    flask_app = Flask(__name__)
+    flask_app.request_class = UploadRequest
+    flask_app.config.update(DEFAULT_CONFIG)
+    flask_app.config.update(config or {})
+    flask_app.register_blueprint(bp)
+    if flask_app.config['PRELOAD_HEAVY_MODULES']:
+        preload_heavy_modules()
+    return flask_app
+
+
+# the default app, for `python app.py`, `flask run`, `gunicorn app:app`, batch.py and the benchmarks
+app = create_app()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+"""Command-line batch mode: compute attainment for every course in a folder or ZIP.
+
+Usage:
+    python batch.py COURSES_DIR_OR_ZIP -o results.xlsx [--workers 8] [--threshold 60]
+                    [--program BE-CSE --year 2021-25] [--survey responses.csv [--survey-scale 5]]
+
+Each course needs three workbooks named like the downloadable samples
+(CS82_student_data.xlsx, CS82_co_po_mapping.xlsx, CS82_survey.xlsx), either
+side by side or inside a folder named after the course. With --program and
+--year the results are also stored for the program-level rollup (/rollup).
+--survey takes one survey export (CSV, one row per answer with Course, CO
+and Rating columns) for every course that has no survey workbook; ratings
+on a 1..N scale are mapped onto 1-3 with --survey-scale N.
+"""
+import argparse
+import os
+import sys
+import zipfile
+
+from app import attach_shared_survey, build_batch_workbook, get_rollup_store, group_batch_files, run_batch
+
+
+def collect_courses(source):
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as z:
+            courses = group_batch_files(z.namelist())
+            return {course_code: {role: z.read(name) for role, name in sources.items()}
+                    for course_code, sources in courses.items()}
+
+    paths = [os.path.join(root, name)
+             for root, _, names in os.walk(source) for name in names]
+    return group_batch_files(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch CO-PO attainment for many courses.")
+    parser.add_argument('source', help="folder or ZIP containing the per-course workbooks")
+    parser.add_argument('-o', '--output', default='CO_PO_Batch_Results.xlsx')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--threshold', type=float, default=60)
+    parser.add_argument('--level3-pct', type=float, default=70)
+    parser.add_argument('--level2-pct', type=float, default=55)
+    parser.add_argument('--level1-pct', type=float, default=40)
+    parser.add_argument('--cie-weight', type=float, default=60)
+    parser.add_argument('--see-weight', type=float, default=40)
+    parser.add_argument('--direct-weight', type=float, default=0.8)
+    parser.add_argument('--indirect-weight', type=float, default=0.2)
+    parser.add_argument('--college-name', default='College Name')
+    parser.add_argument('--department-name', default='Department Name')
+    parser.add_argument('--program', help="store results in the program rollup under this program")
+    parser.add_argument('--year', help="batch year for --program (e.g. 2021-25)")
+    parser.add_argument('--survey', help="survey CSV covering many courses (long format)")
+    parser.add_argument('--survey-scale', type=float, default=None,
+                        help="top of the --survey rating scale, e.g. 5 for 1-5 (default: 3)")
+    args = parser.parse_args(argv)
+    if bool(args.program) != bool(args.year):
+        parser.error("--program and --year go together")
+
+    courses = collect_courses(args.source)
+    if not courses:
+        print(f"No course workbooks found in {args.source}", file=sys.stderr)
+        return 1
+    if args.survey:
+        scale = (1, args.survey_scale) if args.survey_scale else None
+        attach_shared_survey(courses, args.survey, scale=scale)
+
+    params = {
+        'threshold_percentage': args.threshold,
+        'thr3_pct': args.level3_pct,
+        'thr2_pct': args.level2_pct,
+        'thr1_pct': args.level1_pct,
+        'cie_weight': args.cie_weight,
+        'see_weight': args.see_weight,
+        'direct_weight': args.direct_weight,
+        'indirect_weight': args.indirect_weight,
+    }
+    results = run_batch(courses, params, max_workers=args.workers)
+
+    with open(args.output, 'wb') as f:
+        f.write(build_batch_workbook(results, cn=args.college_name, dn=args.department_name))
+
+    if args.program:
+        get_rollup_store().save_courses(args.program, args.year,
+                                        [r for r in results if r['status'] == 'ok'])
+
+    for r in results:
+        detail = f"{r['students']} students" if r['status'] == 'ok' else r['error']
+        print(f"{r['course']:<20} {r['status']:<6} {detail}")
+    failed = sum(r['status'] != 'ok' for r in results)
+    print(f"{len(results) - failed}/{len(results)} courses written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Load-time / peak-RSS benchmark for the student workbook read path.
+
+Compares the old `pd.read_excel(..., sheet_name=None)` load against
+`parse_student_workbook` (two sheets, USN + *_Marks columns as one compact
+uint8/float32 block) with
+each available engine. Every variant runs in a fresh subprocess so the
+peak RSS numbers do not leak into each other.
+
+Usage:
+    python benchmarks/bench_load.py [--rows 5000] [--cols 400] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+
+def make_workbook(path, rows, cols):
+    import pandas as pd
+    from synthetic import make_cohort
+
+    df_marks, df_tool_map, _, _ = make_cohort(students=rows, questions=cols, tools=5, cos=6,
+                                              absent_rate=0)
+    df_marks['REMARKS'] = 'free text that the pipeline never reads'
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        df_marks.to_excel(writer, sheet_name='1_Student_Marks', index=False)
+        df_tool_map.to_excel(writer, sheet_name='2_Tool_CO_Mapping', index=False)
+        df_tool_map.to_excel(writer, sheet_name='Notes', index=False)
+
+
+def peak_rss_kb():
+    # VmHWM belongs to the current address space; ru_maxrss survives exec and
+    # would report the parent's peak from building the workbook
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(mode, path, repeat):
+    import pandas as pd
+    import app
+
+    rss_before = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if mode == 'read_excel_all_sheets':
+            sheets = pd.read_excel(path, sheet_name=None, engine='openpyxl')
+            df_marks = sheets['1_Student_Marks']
+        else:
+            app.EXCEL_ENGINE = mode.split(':')[1]
+            df_marks = app.parse_student_workbook(path)['1_Student_Marks']
+        timings.append(time.perf_counter() - start)
+        marks_mb = df_marks.memory_usage(deep=True).sum() / 2 ** 20
+        del df_marks
+    rss_after = peak_rss_kb()
+    print(json.dumps({
+        'mode': mode,
+        'best_s': min(timings),
+        'peak_rss_growth_mb': (rss_after - rss_before) / 1024,
+        'marks_frame_mb': marks_mb,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--cols', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.repeat)
+        return
+
+    import importlib.util
+    modes = ['read_excel_all_sheets', 'parse_student_workbook:openpyxl']
+    if importlib.util.find_spec('python_calamine') is not None:
+        modes.append('parse_student_workbook:calamine')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'marks.xlsx')
+        print(f'building {args.rows} x {args.cols} marks workbook...')
+        make_workbook(path, args.rows, args.cols)
+        print(f'{"mode":<34}{"best (s)":>10}{"peak RSS +MB":>14}{"marks MB":>10}')
+        for mode in modes:
+            out = subprocess.run([sys.executable, __file__, '--repeat', str(args.repeat),
+                                  '--child', mode, path],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f'{r["mode"]:<34}{r["best_s"]:>10.2f}{r["peak_rss_growth_mb"]:>14.1f}'
+                  f'{r["marks_frame_mb"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Stage-by-stage benchmark of the attainment pipeline on a synthetic cohort.
+
+Times the pure functions (parsing, per-tool attainment, direct/indirect/PO,
+report and per-student export) and the HTTP routes through the Flask test
+client, records traced peak memory per stage, and writes everything to JSON.
+Pass --baseline with an earlier JSON file to compare and fail on regressions.
+
+Usage:
+    python benchmarks/bench_pipeline.py --students 2000 --questions 300 --tools 8 --cos 6 \\
+        --output bench.json [--baseline old.json --tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import app as copo  # noqa: E402
+from synthetic import cohort_workbooks, make_cohort  # noqa: E402
+
+
+def measure(fn, repeat, setup=None):
+    """Best/median wall time over `repeat` runs, then one traced run for peak memory."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def build_stages(args):
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(
+        students=args.students, questions=args.questions, tools=args.tools,
+        cos=args.cos, pos=args.pos, seed=args.seed
+    )
+    all_data, co_po_bytes, survey_bytes = cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)
+    params = copo.read_pipeline_params({})
+    # what load_course_inputs hands the pipeline
+    df_marks = copo.CourseMarks.from_frame(df_marks)
+    df_tool_map['CO'] = df_tool_map['CO'].astype(str)
+    tool_prefixes = df_tool_map['Tool_Question'].str.split('_', expand=True)[0].unique()
+
+    tool_attainments = copo.calculate_all_tool_co_attainments(
+        df_marks, df_tool_map, tool_prefixes, params['threshold_percentage'],
+        params['thr3_pct'], params['thr2_pct'], params['thr1_pct'])
+    final_direct = copo.calculate_final_direct_co_attainment_weighted(
+        tool_attainments, df_tool_map, params['cie_weight'], params['see_weight'])
+    results = copo.run_calculation_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **params)
+    results_dfs = dict(zip(['Direct_CO', 'Indirect_CO', 'Final_CO', 'Final_PO'], results))
+
+    def clear_parse_cache():
+        copo.get_parse_cache().clear()
+
+    client = copo.app.test_client()
+
+    def upload_form(**extra):
+        from io import BytesIO
+        return {
+            'all_data_file': (BytesIO(all_data), 'student_data.xlsx'),
+            'co_po_mapping_file': (BytesIO(co_po_bytes), 'co_po_mapping.xlsx'),
+            'survey_file': (BytesIO(survey_bytes), 'survey.xlsx'),
+            **extra,
+        }
+
+    def post_calculate():
+        response = client.post('/calculate', data=upload_form())
+        assert b'critical error' not in response.data, 'calculation failed'
+        return response
+
+    def download_report():
+        # a fresh calculation every time so the report is always built, never memoized
+        page = post_calculate().get_data(as_text=True)
+        result_id = page.split('/download_results/', 1)[1].split('"', 1)[0]
+        start = time.perf_counter()
+        client.get(f'/download_results/{result_id}').get_data()
+        return time.perf_counter() - start
+
+    def post_export():
+        response = client.post('/export_student_attainment', data=upload_form(export_format='csv'))
+        for _ in response.response:
+            pass
+
+    pure = {
+        'parse_inputs': (lambda: copo.load_course_inputs(all_data, co_po_bytes, survey_bytes),
+                         clear_parse_cache),
+        'tool_co_attainment': (lambda: copo.calculate_all_tool_co_attainments(
+            df_marks, df_tool_map, tool_prefixes, params['threshold_percentage'],
+            params['thr3_pct'], params['thr2_pct'], params['thr1_pct']), None),
+        'direct_co': (lambda: copo.calculate_final_direct_co_attainment_weighted(
+            tool_attainments, df_tool_map, params['cie_weight'], params['see_weight']), None),
+        'indirect_co': (lambda: copo.calculate_indirect_co_attainment(df_survey), None),
+        'po_attainment': (lambda: copo.calculate_po_attainment(final_direct, df_co_po), None),
+        'run_calculation_pipeline': (lambda: copo.run_calculation_pipeline(
+            df_marks, df_tool_map, df_co_po, df_survey, **params), None),
+        'build_results_workbook': (lambda: copo.build_results_workbook(
+            results_dfs, 'College', 'Dept', 'CC'), None),
+        'student_export_csv': (lambda: sum(len(part) for part in copo.stream_student_csv(
+            copo.iter_student_co_scores(df_marks, df_tool_map, params['threshold_percentage']))), None),
+    }
+    http = {
+        'http_calculate_cold': (post_calculate, clear_parse_cache),
+        'http_calculate_warm': (post_calculate, None),
+        'http_export_students': (post_export, None),
+    }
+    return pure, http, download_report
+
+
+def compare(current, baseline, tolerance, min_delta):
+    print(f'\n{"stage":<28}{"baseline s":>12}{"now s":>10}{"ratio":>8}')
+    regressions = []
+    for name, stats in current['stages'].items():
+        old = baseline['stages'].get(name)
+        if not old:
+            continue
+        ratio = stats['best_s'] / old['best_s'] if old['best_s'] else float('inf')
+        flag = ''
+        # tiny stages are all noise; only flag slowdowns that are also measurable
+        if ratio > 1 + tolerance and stats['best_s'] - old['best_s'] > min_delta:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<28}{old["best_s"]:>12.4f}{stats["best_s"]:>10.4f}{ratio:>8.2f}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--questions', type=int, default=300)
+    parser.add_argument('--tools', type=int, default=8)
+    parser.add_argument('--cos', type=int, default=6)
+    parser.add_argument('--pos', type=int, default=11)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-http', action='store_true', help="only benchmark the pure functions")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="earlier JSON output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown vs the baseline before failing (0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help="ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    print(f'cohort: {args.students} students x {args.questions} questions, '
+          f'{args.tools} tools, {args.cos} COs, {args.pos} POs')
+    pure, http, download_report = build_stages(args)
+    stages = dict(pure)
+    if not args.skip_http:
+        stages.update(http)
+
+    results = {}
+    print(f'{"stage":<28}{"best s":>10}{"median s":>10}{"peak MB":>10}')
+    for name, (fn, setup) in stages.items():
+        results[name] = measure(fn, args.repeat, setup)
+        r = results[name]
+        print(f'{name:<28}{r["best_s"]:>10.4f}{r["median_s"]:>10.4f}{r["peak_mb"]:>10.1f}')
+    if not args.skip_http:
+        timings = [download_report() for _ in range(args.repeat)]
+        results['http_download_results'] = {'best_s': min(timings),
+                                            'median_s': statistics.median(timings),
+                                            'peak_mb': None}
+        print(f'{"http_download_results":<28}{min(timings):>10.4f}{statistics.median(timings):>10.4f}')
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'cohort': {k: getattr(args, k) for k in ('students', 'questions', 'tools', 'cos', 'pos', 'seed')},
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'excel_engine': copo.EXCEL_ENGINE,
+        },
+        'stages': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'\nwritten to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta']['cohort'] != output['meta']['cohort']:
+            print('warning: baseline was run on a different cohort size')
+        regressions = compare(output, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f'\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Cold-start benchmark: import time, time to first request and per-worker memory.
+
+Compares the default lazy start (pandas, numpy and openpyxl imported on first
+use) with create_app({'PRELOAD_HEAVY_MODULES': True}), which imports them up
+front like the app used to. Every variant runs in a fresh interpreter:
+
+- import: wall time of `import app` alone, and of the whole process
+  (`python -c "import app"`, interpreter start-up included)
+- first request: GET / right after the import, then the first request that
+  needs pandas/openpyxl (a sample workbook download)
+- fork: a master imports the app (preloading or not) and forks --workers
+  workers, like gunicorn --preload; each serves GET / and then a sample
+  download, and reports its RSS and private (unshared) memory after each
+  from /proc (Linux only)
+
+--importtime prints the slowest imports of `python -X importtime -c "import app"`.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--workers 4] [--importtime 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+MODES = ['lazy', 'preload']
+
+
+def proc_memory_mb():
+    """(RSS, private memory) of this process in MB, from /proc; (0, 0) elsewhere."""
+    values = {}
+    for path, keys in (('/proc/self/status', ('VmRSS',)),
+                       ('/proc/self/smaps_rollup', ('Private_Clean', 'Private_Dirty'))):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key = line.split(':', 1)[0]
+                    if key in keys:
+                        values[key] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return values.get('VmRSS', 0), values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def start_app(mode):
+    import app
+    flask_app = app.create_app({'PRELOAD_HEAVY_MODULES': mode == 'preload'})
+    return flask_app.test_client()
+
+
+def run_child(mode):
+    start = time.perf_counter()
+    client = start_app(mode)
+    imported = time.perf_counter()
+    assert client.get('/').status_code == 200
+    first_request = time.perf_counter()
+    rss_first, _ = proc_memory_mb()
+    assert client.get('/download_sample/student').status_code == 200
+    first_compute = time.perf_counter()
+    rss_compute, _ = proc_memory_mb()
+    print(json.dumps({
+        'import_s': imported - start,
+        'first_request_s': first_request - imported,
+        'first_compute_s': first_compute - first_request,
+        'rss_first_mb': rss_first,
+        'rss_compute_mb': rss_compute,
+    }))
+
+
+def run_fork_child(mode, workers):
+    client = start_app(mode)
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client.get('/')
+            after_index = proc_memory_mb()
+            client.get('/download_sample/student')
+            os.write(write_fd, json.dumps([*after_index, *proc_memory_mb()]).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps({
+        'rss_mb': statistics.mean(r[0] for r in results),
+        'private_mb': statistics.mean(r[1] for r in results),
+        'rss_calc_mb': statistics.mean(r[2] for r in results),
+        'private_calc_mb': statistics.mean(r[3] for r in results),
+    }))
+
+
+def child_json(*args):
+    out = subprocess.run([sys.executable, __file__, *args], check=True, capture_output=True,
+                         text=True, cwd=APP_DIR).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def process_import_s(mode, repeat):
+    code = 'import app'
+    if mode == 'preload':
+        code += '; app.preload_heavy_modules()'
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=APP_DIR)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def print_importtime(top):
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], check=True,
+                         capture_output=True, text=True, cwd=APP_DIR).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.rstrip()))
+    print('\nslowest imports of `import app` (cumulative):')
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f'{cumulative_us / 1000:>10.1f} ms  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help="also list the N slowest imports")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--fork-child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    if args.child:
+        run_child(args.child)
+        return
+    if args.fork_child:
+        run_fork_child(args.fork_child, args.workers)
+        return
+
+    print(f'{"mode":<10}{"process (s)":>12}{"import (s)":>12}{"GET / (s)":>11}{"first calc (s)":>16}'
+          f'{"RSS / MB":>10}{"RSS calc MB":>13}')
+    for mode in MODES:
+        runs = [child_json('--child', mode) for _ in range(args.repeat)]
+        best = {key: min(r[key] for r in runs) for key in runs[0]}
+        print(f'{mode:<10}{process_import_s(mode, args.repeat):>12.3f}{best["import_s"]:>12.3f}'
+              f'{best["first_request_s"]:>11.3f}{best["first_compute_s"]:>16.3f}'
+              f'{best["rss_first_mb"]:>10.1f}{best["rss_compute_mb"]:>13.1f}')
+
+    if hasattr(os, 'fork'):
+        print(f'\n{args.workers} forked workers (mean per worker, MB):')
+        print(f'{"mode":<10}{"RSS /":>10}{"private /":>12}{"RSS calc":>10}{"private calc":>14}')
+        for mode in MODES:
+            r = child_json('--fork-child', mode, '--workers', str(args.workers))
+            print(f'{mode:<10}{r["rss_mb"]:>10.1f}{r["private_mb"]:>12.1f}'
+                  f'{r["rss_calc_mb"]:>10.1f}{r["private_calc_mb"]:>14.1f}')
+
+    if args.importtime:
+        print_importtime(args.importtime)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Concurrency check of the attainment pipeline: many threads, different courses, one process.
+
+Builds --courses synthetic courses (each with its own marks, Section column
+and threshold), computes them one after another for reference, then runs
+them from a pool of --threads threads for --rounds rounds, every round in a
+new shuffled order with each course twice. Every threaded result must equal
+its course's serial one, and no input (marks matrix, tool map, CO-PO
+mapping, survey) may have changed, dtypes included. Reports the serial and
+threaded wall times; the speed-up depends on how many cores there are.
+
+Exits non-zero on any wrong result or changed input, so it can run as a
+regression check before serving with threaded workers.
+
+Usage:
+    python benchmarks/bench_threads.py [--courses 8] [--threads 8] [--students 20000] [--questions 300]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+
+def build_courses(args):
+    import numpy as np
+
+    import app as copo
+    from synthetic import make_cohort
+
+    courses = []
+    for i in range(args.courses):
+        df_marks, df_tool_map, df_co_po, df_survey = make_cohort(
+            students=args.students, questions=args.questions, tools=6, cos=6, seed=i)
+        df_marks.insert(1, 'Section', np.resize(['A', 'B', 'C'], len(df_marks)))
+        df_tool_map['CO'] = df_tool_map['CO'].astype(object)  # so a dtype change would show
+        params = copo.read_pipeline_params({'threshold': 40 + i % 30})
+        courses.append((copo.CourseMarks.from_frame(df_marks), df_tool_map, df_co_po, df_survey, params))
+    return courses
+
+
+def input_state(course):
+    """A deep copy of everything the pipeline is handed."""
+    course_marks, *frames, _ = course
+    return course_marks.marks.copy(), [df.copy(deep=True) for df in frames]
+
+
+def unchanged(course, state):
+    import numpy as np
+
+    course_marks, *frames, _ = course
+    marks, copies = state
+    return np.array_equal(course_marks.marks, marks) and all(
+        df.equals(copy) and df.dtypes.equals(copy.dtypes) for df, copy in zip(frames, copies))
+
+
+def result_key(result):
+    """Comparable text of a CourseAttainment (repr, so NaN levels compare equal)."""
+    return repr(([dict(levels) for levels in result.combined],
+                 {section: [dict(levels) for levels in tables] for section, tables in result.sections.items()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courses', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--questions', type=int, default=300)
+    args = parser.parse_args()
+
+    import app as copo
+
+    copo.preload_heavy_modules()
+    print(f'building {args.courses} courses of {args.students} students x {args.questions} questions...')
+    courses = build_courses(args)
+    states = [input_state(course) for course in courses]
+
+    def run(i):
+        course_marks, df_tool_map, df_co_po, df_survey, params = courses[i]
+        return copo.run_section_pipeline(course_marks, df_tool_map, df_co_po, df_survey, **params)
+
+    start = time.perf_counter()
+    expected = [result_key(run(i)) for i in range(args.courses)]
+    serial_s = time.perf_counter() - start
+
+    wrong = 0
+    threaded_s = []
+    with ThreadPoolExecutor(args.threads) as pool:
+        for _ in range(args.rounds):
+            order = list(range(args.courses)) * 2
+            random.shuffle(order)
+            start = time.perf_counter()
+            results = list(pool.map(run, order))
+            threaded_s.append(time.perf_counter() - start)
+            wrong += sum(result_key(result) != expected[i] for i, result in zip(order, results))
+    changed = sum(not unchanged(course, state) for course, state in zip(courses, states))
+
+    # a round computes every course twice
+    best_threaded = min(threaded_s) / 2
+    print(f'{os.cpu_count()} CPUs, {args.threads} threads')
+    print(f'serial   {serial_s:>8.2f} s')
+    print(f'threaded {best_threaded:>8.2f} s  (best round, per pass over the courses; x{serial_s / best_threaded:.2f})')
+    print(f'wrong results {wrong} of {args.rounds * 2 * args.courses}, changed inputs {changed} of {args.courses}')
+    sys.exit(1 if wrong or changed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Concurrent large uploads: peak server RSS with uploads spooled to disk or kept in memory.
+
+For each mode the app runs under Werkzeug's threaded server in a fresh
+subprocess, and --concurrency clients post a --students x --questions
+student workbook to /api/v1/calculate at the same time. The workbook's
+marks sheet is renamed, so upload validation turns it away after reading
+only the ZIP directory: what is measured is the upload path (multipart
+parsing, hashing, spooling, handing the file to openpyxl), not the
+calculation. Modes:
+
+- spooled: the default UPLOAD_* settings (past UPLOAD_SPOOL_BYTES a file
+  goes to a temp file, which the parsers read memory-mapped)
+- in_memory: UPLOAD_SPOOL_BYTES raised to the per-file limit, so every
+  upload stays in the worker's heap, as all uploads used to
+
+Each mode reports the server's peak RSS growth (from /proc, Linux only).
+The spooled server is also sent one file over UPLOAD_MAX_FILE_BYTES, which
+must get a 413. With --max-growth-mb N the script exits non-zero when the
+spooled server grows by more than N MB, so it can run as a regression check.
+
+Usage:
+    python benchmarks/bench_uploads.py [--concurrency 16] [--students 10000] [--questions 200]
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from io import BytesIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+MODES = ['spooled', 'in_memory']
+UPLOAD_FIELDS = ['all_data_file', 'co_po_mapping_file', 'survey_file']
+
+
+def rejected_workbooks(students, questions):
+    """The three upload files, with the marks sheet renamed so validation rejects the student workbook."""
+    from synthetic import cohort_workbooks, make_cohort
+
+    student, co_po, survey = cohort_workbooks(*make_cohort(students=students, questions=questions,
+                                                           tools=6, cos=6))
+    renamed = BytesIO()
+    with zipfile.ZipFile(BytesIO(student)) as src, zipfile.ZipFile(renamed, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename == 'xl/workbook.xml':
+                data = data.replace(b'1_Student_Marks', b'Marks')
+            dst.writestr(info, data)
+    return [renamed.getvalue(), co_po, survey]
+
+
+def serve(mode, port, max_file_mb):
+    import app
+    from werkzeug.serving import run_simple
+
+    config = {'PRELOAD_HEAVY_MODULES': True, 'UPLOAD_MAX_FILE_BYTES': max_file_mb * 2 ** 20}
+    if mode == 'in_memory':
+        config['UPLOAD_SPOOL_BYTES'] = config['UPLOAD_MAX_FILE_BYTES']
+    run_simple('127.0.0.1', port, app.create_app(config), threaded=True)
+
+
+def proc_status_mb(pid, key):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post_files(port, files):
+    """Posts the files as one multipart request, streamed in 64 KB chunks; returns the status."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, data in zip(UPLOAD_FIELDS, files):
+        parts += [(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{field}.xlsx"\r\n'
+                   'Content-Type: application/octet-stream\r\n\r\n').encode(), data, b'\r\n']
+    parts.append(f'--{boundary}--\r\n'.encode())
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    connection.putrequest('POST', '/api/v1/calculate')
+    connection.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+    connection.putheader('Content-Length', str(sum(map(len, parts))))
+    connection.endheaders()
+    try:
+        for part in parts:
+            for start in range(0, len(part), 65536):
+                connection.send(part[start:start + 65536])
+    except OSError:
+        pass  # the server may answer (413) and close before the body is sent
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+def run_mode(mode, files, args):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, __file__, '--serve', mode, str(port),
+                               '--max-file-mb', str(args.max_file_mb)],
+                              cwd=APP_DIR, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(300):
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        post_files(port, [b'PK\x03\x04', b'PK\x03\x04', b'PK\x03\x04'])  # warm up
+        rss_before = proc_status_mb(server.pid, 'VmRSS')
+
+        statuses = [None] * args.concurrency
+
+        def client(i):
+            statuses[i] = post_files(port, files)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        result = {
+            'seconds': elapsed,
+            'peak_growth_mb': proc_status_mb(server.pid, 'VmHWM') - rss_before,
+            'statuses': sorted(set(statuses)),
+        }
+        if mode == 'spooled':
+            oversized = os.urandom(args.max_file_mb * 2 ** 20 + 1)
+            result['oversized_status'] = post_files(port, [oversized, files[1], files[2]])
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--max-file-mb', type=int, default=50)
+    parser.add_argument('--max-growth-mb', type=float, default=None,
+                        help="exit 1 if the spooled server's peak RSS grows by more than this")
+    parser.add_argument('--serve', nargs=2, metavar=('MODE', 'PORT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]), args.max_file_mb)
+        return
+
+    print(f'building a {args.students} x {args.questions} student workbook...')
+    files = rejected_workbooks(args.students, args.questions)
+    upload_mb = sum(map(len, files)) / 2 ** 20
+    print(f'{args.concurrency} concurrent uploads of {upload_mb:.1f} MB '
+          f'({args.concurrency * upload_mb:.0f} MB in total)')
+    print(f'{"mode":<12}{"time (s)":>10}{"peak RSS +MB":>14}  statuses')
+    failed = False
+    for mode in MODES:
+        r = run_mode(mode, files, args)
+        print(f'{mode:<12}{r["seconds"]:>10.2f}{r["peak_growth_mb"]:>14.1f}  {r["statuses"]}')
+        if r['statuses'] != [400]:
+            print('  expected every upload to be rejected with 400')
+            failed = True
+        if mode == 'spooled':
+            print(f'  file over {args.max_file_mb} MB: {r["oversized_status"]}')
+            failed |= r['oversized_status'] != 413
+            if args.max_growth_mb is not None and r['peak_growth_mb'] > args.max_growth_mb:
+                print(f'  peak RSS grew by more than {args.max_growth_mb} MB')
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Write time / peak-RSS benchmark of the report writers (see REPORT_WRITERS).
+
+Two workloads on a synthetic cohort, each with every installed writer:
+
+- student_export: the streamed per-student Excel export
+  (stream_student_xlsx, students x tools x COs rows)
+- report: a results workbook whose sheet holds the whole marks table
+  (setup_results_sheet, students x questions cells), i.e. a large report
+  sheet with the metadata header, widths and chart
+
+Every variant runs in a fresh subprocess so the peak RSS numbers do not leak
+into each other.
+
+Usage:
+    python benchmarks/bench_writers.py [--students 10000] [--questions 60] [--repeat 1]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+WORKLOADS = ['student_export', 'report']
+
+
+def peak_rss_kb():
+    # VmHWM belongs to the current address space; ru_maxrss survives exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(workload, writer_name, args):
+    import app
+    from synthetic import make_cohort
+
+    df_marks, df_tool_map, _, _ = make_cohort(students=args.students, questions=args.questions,
+                                              tools=args.tools, cos=args.cos)
+    app.app.config['REPORT_WRITER'] = writer_name
+    writer_class = app.REPORT_WRITERS[writer_name]
+
+    def student_export():
+        chunks = app.iter_student_co_scores(df_marks, df_tool_map, 60, chunk_rows=2000)
+        return sum(len(block) for block in
+                   app.stream_student_xlsx(chunks, 'College', 'Dept', 'CS82', writer_class))
+
+    def report():
+        with app.app.app_context():
+            return len(app.build_results_workbook({'Marks': df_marks}, 'College', 'Dept', 'CS82'))
+
+    run = {'student_export': student_export, 'report': report}[workload]
+    app.preload_heavy_modules()
+    if writer_name == 'xlsxwriter':
+        import xlsxwriter  # noqa: F401
+    rss_before = peak_rss_kb()
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        size = run()
+        timings.append(time.perf_counter() - start)
+    print(json.dumps({
+        'best_s': min(timings),
+        'peak_rss_growth_mb': (peak_rss_kb() - rss_before) / 1024,
+        'xlsx_mb': size / 2 ** 20,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=60)
+    parser.add_argument('--tools', type=int, default=6)
+    parser.add_argument('--cos', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--child', nargs=2, metavar=('WORKLOAD', 'WRITER'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, args)
+        return
+
+    import importlib.util
+    writers = ['openpyxl']
+    if importlib.util.find_spec('xlsxwriter') is not None:
+        writers.append('xlsxwriter')
+    else:
+        print('xlsxwriter is not installed; only openpyxl is measured')
+
+    print(f'{args.students} students x {args.questions} questions '
+          f'({args.tools} tools, {args.cos} COs)')
+    print(f'{"workload":<16}{"writer":<12}{"best (s)":>10}{"peak RSS +MB":>14}{"xlsx MB":>9}')
+    for workload in WORKLOADS:
+        for writer_name in writers:
+            out = subprocess.run([sys.executable, __file__, '--students', str(args.students),
+                                  '--questions', str(args.questions), '--tools', str(args.tools),
+                                  '--cos', str(args.cos), '--repeat', str(args.repeat),
+                                  '--child', workload, writer_name],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f'{workload:<16}{writer_name:<12}{r["best_s"]:>10.2f}{r["peak_rss_growth_mb"]:>14.1f}'
+                  f'{r["xlsx_mb"]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
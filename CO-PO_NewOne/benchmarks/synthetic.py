@@ -0,0 +1,87 @@
+"""Synthetic cohorts shaped like the /download_sample workbooks, at any size.
+
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=2000, questions=300)
+
+Tools are T1..Tn plus ASSIGN (CIE) and SEE, questions are spread over the
+tools round-robin and mapped to CO1..COc, and max marks cycle through the
+sample's 6/4/5/5/10 values. Everything is seeded, so two runs with the same
+arguments produce the same workbooks.
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+def tool_names(tools):
+    """SEE last, ASSIGN before it (when there is room), class tests T1.. first."""
+    if tools < 1:
+        raise ValueError("need at least one tool")
+    if tools == 1:
+        return ['SEE']
+    if tools == 2:
+        return ['T1', 'SEE']
+    return [f'T{i}' for i in range(1, tools - 1)] + ['ASSIGN', 'SEE']
+
+
+def make_cohort(students=60, questions=14, tools=4, cos=3, pos=11, psos=2,
+                absent_rate=0.02, seed=0):
+    """Returns (df_marks, df_tool_map, df_co_po, df_survey) in the sample file layout."""
+    rng = np.random.default_rng(seed)
+    names = tool_names(tools)
+
+    tool_of_question = [names[i % len(names)] for i in range(questions)]
+    counters = dict.fromkeys(names, 0)
+    question_ids = []
+    for tool in tool_of_question:
+        counters[tool] += 1
+        question_ids.append(f'{tool}_Q{counters[tool]}')
+    max_marks = np.resize([6, 4, 5, 5, 10], questions)
+
+    df_tool_map = pd.DataFrame({
+        'Tool_Question': question_ids,
+        'CO': [f'CO{i % cos + 1}' for i in range(questions)],
+        'Max_Marks': max_marks,
+        'Assessment_Type': ['SEE' if tool == 'SEE' else 'CIE' for tool in tool_of_question],
+    })
+
+    marks = rng.integers(0, max_marks + 1, size=(students, questions)).astype(float)
+    marks[rng.random((students, questions)) < absent_rate] = np.nan
+    df_marks = pd.DataFrame(marks, columns=[q + '_Marks' for q in question_ids])
+    df_marks.insert(0, 'USN', [f'1RV{i:05d}' for i in range(1, students + 1)])
+    df_marks.insert(1, 'STUDENT NAME', [f'Student {i}' for i in range(1, students + 1)])
+
+    co_names = [f'CO{i}' for i in range(1, cos + 1)]
+    outcome_cols = [f'PO{i}' for i in range(1, pos + 1)] + [f'PSO{i}' for i in range(1, psos + 1)]
+    df_co_po = pd.DataFrame(rng.integers(0, 4, size=(cos, len(outcome_cols))), columns=outcome_cols)
+    df_co_po.insert(0, 'CO', co_names)
+
+    df_survey = pd.DataFrame(rng.integers(1, 4, size=(students, cos)),
+                             columns=[f'{co}_Rating' for co in co_names])
+    df_survey.insert(0, 'USN', df_marks['USN'])
+
+    return df_marks, df_tool_map, df_co_po, df_survey
+
+
+def xlsx_bytes(sheets):
+    """A workbook with one sheet per {sheet name: DataFrame} entry (header on row 1, no index), as bytes."""
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return buf.getvalue()
+
+
+def cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey):
+    """The three upload files (student data, CO-PO mapping, survey) as xlsx bytes."""
+    return (
+        xlsx_bytes({'1_Student_Marks': df_marks, '2_Tool_CO_Mapping': df_tool_map}),
+        xlsx_bytes({'CO_PO_Mapping': df_co_po}),
+        xlsx_bytes({'Survey': df_survey}),
+    )
+
+
+def upload_files(sources):
+    """The three workbooks as the /calculate form's file fields (a Flask test client's data=)."""
+    return {field: (BytesIO(data), f'{field}.xlsx')
+            for field, data in zip(['all_data_file', 'co_po_mapping_file', 'survey_file'], sources)}
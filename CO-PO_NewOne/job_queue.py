@@ -0,0 +1,153 @@
+"""Background calculations: an SQLite-backed job queue run by worker threads (see app.get_job_queue)."""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+JOB_STAGES = ['queued', 'parsing', 'computing', 'rendering', 'done']
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT NOT NULL,
+    form TEXT NOT NULL, all_data BLOB, co_po_mapping BLOB, survey BLOB,
+    result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL,
+    heartbeat_at REAL);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class QueueFullError(RuntimeError):
+    """Too many jobs are queued or running; the client should retry later."""
+
+
+class JobQueue:
+    """/calculate requests queued in an SQLite file and run by a few worker threads.
+
+    Uploads are stored with the job, so queued work survives a restart, and
+    any process sharing the file can report a job's status. While a job runs
+    its worker stamps heartbeat_at every heartbeat_seconds; a running job
+    whose heartbeat is older than stale_seconds (its worker died) is picked
+    up again, however long a live calculation takes.
+
+    handler(form, blobs, progress) runs a job and returns its JSON-able
+    result; an exception it raises is stored as error_message(exception).
+    """
+
+    def __init__(self, path, workers, max_pending, stale_seconds, ttl_seconds, handler, heartbeat_seconds=30,
+                 error_message=str):
+        self.path = path
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.handler = handler
+        self.error_message = error_message
+        self._wake = threading.Event()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(JOB_SCHEMA)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'heartbeat_at' not in columns:  # a queue file from before heartbeats
+                conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _connect(self):
+        # one connection per call, closed with closing() (see result_store.SQLiteResultStore)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def submit(self, form, blobs=(None, None, None)):
+        """Queues a job and returns its ID, or raises QueueFullError."""
+        job_id = secrets.token_urlsafe(16)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')  # count and insert atomically across processes
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} calculations are already waiting")
+            conn.execute('INSERT INTO jobs (id, status, stage, form, all_data, co_po_mapping, survey, '
+                         'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (job_id, 'queued', 'queued', json.dumps(form), *blobs, now, now))
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < ?",
+                         (now - self.ttl_seconds,))
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.close()
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        """{'status', 'stage', 'progress', 'result', 'error'} for a job, or None."""
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute('SELECT status, stage, result, error FROM jobs WHERE id = ?',
+                               (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, stage, result, error = row
+        return {
+            'status': status,
+            'stage': stage,
+            'progress': JOB_STAGES.index(stage) / (len(JOB_STAGES) - 1),
+            'result': json.loads(result) if result else None,
+            'error': error,
+        }
+
+    def _claim(self):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'queued', updated_at = ?, heartbeat_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' "
+                "AND COALESCE(heartbeat_at, updated_at) < ?) ORDER BY created_at LIMIT 1) "
+                "RETURNING id, form, all_data, co_po_mapping, survey",
+                (now, now, now - self.stale_seconds)).fetchone()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                         (*fields.values(), job_id))
+
+    def _beat(self, job_id, done):
+        """Stamps heartbeat_at every heartbeat_seconds until `done` is set."""
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (time.time(), job_id))
+            except sqlite3.Error:
+                pass  # locked for a moment; the next beat will do
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+                if job is None:
+                    self._wake.wait(timeout=1.0)
+                    self._wake.clear()
+                    continue
+                self._run(*job)
+            except sqlite3.Error:
+                # database locked or gone for a moment; a stuck job is retried once stale
+                time.sleep(1.0)
+
+    def _run(self, job_id, form, *blobs):
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(job_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(json.loads(form), blobs,
+                                  lambda stage: self._update(job_id, stage=stage))
+        except Exception as e:
+            outcome = dict(status='error', error=self.error_message(e))
+        else:
+            outcome = dict(status='done', stage='done', result=json.dumps(result))
+        finally:
+            done.set()
+            heartbeat.join()
+        self._update(job_id, all_data=None, co_po_mapping=None, survey=None, **outcome)
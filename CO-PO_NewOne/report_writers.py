@@ -0,0 +1,193 @@
+"""Excel report writers: the same calls on openpyxl or xlsxwriter (see app.pick_report_writer).
+
+Each library is imported when a writer is created, so importing this module
+stays cheap.
+"""
+
+
+# Both writers take the same calls, made top to bottom (metadata rows, then
+# the table below them), which is the order xlsxwriter's constant_memory mode
+# needs. Rows and columns are 0-based except in the openpyxl internals.
+
+class OpenpyxlReportWriter:
+    """pandas + openpyxl: the whole workbook is built in memory and written on close()."""
+
+    name = 'openpyxl'
+
+    def __init__(self, output):
+        import pandas as pd
+
+        self.writer = pd.ExcelWriter(output, engine='openpyxl')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.writer.close()
+
+    def sheet(self, sheet_name):
+        if sheet_name not in self.writer.sheets:
+            self.writer.book.create_sheet(sheet_name)
+        return self.writer.sheets[sheet_name]
+
+    def write_metadata(self, sheet_name, cn, dn, cc):
+        """College/department and course code, bold and left-aligned, merged over A1:B1 and A2:B2."""
+        from openpyxl.styles import Alignment, Font
+
+        worksheet = self.sheet(sheet_name)
+
+        # Define a left-aligned style for the header text
+        left_align = Alignment(horizontal='left', vertical='center', wrap_text=True)
+        header_font = Font(bold=True, size=12)
+
+        # 1. College Name and Department (Merged on A1:B1 for two columns)
+        worksheet.merge_cells('A1:B1')
+        worksheet['A1'].value = f'{cn} - {dn}'
+        worksheet['A1'].alignment = left_align
+        worksheet['A1'].font = header_font
+
+        # 2. Course Code (Merged on A2:B2)
+        worksheet.merge_cells('A2:B2')
+        worksheet['A2'].value = f'Course Code: {cc}'
+        worksheet['A2'].alignment = left_align
+        worksheet['A2'].font = header_font
+
+    def write_table(self, sheet_name, df, startrow, index=False):
+        self.sheet(sheet_name)
+        df.to_excel(self.writer, sheet_name=sheet_name, index=index, startrow=startrow)
+
+    def set_column_widths(self, sheet_name, widths, first_col=0):
+        from openpyxl.utils import get_column_letter
+
+        worksheet = self.sheet(sheet_name)
+        for offset, width in enumerate(widths):
+            worksheet.column_dimensions[get_column_letter(first_col + offset + 1)].width = width
+
+    def add_bar_chart(self, sheet_name, title, header_row, rows, anchor):
+        """Column chart of column B (levels) by column A (outcomes) for the `rows` rows under header_row."""
+        from openpyxl.chart import BarChart, Reference
+        from openpyxl.chart.label import DataLabelList
+
+        worksheet = self.sheet(sheet_name)
+        start_row_for_data = header_row + 1  # openpyxl rows are 1-based
+
+        chart = BarChart()
+        chart.type = "col"
+        chart.style = 10
+        chart.title = title
+        chart.y_axis.title = "Attainment Level (0-3 Scale)"
+        chart.y_axis.scaling.max = 3.0
+        chart.shape = 4
+
+        # 1. Data Range: Attainment Level column (B5 to B[end])
+        data_range = Reference(worksheet, min_col=2, min_row=start_row_for_data,
+                               max_col=2, max_row=start_row_for_data + rows)
+
+        # 2. Categories Range: Course Outcome column (A6 to A[end])
+        cats_col_ref = Reference(worksheet, min_col=1, min_row=start_row_for_data + 1,
+                                 max_col=1, max_row=start_row_for_data + rows)
+
+        # Add data: titles_from_data=True uses row 5 (B5) as the series title.
+        chart.add_data(data_range, titles_from_data=True)
+
+        # Set categories (This provides the CO1, CO2 labels on the X-axis)
+        chart.set_categories(cats_col_ref)
+
+        # 1. Remove the Redundant Legend
+        chart.legend = None
+
+        # 2. Enable Data Labels
+        if chart.series:
+            # The series titles (the header 'Attainment Level') is redundant, remove it
+            chart.series[0].title = None
+
+            # Add the Data Labels to the primary series
+            chart.series[0].dLbls = DataLabelList()
+            chart.series[0].dLbls.showVal = True    # Show the Value (2.4, 0.4, 0.6)
+            chart.series[0].dLbls.showCatName = True  # Show the Category Name (CO1, CO2, CO3)
+            chart.series[0].dLbls.showSerName = False # Hide Series Name
+
+            # Fix for X-axis labels (already correct, just for robustness)
+            if chart.x_axis:
+                chart.x_axis.delete = False
+                chart.x_axis.tickLblPos = 'low'
+
+        # Position the chart
+        worksheet.add_chart(chart, anchor)
+
+
+class XlsxWriterReportWriter:
+    """xlsxwriter in constant_memory mode: each finished row goes to a temp file.
+
+    Memory stays flat however long the sheets are, but a row can no longer be
+    changed once a later row has been written.
+    """
+
+    name = 'xlsxwriter'
+
+    def __init__(self, output):
+        import xlsxwriter
+
+        self.book = xlsxwriter.Workbook(output, {'constant_memory': True})
+        self.sheets = {}
+        self.metadata_format = self.book.add_format(
+            {'bold': True, 'font_size': 12, 'align': 'left', 'valign': 'vcenter', 'text_wrap': True})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.book.close()
+
+    def sheet(self, sheet_name):
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = self.book.add_worksheet(sheet_name)
+        return self.sheets[sheet_name]
+
+    def write_metadata(self, sheet_name, cn, dn, cc):
+        worksheet = self.sheet(sheet_name)
+        worksheet.merge_range('A1:B1', f'{cn} - {dn}', self.metadata_format)
+        worksheet.merge_range('A2:B2', f'Course Code: {cc}', self.metadata_format)
+
+    def write_table(self, sheet_name, df, startrow, index=False):
+        """Header row and values as to_excel writes them; NaN and None stay blank."""
+        header = [str(col) for col in df.columns]
+        if index:
+            header.insert(0, '' if df.index.name is None else str(df.index.name))
+            df = df.reset_index()
+        self.write_rows(sheet_name, [header], startrow)
+        self.write_rows(sheet_name, df.astype(object).where(df.notna(), None).itertuples(index=False, name=None),
+                        startrow + 1)
+
+    def write_rows(self, sheet_name, rows, startrow=0):
+        worksheet = self.sheet(sheet_name)
+        for row_num, row in enumerate(rows, start=startrow):
+            worksheet.write_row(row_num, 0, row)
+
+    def set_column_widths(self, sheet_name, widths, first_col=0):
+        worksheet = self.sheet(sheet_name)
+        for offset, width in enumerate(widths):
+            worksheet.set_column(first_col + offset, first_col + offset, width)
+
+    def add_bar_chart(self, sheet_name, title, header_row, rows, anchor):
+        chart = self.book.add_chart({'type': 'column'})
+        chart.add_series({
+            'categories': [sheet_name, header_row + 1, 0, header_row + rows, 0],
+            'values': [sheet_name, header_row + 1, 1, header_row + rows, 1],
+            'data_labels': {'value': True, 'category': True},  # as the openpyxl chart
+        })
+        chart.set_style(10)
+        chart.set_title({'name': title})
+        chart.set_y_axis({'name': "Attainment Level (0-3 Scale)", 'max': 3})
+        chart.set_x_axis({'label_position': 'low'})
+        chart.set_legend({'none': True})
+        self.sheet(sheet_name).insert_chart(anchor, chart)
+
+
+REPORT_WRITERS = {writer.name: writer for writer in (OpenpyxlReportWriter, XlsxWriterReportWriter)}
@@ -0,0 +1,72 @@
+"""Result stores: each calculation's download kept until it is fetched (see app.get_result_store).
+
+MemoryResultStore keeps them in one worker; SQLiteResultStore keeps them in a
+file every worker can read.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+
+class MemoryResultStore:
+    """Per-process result bytes keyed by calculation ID: a bounded LRU with a TTL."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # result_id -> (expires_at, data)
+        self._lock = threading.Lock()
+
+    def put(self, result_id, data):
+        with self._lock:
+            self._entries[result_id] = (time.monotonic() + self.ttl_seconds, data)
+            self._entries.move_to_end(result_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, result_id):
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[result_id]
+                return None
+            self._entries.move_to_end(result_id)
+            return entry[1]
+
+
+class SQLiteResultStore:
+    """Result bytes in an SQLite file, so any worker can serve any calculation's download."""
+
+    def __init__(self, path, max_entries, ttl_seconds):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'id TEXT PRIMARY KEY, expires_at REAL NOT NULL, data BLOB NOT NULL)')
+
+    def _connect(self):
+        # one short-lived connection per call: sqlite3 connections are not shared across threads.
+        # Callers close it with closing(); `with conn` alone only commits.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, result_id, data):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                         (result_id, now + self.ttl_seconds, data))
+            conn.execute('DELETE FROM results WHERE expires_at < ?', (now,))
+            conn.execute('DELETE FROM results WHERE id NOT IN '
+                         '(SELECT id FROM results ORDER BY expires_at DESC LIMIT ?)',
+                         (self.max_entries,))
+
+    def get(self, result_id):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute('SELECT data FROM results WHERE id = ? AND expires_at >= ?',
+                               (result_id, time.time())).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,146 @@
+"""Program rollup: per-course final CO/PO levels in SQLite, summed into program PO levels.
+
+Used by app.get_rollup_store, /rollup and batch.py --program/--year.
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    program TEXT NOT NULL, year TEXT NOT NULL, course TEXT NOT NULL,
+    students INTEGER NOT NULL, updated_at REAL NOT NULL,
+    PRIMARY KEY (program, year, course));
+CREATE TABLE IF NOT EXISTS course_co (
+    program TEXT NOT NULL, year TEXT NOT NULL, course TEXT NOT NULL, co TEXT NOT NULL,
+    position INTEGER NOT NULL, direct REAL, indirect REAL, final REAL NOT NULL,
+    PRIMARY KEY (program, year, course, co));
+CREATE TABLE IF NOT EXISTS course_po (
+    program TEXT NOT NULL, year TEXT NOT NULL, course TEXT NOT NULL, po TEXT NOT NULL,
+    position INTEGER NOT NULL, attainment REAL NOT NULL,
+    weighted_sum REAL NOT NULL, weight REAL NOT NULL,
+    PRIMARY KEY (program, year, course, po));
+CREATE TABLE IF NOT EXISTS program_po (
+    program TEXT NOT NULL, year TEXT NOT NULL, po TEXT NOT NULL, position INTEGER NOT NULL,
+    attainment REAL NOT NULL, courses INTEGER NOT NULL, weight REAL NOT NULL,
+    min_course REAL NOT NULL, max_course REAL NOT NULL,
+    PRIMARY KEY (program, year, po));
+"""
+
+
+class RollupStore:
+    """Per-course final CO/PO results indexed by program, batch year and course code.
+
+    Program PO attainment is sum(CO level x mapping level) / sum(mapping level)
+    over every course that maps to the PO, i.e. each course's PO level
+    weighted by how strongly its CO-PO mapping covers that PO. It is
+    recomputed into program_po whenever a course is saved, so dashboards
+    only ever read that table. `po_levels(weighted sums, weights)` returns
+    (levels, has_mapping) arrays (app.po_levels_from_sums), so program
+    levels are divided and rounded exactly like a course's own.
+    """
+
+    def __init__(self, path, po_levels):
+        self.path = path
+        self.po_levels = po_levels
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(ROLLUP_SCHEMA)
+
+    def _connect(self):
+        # one connection per call, closed with closing() (see result_store.SQLiteResultStore)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def save_courses(self, program, year, courses):
+        """Stores (or replaces) course results and refreshes that program/year's summary.
+
+        Each course is a dict with 'course', 'students', 'direct_co',
+        'indirect_co', 'final_co', 'final_po' and 'po_weights' (see
+        course_po_weights), as returned by run_batch_course. A CO without a
+        final level (NaN, e.g. no survey ratings for it) is not stored, nor
+        are the POs it leaves without one, so the program levels come from
+        the courses that have them.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            for c in courses:
+                key = (program, year, c['course'])
+                for table in ('courses', 'course_co', 'course_po'):
+                    conn.execute(f'DELETE FROM {table} WHERE program = ? AND year = ? AND course = ?', key)
+                conn.execute('INSERT INTO courses VALUES (?, ?, ?, ?, ?)', key + (c['students'], now))
+                conn.executemany(
+                    'INSERT INTO course_co VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [key + (str(co), i, c['direct_co'].get(co), c['indirect_co'].get(co), level)
+                     for i, (co, level) in enumerate(c['final_co'].items()) if pd.notna(level)])
+                conn.executemany(
+                    'INSERT INTO course_po VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [key + (po, i, level) + tuple(c['po_weights'][po])
+                     for i, (po, level) in enumerate(c['final_po'].items()) if pd.notna(level)])
+            self._refresh(conn, program, year)
+
+    def delete_course(self, program, year, course):
+        with closing(self._connect()) as conn, conn:
+            for table in ('courses', 'course_co', 'course_po'):
+                conn.execute(f'DELETE FROM {table} WHERE program = ? AND year = ? AND course = ?',
+                             (program, year, course))
+            self._refresh(conn, program, year)
+
+    def rebuild(self):
+        """Recomputes every program summary from the stored courses."""
+        with closing(self._connect()) as conn, conn:
+            self._refresh(conn)
+
+    def _refresh(self, conn, program=None, year=None):
+        where, args = ('WHERE program = ? AND year = ?', (program, year)) if program is not None else ('', ())
+        df = pd.read_sql_query(
+            f'SELECT program, year, po, position, attainment, weighted_sum, weight FROM course_po {where}',
+            conn, params=args)
+        conn.execute(f'DELETE FROM program_po {where}', args)
+        if df.empty:
+            return
+        mapped = df[df['weight'] > 0]
+        grouped = df.groupby(['program', 'year', 'po'], sort=False).agg(
+            position=('position', 'min'), weighted_sum=('weighted_sum', 'sum'), weight=('weight', 'sum'))
+        per_course = mapped.groupby(['program', 'year', 'po'], sort=False)['attainment'].agg(
+            ['count', 'min', 'max']).reindex(grouped.index)
+        attainment, _ = self.po_levels(grouped['weighted_sum'].to_numpy(), grouped['weight'].to_numpy())
+        summary = pd.DataFrame({
+            'position': grouped['position'],
+            'attainment': attainment,
+            'courses': per_course['count'].fillna(0).astype(int),
+            'weight': grouped['weight'],
+            'min_course': per_course['min'].fillna(0.0),
+            'max_course': per_course['max'].fillna(0.0),
+        }).reset_index()
+        conn.executemany('INSERT INTO program_po VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         summary.itertuples(index=False, name=None))
+
+    def programs(self):
+        """[(program, year, course count, last update)] for the dashboard index."""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute('SELECT program, year, COUNT(*), MAX(updated_at) FROM courses '
+                                'GROUP BY program, year ORDER BY program, year DESC').fetchall()
+
+    def program_summary(self, program, year):
+        """The materialized program PO/PSO table, in mapping-sheet column order."""
+        with closing(self._connect()) as conn, conn:
+            return pd.read_sql_query(
+                'SELECT po, attainment, courses, weight, min_course, max_course FROM program_po '
+                'WHERE program = ? AND year = ? ORDER BY position, po', conn, params=(program, year))
+
+    def course_matrix(self, program, year, table='course_po', value='attainment'):
+        """Course x outcome table of stored levels (course_po or course_co).
+
+        POs a course does not map to are left empty rather than shown as 0.
+        """
+        column, mapped = ('po', 'AND weight > 0') if table == 'course_po' else ('co', '')
+        with closing(self._connect()) as conn, conn:
+            df = pd.read_sql_query(
+                f'SELECT course, {column}, position, {value} FROM {table} '
+                f'WHERE program = ? AND year = ? {mapped} ORDER BY course, position',
+                conn, params=(program, year))
+        order = df.groupby(column, sort=False)['position'].min().sort_values(kind='stable').index
+        return df.pivot(index='course', columns=column, values=value).reindex(columns=order)
@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+
+@pytest.fixture
+def sqlite_connections(monkeypatch):
+    """Every sqlite3 connection opened during the test; check_closed() asserts they all were closed."""
+    opened = []
+    connect = sqlite3.connect
+
+    def tracked(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    def check_closed():
+        assert opened
+        for conn in opened:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute('SELECT 1')
+
+    monkeypatch.setattr(sqlite3, 'connect', tracked)
+    return check_closed
@@ -0,0 +1,153 @@
+"""/api/v1/calculate: every input form and both output formats against run_section_pipeline."""
+import json
+from io import BytesIO, StringIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort, upload_files
+
+FORM = {'threshold': '55', 'level3_pct': '65', 'cie_weight': '50', 'see_weight': '50', 'course_code_calc': 'CS99'}
+
+
+@pytest.fixture(scope='module')
+def cohort():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=90, questions=20, tools=4, cos=4, seed=13)
+    df_marks.insert(2, 'Section', np.resize(['A', 'B', 'C'], len(df_marks)))
+    return df_marks, df_tool_map, df_co_po, df_survey
+
+
+def levels(table):
+    return {str(outcome): None if pd.isna(level) else float(level) for outcome, level in table.items()}
+
+
+def expected_result(cohort, form=FORM):
+    """The pipeline's tables for the same course, shaped like the API's JSON (the reference)."""
+    params = copo.read_pipeline_params(form)
+    combined, sections = copo.run_section_pipeline(*cohort, **params)
+    section_of = cohort[0]['Section']
+    result = {'course_code': form['course_code_calc'], 'students': len(cohort[0]), 'params': params}
+    result.update((table, levels(getattr(combined, table))) for table in copo.API_RESULT_TABLES)
+    result['sections'] = {section: dict({table: levels(getattr(tables, table)) for table in copo.API_RESULT_TABLES},
+                                        students=int((section_of == section).sum()))
+                          for section, tables in sections.items()}
+    return result
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def not_stored(*args, **kwargs):
+        raise AssertionError('the API must not store results')
+
+    monkeypatch.setattr(copo, 'save_pending_report', not_stored)
+    monkeypatch.setattr(copo, 'build_results_workbook', not_stored)
+    return copo.create_app({'TESTING': True}).test_client()
+
+
+def test_workbook_uploads(client, cohort):
+    df_marks, df_tool_map, df_co_po, df_survey = cohort
+    response = client.post('/api/v1/calculate', data=dict(FORM, **{
+        **upload_files(cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)),
+    }), content_type='multipart/form-data')
+    assert response.status_code == 200, response.data
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.data) == expected_result(cohort)
+
+
+def test_json_tables(client, cohort):
+    tables = dict(zip(copo.API_TABLE_FIELDS, (json.loads(df.to_json(orient='records')) for df in cohort)))
+    response = client.post('/api/v1/calculate', json=dict(FORM, **tables))
+    assert response.status_code == 200, response.data
+    assert json.loads(response.data) == expected_result(cohort)
+
+
+def test_csv_tables_uploaded_and_inline(client, cohort):
+    csv = dict(zip(copo.API_TABLE_FIELDS, (df.to_csv(index=False) for df in cohort)))
+    data = dict(FORM, marks=(BytesIO(csv['marks'].encode()), 'marks.csv'),
+                tool_map=(BytesIO(csv['tool_map'].encode()), 'tool_map.csv'),
+                co_po_mapping=csv['co_po_mapping'], survey=csv['survey'])
+    response = client.post('/api/v1/calculate', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200, response.data
+    assert json.loads(response.data) == expected_result(cohort)
+
+
+@pytest.mark.parametrize('query, headers', [('?format=csv', {}), ('', {'Accept': 'text/csv'})])
+def test_csv_output(client, cohort, query, headers):
+    tables = dict(zip(copo.API_TABLE_FIELDS, (json.loads(df.to_json(orient='records')) for df in cohort)))
+    response = client.post(f'/api/v1/calculate{query}', json=dict(FORM, **tables), headers=headers)
+    assert response.status_code == 200, response.data
+    assert response.mimetype == 'text/csv'
+    rows = pd.read_csv(StringIO(response.get_data(as_text=True)))
+    assert list(rows.columns) == ['section', 'result', 'outcome', 'level']
+    expected = expected_result(cohort)
+    found = {}
+    for section, table, outcome, level in rows.itertuples(index=False):
+        found.setdefault(section, {}).setdefault(table, {})[outcome] = level
+    assert found.pop('All students') == {table: expected[table] for table in copo.API_RESULT_TABLES}
+    assert found == {section: {table: tables[table] for table in copo.API_RESULT_TABLES}
+                     for section, tables in expected['sections'].items()}
+
+
+def test_course_code_picks_rows_of_a_multi_course_survey(client, cohort):
+    df_marks, df_tool_map, df_co_po, df_survey = cohort
+    survey = df_survey.melt(id_vars=['USN'], var_name='CO', value_name='Rating')
+    survey['CO'] = survey['CO'].str.replace('_Rating', '')
+    other = survey.assign(Rating=1)
+    survey = pd.concat([survey.assign(Course='CS99'), other.assign(Course='CS11')], ignore_index=True)
+    tables = {'marks': df_marks, 'tool_map': df_tool_map, 'co_po_mapping': df_co_po, 'survey': survey}
+    response = client.post('/api/v1/calculate', json=dict(FORM, **{
+        field: json.loads(df.to_json(orient='records')) for field, df in tables.items()}))
+    assert response.status_code == 200, response.data
+    result = json.loads(response.data)
+    expected = expected_result(cohort)
+    assert result['indirect_co'] == pytest.approx(expected['indirect_co'])
+    assert result['final_po'] == pytest.approx(expected['final_po'])
+
+
+def test_missing_tables(client):
+    response = client.post('/api/v1/calculate', json={'marks': []})
+    assert response.status_code == 400
+    assert 'missing tool_map, co_po_mapping, survey' in response.get_json()['error']
+
+
+def test_invalid_tables_list_the_cells(client, cohort):
+    df_marks, df_tool_map, df_co_po, df_survey = cohort
+    df_tool_map = df_tool_map.assign(Max_Marks=df_tool_map['Max_Marks'].astype(object))
+    df_tool_map.loc[2, 'Max_Marks'] = 'ten'
+    tables = dict(zip(copo.API_TABLE_FIELDS, (json.loads(df.to_json(orient='records'))
+                                              for df in (df_marks, df_tool_map, df_co_po, df_survey))))
+    response = client.post('/api/v1/calculate', json=dict(FORM, **tables))
+    assert response.status_code == 400
+    [error] = response.get_json()['errors']
+    assert error['sheet'] == '2_Tool_CO_Mapping' and error['cell'] == 'C4'
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'json': [1, 2]}, 'Expected a JSON object.'),
+    ({'query_string': {'format': 'xml'}, 'json': {}}, "Unknown format 'xml'"),
+    ({'json': {'marks': 5, 'tool_map': [], 'co_po_mapping': [], 'survey': []}},
+     'must be a list of row objects or CSV text'),
+])
+def test_bad_requests(client, kwargs, message):
+    response = client.post('/api/v1/calculate', **kwargs)
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
+
+
+def test_unreadable_workbook_is_a_bad_request(client):
+    files = upload_files([b'PK\x03\x04 not a workbook'] * 3)
+    response = client.post('/api/v1/calculate', data=dict(FORM, **files), content_type='multipart/form-data')
+    assert response.status_code == 400
+
+
+def test_server_faults_are_500(client, cohort, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('out of workers')
+
+    monkeypatch.setattr(copo, 'run_section_pipeline', broken)
+    tables = dict(zip(copo.API_TABLE_FIELDS, (json.loads(df.to_json(orient='records')) for df in cohort)))
+    response = client.post('/api/v1/calculate', json=dict(FORM, **tables))
+    assert response.status_code == 500
+    assert 'out of workers' in response.get_json()['error']
@@ -0,0 +1,119 @@
+"""Batch mode: file grouping, and every course's result equal to its own single-course run."""
+import os
+import subprocess
+import sys
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def course_files(seed):
+    return dict(zip(['all_data', 'co_po_mapping', 'survey'],
+                    cohort_workbooks(*make_cohort(students=80, questions=16, seed=seed))))
+
+
+def test_group_batch_files():
+    paths = ['CS82_student_data.xlsx', 'CS82_co_po_mapping.xlsx', 'CS82_survey.xlsx',
+             'courses/MA11/student_data.xlsx', 'courses/MA11/Survey.csv', 'courses/MA11/~$student_data.xlsx',
+             'notes.txt', 'EE01_co_po_mapping.csv']
+    assert copo.group_batch_files(paths) == {
+        'CS82': {'all_data': 'CS82_student_data.xlsx', 'co_po_mapping': 'CS82_co_po_mapping.xlsx',
+                 'survey': 'CS82_survey.xlsx'},
+        'MA11': {'all_data': 'courses/MA11/student_data.xlsx', 'survey': 'courses/MA11/Survey.csv'},
+    }
+
+
+@pytest.fixture(scope='module')
+def courses():
+    return {'CS01': course_files(1), 'CS02': course_files(2), 'CS03': course_files(3)}
+
+
+def test_batch_matches_single_course_runs(courses):
+    params = copo.read_pipeline_params({'threshold': 55})
+    broken = dict(courses['CS03'], all_data=b'not a workbook')
+    missing = {role: data for role, data in courses['CS02'].items() if role != 'survey'}
+    results = copo.run_batch({'CS01': courses['CS01'], 'CS02': missing, 'CS03': broken, 'CS04': courses['CS03']},
+                             params, max_workers=2)
+
+    assert [(r['course'], r['status']) for r in results] == [
+        ('CS01', 'ok'), ('CS02', 'error'), ('CS03', 'error'), ('CS04', 'ok')]
+    assert results[1]['error'] == 'missing survey workbook'
+    for result, files in [(results[0], courses['CS01']), (results[3], courses['CS03'])]:
+        df_marks, *frames = copo.load_course_inputs(files['all_data'], files['co_po_mapping'], files['survey'])
+        combined = copo.run_section_pipeline(df_marks, *frames, **params).combined
+        assert result['students'] == len(df_marks)
+        assert [result[key] for key in copo.BATCH_RESULT_SHEETS] == [dict(levels) for levels in combined]
+
+    summary = pd.read_excel(BytesIO(copo.build_batch_workbook(results)), sheet_name='Summary', header=4)
+    assert summary['Status'].tolist() == ['ok', 'error', 'error', 'ok']
+
+
+def test_batch_cli(courses, tmp_path):
+    for code, files in courses.items():
+        folder = tmp_path / 'courses' / code
+        folder.mkdir(parents=True)
+        for role, marker in [('all_data', 'student_data'), ('co_po_mapping', 'co_po_mapping'),
+                             ('survey', 'survey')]:
+            (folder / f'{marker}.xlsx').write_bytes(files[role])
+    output = tmp_path / 'out.xlsx'
+    subprocess.run([sys.executable, os.path.join(APP_DIR, 'batch.py'), str(tmp_path / 'courses'),
+                    '-o', str(output), '--workers', '1'], check=True, cwd=APP_DIR, capture_output=True)
+    final_po = pd.read_excel(output, sheet_name='Final_PO', header=4)
+    assert final_po['Course Code'].tolist() == ['CS01', 'CS02', 'CS03']
+
+
+def batch_zip(courses):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        for code, files in courses.items():
+            for role, marker in [('all_data', 'student_data'), ('co_po_mapping', 'co_po_mapping'),
+                                 ('survey', 'survey')]:
+                z.writestr(f'{code}_{marker}.xlsx', files[role])
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pool_sizes(monkeypatch):
+    """The max_workers each run_batch call got (the courses are not run)."""
+    sizes = []
+
+    def run_batch(courses, params, max_workers=None):
+        sizes.append(max_workers)
+        return [{'course': code, 'status': 'error', 'error': 'not run', 'students': 0} for code in courses]
+
+    monkeypatch.setattr(copo, 'run_batch', run_batch)
+    return sizes
+
+
+@pytest.mark.parametrize('requested, expected', [('', 3), ('1', 1), ('2', 2), ('500', 3)])
+def test_form_workers_are_capped(courses, pool_sizes, requested, expected):
+    client = copo.create_app({'TESTING': True, 'BATCH_MAX_WORKERS': 4}).test_client()
+    response = client.post('/calculate_batch', data={
+        'batch_file': (BytesIO(batch_zip(courses)), 'courses.zip'), 'max_workers': requested,
+    }, content_type='multipart/form-data')
+    assert response.mimetype.endswith('spreadsheetml.sheet')
+    # three courses: never more processes than courses, nor than BATCH_MAX_WORKERS
+    assert pool_sizes == [expected]
+
+
+def test_pool_size_cap():
+    with copo.create_app({'TESTING': True, 'BATCH_MAX_WORKERS': 2}).app_context():
+        assert [copo.batch_pool_size(n, 10) for n in (None, 1, 3, 500)] == [2, 1, 2, 2]
+
+
+@pytest.mark.parametrize('requested', ['0', '-2', '1.5', 'many'])
+def test_bad_form_workers_are_rejected(courses, pool_sizes, requested):
+    client = copo.create_app({'TESTING': True}).test_client()
+    response = client.post('/calculate_batch', data={
+        'batch_file': (BytesIO(batch_zip(courses)), 'courses.zip'), 'max_workers': requested,
+    }, content_type='multipart/form-data')
+    assert f"Max workers must be a whole number of at least 1 (got &#39;{requested}&#39;)" in response.get_data(
+        as_text=True)
+    assert pool_sizes == []
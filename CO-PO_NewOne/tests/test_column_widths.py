@@ -0,0 +1,63 @@
+"""Report column widths: sizing from the DataFrame against the worksheet cell loop it replaced."""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import make_cohort
+
+START_ROW = 5
+
+
+def cell_loop_widths(df, index=False):
+    """Writes df like the report does, then measures every cell as before (the reference)."""
+    with pd.ExcelWriter(BytesIO(), engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Sheet', startrow=START_ROW - 1, index=index)
+        worksheet = writer.sheets['Sheet']
+        col_count = df.shape[1] + (df.index.nlevels if index else 0)
+        widths = []
+        for col in range(1, col_count + 1):
+            max_length = len(str(worksheet.cell(row=START_ROW, column=col).value))
+            for row in range(START_ROW + 1, START_ROW + len(df) + 1):
+                max_length = max(max_length, len(str(worksheet.cell(row=row, column=col).value)))
+            widths.append(max(max_length * 1.2, 10))
+    return widths
+
+
+def random_frame(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 40))
+    df = pd.DataFrame({
+        'USN': [f'1XX21CS{i:03d}' for i in range(n)],
+        'Level': rng.integers(0, 4, n),
+        'Attainment (%)': np.round(rng.uniform(0, 100, n), int(rng.integers(0, 4))),
+        'Marks': np.where(rng.random(n) < 0.2, np.nan, np.round(rng.uniform(0, 10, n), 1)),
+        'A rather long column header': rng.choice(['Yes', 'No', ''], n),
+    })
+    return df.iloc[:, rng.permutation(df.shape[1])]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_widths_match_cell_loop(seed):
+    df = random_frame(seed)
+    assert copo.column_widths(df) == cell_loop_widths(df)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_widths_with_index_match_cell_loop(seed):
+    df = random_frame(seed).set_index('USN')
+    assert copo.column_widths(df, index=True) == cell_loop_widths(df, index=True)
+
+
+def test_empty_frame():
+    df = pd.DataFrame({'Course Outcome': [], 'Attainment Level': []})
+    assert copo.column_widths(df) == cell_loop_widths(df)
+
+
+def test_pipeline_frames_match_cell_loop():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=60, questions=12, seed=5)
+    params = copo.read_pipeline_params({'threshold': 50})
+    for df in copo.run_calculation_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **params):
+        assert copo.column_widths(df) == cell_loop_widths(df)
@@ -0,0 +1,73 @@
+"""CourseMarks storage: compact dtypes only where they hold every mark exactly."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+
+
+def tool_map(questions, max_marks, cos=None):
+    return pd.DataFrame({
+        'Tool_Question': questions,
+        'CO': cos or ['CO1'] * len(questions),
+        'Max_Marks': max_marks,
+        'Assessment_Type': ['SEE' if q.startswith('SEE') else 'CIE' for q in questions],
+    })
+
+
+def per_cell_levels(df_marks, df_tool_map, tool, threshold_percentage, thr3=70, thr2=55, thr1=40):
+    """The per-(tool, CO) row-sum rule the matrix pass replaced (the reference)."""
+    df_tool = df_tool_map[df_tool_map['Tool_Question'].str.startswith(tool)]
+    levels = {}
+    for co in df_tool['CO'].unique():
+        questions = df_tool[df_tool['CO'] == co]
+        cols = [q + '_Marks' for q in questions['Tool_Question'] if q + '_Marks' in df_marks.columns]
+        max_marks = questions['Max_Marks'].sum()
+        if not cols or max_marks == 0:
+            levels[co] = 0
+            continue
+        obtained = df_marks[cols].fillna(0).sum(axis=1)
+        p = (obtained >= max_marks * (threshold_percentage / 100.0)).sum() / len(df_marks)
+        levels[co] = 3 if p >= thr3 / 100 else 2 if p >= thr2 / 100 else 1 if p >= thr1 / 100 else 0
+    return levels
+
+
+def test_decimal_marks_that_float32_rounds_stay_float64():
+    # 5.2 + 0.4 reaches 40% of 14 (5.6) in float64 but not after a float32 round trip
+    df_marks = pd.DataFrame({'T1_Q1_Marks': [5.2, 0.0], 'T1_Q2_Marks': [0.4, 0.0]})
+    df_tool_map = tool_map(['T1_Q1', 'T1_Q2'], [10, 4])
+    course_marks = copo.CourseMarks.from_frame(df_marks)
+    assert course_marks.marks.dtype == np.float64
+    levels = copo.calculate_all_tool_co_attainments(course_marks, df_tool_map, ['T1'], 40, 70, 55, 40)
+    assert levels == {'T1': per_cell_levels(df_marks, df_tool_map, 'T1', 40)} == {'T1': {'CO1': 1}}
+
+
+@pytest.mark.parametrize('values, dtype', [
+    ([[3, 0], [10, np.nan]], np.uint8),
+    ([[2.5, 0.25], [7.75, np.nan]], np.float32),
+    ([[5.2, 0.4], [1, 2]], np.float64),
+    ([[300, 1], [2, 3]], np.float32),
+    ([[-1, 1], [2, 3]], np.float32),
+])
+def test_compact_marks_dtype(values, dtype):
+    values = np.array(values, dtype=float)
+    compact = copo.compact_marks(values)
+    assert compact.dtype == dtype
+    np.testing.assert_array_equal(compact.astype(np.float64), np.nan_to_num(values, nan=0.0))
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_decimal_marks_match_row_sums(seed):
+    rng = np.random.default_rng(seed)
+    questions = [f'{tool}_Q{i}' for i, tool in enumerate(['T1', 'T2', 'SEE'] * 4)]
+    max_marks = rng.integers(2, 12, len(questions)).astype(float)
+    df_tool_map = tool_map(questions, max_marks, [f'CO{i % 3 + 1}' for i in range(len(questions))])
+    marks = np.round(rng.uniform(0, 1, (60, len(questions))) * max_marks, 1)
+    marks[rng.random(marks.shape) < 0.05] = np.nan
+    df_marks = pd.DataFrame(marks, columns=[q + '_Marks' for q in questions])
+    threshold = float(rng.choice([40, 50, 55, 60, 65]))
+
+    levels = copo.calculate_all_tool_co_attainments(copo.CourseMarks.from_frame(df_marks), df_tool_map,
+                                                    ['T1', 'T2', 'SEE'], threshold, 70, 55, 40)
+    assert levels == {tool: per_cell_levels(df_marks, df_tool_map, tool, threshold)
+                      for tool in ['T1', 'T2', 'SEE']}
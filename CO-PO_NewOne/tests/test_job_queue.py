@@ -0,0 +1,119 @@
+"""JobQueue: long jobs keep their claim through heartbeats, jobs of dead workers are run again."""
+import sqlite3
+import threading
+import time
+
+from job_queue import JobQueue
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status['status'] in ('done', 'error'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish: {queue.status(job_id)}')
+
+
+def test_long_job_is_not_reclaimed_while_its_worker_beats(tmp_path):
+    runs = []
+    lock = threading.Lock()
+
+    def handler(form, blobs, progress):
+        with lock:
+            runs.append(form['n'])
+        progress('computing')
+        time.sleep(1.5)  # three times stale_seconds, without progress in between
+        return {'n': form['n']}
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), workers=3, max_pending=4, stale_seconds=0.5,
+                          ttl_seconds=60, handler=handler, heartbeat_seconds=0.1)
+    job_id = queue.submit({'n': 1})
+    status = wait_for(queue, job_id)
+    assert status['status'] == 'done' and status['result'] == {'n': 1}
+    assert runs == [1]
+
+
+def test_job_with_a_stale_heartbeat_is_run_again(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    done = threading.Event()
+
+    def handler(form, blobs, progress):
+        done.set()
+        return {'ok': True}
+
+    # a job claimed by a worker that then died: running, its last heartbeat long ago
+    queue = JobQueue(path, workers=0, max_pending=4, stale_seconds=0.5, ttl_seconds=60,
+                          handler=handler, heartbeat_seconds=0.1)
+    job_id = queue.submit({})
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'running', heartbeat_at = ?", (time.time() - 5,))
+    conn.close()
+
+    JobQueue(path, workers=1, max_pending=4, stale_seconds=0.5, ttl_seconds=60,
+                  handler=handler, heartbeat_seconds=0.1)
+    assert done.wait(5)
+    assert wait_for(queue, job_id)['status'] == 'done'
+
+
+def test_running_job_with_a_fresh_heartbeat_is_left_alone(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(path, workers=0, max_pending=4, stale_seconds=0.5, ttl_seconds=60,
+                          handler=None, heartbeat_seconds=0.1)
+    job_id = queue.submit({})
+    conn = sqlite3.connect(path)
+    with conn:
+        # started long ago (old updated_at), but its worker is still beating
+        conn.execute("UPDATE jobs SET status = 'running', updated_at = ?, heartbeat_at = ?",
+                     (time.time() - 60, time.time()))
+    conn.close()
+    assert queue._claim() is None
+    assert queue.status(job_id)['status'] == 'running'
+
+
+def test_queue_file_from_before_heartbeats_is_upgraded(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript("""
+            CREATE TABLE jobs (
+                id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT NOT NULL,
+                form TEXT NOT NULL, all_data BLOB, co_po_mapping BLOB, survey BLOB,
+                result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL);
+            INSERT INTO jobs VALUES ('old', 'running', 'parsing', '{}', NULL, NULL, NULL, NULL, NULL, 0, 0);
+        """)
+    conn.close()
+
+    queue = JobQueue(path, workers=0, max_pending=4, stale_seconds=0.5, ttl_seconds=60,
+                          handler=None, heartbeat_seconds=0.1)
+    # no heartbeat yet: the old running job is judged by updated_at, and is stale
+    assert queue._claim()[0] == 'old'
+    assert queue.submit({})
+
+
+def test_every_call_closes_its_connection(tmp_path, sqlite_connections):
+    def handler(form, blobs, progress):
+        progress('computing')
+        time.sleep(0.3)  # a few heartbeats
+        return {}
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), workers=0, max_pending=4, stale_seconds=5,
+                          ttl_seconds=60, handler=handler, heartbeat_seconds=0.05)
+    job_id = queue.submit({}, (b'marks', b'mapping', b'survey'))
+    queue._run(*queue._claim())
+    assert queue.status(job_id)['status'] == 'done'
+    sqlite_connections()
+
+
+def test_failed_job_keeps_the_error_message(tmp_path):
+    def handler(form, blobs, progress):
+        raise ValueError('no marks sheet')
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), workers=0, max_pending=4, stale_seconds=5, ttl_seconds=60,
+                     handler=handler, error_message=lambda e: f'Failed: {e}')
+    job_id = queue.submit({}, (b'marks', b'mapping', b'survey'))
+    queue._run(*queue._claim())
+    status = queue.status(job_id)
+    assert (status['status'], status['error']) == ('error', 'Failed: no marks sheet')
@@ -0,0 +1,116 @@
+"""Instrumentation: histogram rendering, stage spans, timing headers, /metrics and profiling."""
+import os
+import re
+import tracemalloc
+
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort, upload_files
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = copo.Histogram('copo_test_seconds', 'Test.', (0.1, 1), ['stage'])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage='parse')
+    histogram.observe(2, stage='a "quoted"\\stage')
+    lines = histogram.render()
+    assert lines[:2] == ['# HELP copo_test_seconds Test.', '# TYPE copo_test_seconds histogram']
+    assert 'copo_test_seconds_bucket{stage="parse",le="0.1"} 2' in lines  # le is inclusive
+    assert 'copo_test_seconds_bucket{stage="parse",le="1"} 3' in lines
+    assert 'copo_test_seconds_bucket{stage="parse",le="+Inf"} 4' in lines
+    assert 'copo_test_seconds_sum{stage="parse"} 3.65' in lines
+    assert 'copo_test_seconds_count{stage="parse"} 4' in lines
+    assert 'copo_test_seconds_count{stage="a \\"quoted\\"\\\\stage"} 1' in lines
+
+
+def test_histogram_without_labels():
+    histogram = copo.Histogram('copo_test_total', 'Test.', (1,), [])
+    histogram.observe(0.5)
+    assert histogram.render()[2:] == ['copo_test_total_bucket{le="1"} 1', 'copo_test_total_bucket{le="+Inf"} 1',
+                                      'copo_test_total_sum{} 0.5', 'copo_test_total_count{} 1']
+
+
+def series_value(text, series):
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_stage_span_records_time_and_sizes():
+    with copo.create_app({'TESTING': True}).app_context():
+        before = copo.metrics_text()
+        with copo.stage_span('test_stage', students=120) as sizes:
+            sizes['questions'] = 30
+        after = copo.metrics_text()
+    count = 'copo_stage_seconds_count{stage="test_stage"}'
+    assert series_value(after, count) == series_value(before, count) + 1
+    size_sum = 'copo_stage_input_size_sum{stage="test_stage",dimension="%s"}'
+    assert series_value(after, size_sum % 'students') - series_value(before, size_sum % 'students') == 120
+    assert series_value(after, size_sum % 'questions') - series_value(before, size_sum % 'questions') == 30
+
+
+def test_nested_spans_trace_memory_into_the_outer_span():
+    was_tracing = tracemalloc.is_tracing()
+    with copo.create_app({'TESTING': True, 'METRICS_TRACE_MEMORY': True}).app_context():
+        with copo.stage_span('test_outer'):
+            with copo.stage_span('test_inner'):
+                block = bytearray(8 * 2 ** 20)
+            del block
+        text = copo.metrics_text()
+    if not was_tracing:
+        tracemalloc.stop()
+    for stage in ('test_outer', 'test_inner'):
+        assert series_value(text, f'copo_stage_peak_memory_bytes_sum{{stage="{stage}"}}') >= 8 * 2 ** 20
+
+
+def calculate(client):
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=40, questions=12, seed=2)
+    return client.post('/calculate', data={
+        'input_method': 'upload', 'threshold': '55', 'course_code_calc': 'CS99',
+        **upload_files(cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)),
+    }, content_type='multipart/form-data')
+
+
+STAGES = ['validate', 'parse', 'tool_co_attainment', 'direct_co', 'indirect_co', 'po_attainment',
+          'store', 'to_html', 'template']
+
+
+def test_metrics_after_a_calculation():
+    client = copo.create_app({'TESTING': True}).test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+    assert calculate(client).status_code == 200
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    after = response.get_data(as_text=True)
+    for stage in STAGES:
+        count = f'copo_stage_seconds_count{{stage="{stage}"}}'
+        assert series_value(after, count) > series_value(before, count), stage
+    requests = 'copo_request_seconds_count{endpoint="calculate",status="200"}'
+    assert series_value(after, requests) == series_value(before, requests) + 1
+    assert series_value(after, 'copo_stage_input_size_sum{stage="parse",dimension="students"}') >= 40
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_timing_headers(enabled):
+    client = copo.create_app({'TESTING': True, 'TIMING_HEADERS': enabled}).test_client()
+    response = calculate(client)
+    if not enabled:
+        assert 'Server-Timing' not in response.headers
+        return
+    stages = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+    assert set(STAGES) <= set(stages)
+    assert re.fullmatch(r'(\w+=\d+\.\dms)(, \w+=\d+\.\dms)*', response.headers['X-Timing'])
+
+
+def test_profile_report(tmp_path):
+    client = copo.create_app({'TESTING': True, 'PROFILING_ENABLED': True, 'PROFILE_DIR': str(tmp_path)}).test_client()
+    assert 'X-Profile-Report' not in client.get('/').headers
+    report = client.get('/?profile=1').headers['X-Profile-Report']
+    assert os.listdir(tmp_path) == [report]
+    assert '-index-' in report
+
+
+def test_profiling_off_ignores_the_switch(tmp_path):
+    client = copo.create_app({'TESTING': True, 'PROFILE_DIR': str(tmp_path)}).test_client()
+    assert 'X-Profile-Report' not in client.get('/', headers={'X-Profile': '1'}).headers
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,91 @@
+"""The parse cache: one parse per file content, LRU bounds, the Parquet tier, and untouched entries."""
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort
+
+
+def frame(rows):
+    return pd.DataFrame({'USN': [f'1RV{i:05d}' for i in range(rows)], 'T1_Q1_Marks': [float(i % 7) for i in range(rows)]})
+
+
+@pytest.fixture
+def fresh_cache():
+    cache = copo.get_parse_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_same_content_is_parsed_once(fresh_cache):
+    parses = []
+
+    def parse(f):
+        parses.append(f.read())
+        return {0: frame(3)}
+
+    first = copo.parse_cached(b'workbook bytes', 'first', parse)
+    again = copo.parse_cached(bytes(bytearray(b'workbook bytes')), 'first', parse)
+    other_variant = copo.parse_cached(b'workbook bytes', 'survey-csv', parse)
+    assert parses == [b'workbook bytes', b'workbook bytes']
+    pd.testing.assert_frame_equal(first[0], again[0])
+    pd.testing.assert_frame_equal(first[0], other_variant[0])
+
+
+def test_callers_cannot_change_the_cached_frames(fresh_cache):
+    sheets = copo.parse_cached(b'x', 'first', lambda f: {0: frame(3)})
+    sheets[0]['T1_Q1_Marks'] = -1.0
+    sheets[0].loc[0, 'USN'] = 'changed'
+    pd.testing.assert_frame_equal(copo.parse_cached(b'x', 'first', None)[0], frame(3))
+
+
+def test_memory_tier_evicts_least_recently_used():
+    size = int(frame(100).memory_usage(index=True, deep=True).sum())
+    cache = copo.ParseCache(max_bytes=int(size * 2.5))
+    for key in 'abc':
+        cache.put(key, {0: frame(100)})
+        if key == 'b':
+            cache.get('a')  # a is now more recent than b
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    cache.put('huge', {0: frame(1000)})  # larger than the whole cache: not kept
+    assert cache.get('huge') is None and cache.get('a') is not None
+
+
+def test_parquet_tier_survives_a_new_cache(tmp_path):
+    pytest.importorskip('pyarrow')
+    df_marks, df_tool_map, _, _ = make_cohort(students=50, questions=10)
+    sheets = {copo.MARKS_SHEET: df_marks, copo.TOOL_MAP_SHEET: df_tool_map}
+    copo.ParseCache(1 << 24, str(tmp_path), 1 << 24).put('k-student-sections', sheets)
+
+    restarted = copo.ParseCache(1 << 24, str(tmp_path), 1 << 24)
+    loaded = restarted.get('k-student-sections')
+    assert list(loaded) == list(sheets)
+    for name, df in sheets.items():
+        pd.testing.assert_frame_equal(loaded[name], df)
+
+
+def test_parquet_tier_is_bounded(tmp_path):
+    pytest.importorskip('pyarrow')
+    cache = copo.ParseCache(0, str(tmp_path), max_dir_bytes=1)
+    cache.put('a', {0: frame(100)})
+    cache.put('b', {0: frame(100)})
+    # over max_dir_bytes: the older entries go, nothing is served from memory (max_bytes 0)
+    assert cache.get('a') is None
+
+
+def test_rerun_with_new_thresholds_skips_parsing(fresh_cache, monkeypatch):
+    files = cohort_workbooks(*make_cohort(students=40, questions=8))
+
+    first = copo.load_course_inputs(*files)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError('parsed a cached file again')
+
+    monkeypatch.setattr(copo, 'parse_student_workbook', no_parse)
+    monkeypatch.setattr(copo.pd, 'read_excel', no_parse)
+    again = copo.load_course_inputs(*files)
+    assert first[0].marks.tolist() == again[0].marks.tolist()
+    for df, cached in zip(first[1:], again[1:]):
+        pd.testing.assert_frame_equal(df, cached)
@@ -0,0 +1,97 @@
+"""PO attainment: the matrix path against the per-PO loop it replaced."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import make_cohort
+
+
+def per_po_loop(final_co_attainments, df_mapping):
+    """calculate_po_attainment as it was before the matrix path (the reference)."""
+    po_results = {}
+    df_mapping_copy = df_mapping.copy()
+    if 'CO' in df_mapping_copy.columns:
+        df_mapping_copy.set_index('CO', inplace=True)
+    po_pso_cols = [col for col in df_mapping_copy.columns
+                   if col.startswith('PO') or col.startswith('PSO')]
+    for po_col in po_pso_cols:
+        numerator = 0
+        denominator = 0
+        for co_name, mapping_level in df_mapping_copy[po_col].items():
+            try:
+                mapping_level = float(mapping_level)
+            except (ValueError, TypeError):
+                continue
+            if pd.notna(mapping_level) and mapping_level > 0 and co_name in final_co_attainments:
+                numerator += final_co_attainments[co_name] * mapping_level
+                denominator += mapping_level
+        po_results[po_col] = round(numerator / denominator, 3) if denominator > 0 else 0
+    return po_results
+
+
+def random_course(seed):
+    """Final CO levels as the pipeline makes them (np.float64, 3 decimals) and a hand-edited mapping."""
+    rng = np.random.default_rng(seed)
+    n_cos = int(rng.integers(2, 9))
+    cos = [f'CO{i + 1}' for i in range(n_cos)]
+    final_co = {co: np.round(np.float64(rng.uniform(0, 3)), 3) for co in cos[:-1] if rng.random() > 0.1}
+    final_co[cos[-1]] = np.round(np.float64(rng.uniform(0, 3)), 3)
+    levels = rng.integers(0, 4, size=(n_cos, 13)).astype(object)
+    levels[rng.random(levels.shape) < 0.05] = '-'
+    df_mapping = pd.DataFrame(levels, columns=[f'PO{i}' for i in range(1, 12)] + ['PSO1', 'PSO2'])
+    df_mapping.insert(0, 'CO', cos)
+    return final_co, df_mapping
+
+
+@pytest.mark.parametrize('seed', range(150))
+def test_po_matches_per_po_loop(seed):
+    final_co, df_mapping = random_course(seed)
+    expected = per_po_loop(final_co, df_mapping)
+    result = copo.calculate_po_attainment(final_co, df_mapping)
+    assert list(result) == list(expected)
+    for po, level in expected.items():
+        assert result[po] == level, po
+        assert type(result[po]) is type(level), po
+
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_po_with_nan_final_co_matches_per_po_loop(seed):
+    # a CO without survey ratings has no final level; only the POs it maps to lose theirs
+    final_co, df_mapping = random_course(seed)
+    final_co[next(iter(final_co))] = np.float64(np.nan)
+    expected = per_po_loop(final_co, df_mapping)
+    result = copo.calculate_po_attainment(final_co, df_mapping)
+    assert repr(result) == repr(expected)
+
+
+def test_stacked_courses_match_per_course_loop():
+    courses = [random_course(seed) for seed in range(40)]
+    co_names, final_rows, mappings = [], [], []
+    for i, (final_co, df_mapping) in enumerate(courses):
+        mapping = copo.co_po_mapping_matrix(df_mapping)
+        mappings.append(([(i, co) for co in mapping[0]], mapping[2]))
+        co_names += [(i, co) for co in final_co]
+    for i, (final_co, _) in enumerate(courses):
+        final_rows.append([final_co[co] if course == i else 0.0 for course, co in co_names])
+    present = np.array([[course == i for course, _ in co_names] for i in range(len(courses))])
+    stacked = ([co for cos, _ in mappings for co in cos], copo.co_po_mapping_matrix(courses[0][1])[1],
+               np.vstack([levels for _, levels in mappings]))
+    po, has_mapping = copo.po_attainment_matrix(final_rows, co_names, stacked, present)
+    for i, (final_co, df_mapping) in enumerate(courses):
+        expected = per_po_loop(final_co, df_mapping)
+        assert [level if mapped else 0 for level, mapped in zip(po[i], has_mapping[i])] == list(expected.values())
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pipeline_po_matches_per_po_loop(seed):
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=120, questions=24, tools=5, cos=5,
+                                                             seed=seed)
+    params = copo.read_pipeline_params({'threshold': 45 + seed})
+    _, _, df_final_co, df_final_po = copo.run_calculation_pipeline(df_marks, df_tool_map, df_co_po,
+                                                                   df_survey, **params)
+    # np.float64 levels, as the pipeline hands them to calculate_po_attainment
+    final_co = dict(zip(df_final_co.iloc[:, 0], df_final_co.iloc[:, 1].to_numpy()))
+    expected = per_po_loop(final_co, df_co_po)
+    assert dict(zip(df_final_po.iloc[:, 0], df_final_po.iloc[:, 1])) == expected
@@ -0,0 +1,96 @@
+"""Lazy reports: built on the first download, equal to building them with the calculation."""
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort, upload_files
+
+
+def cell_values(excel_bytes):
+    wb = openpyxl.load_workbook(BytesIO(excel_bytes))
+    return {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+
+@pytest.fixture
+def calculated(monkeypatch):
+    """Runs /calculate once; returns the test client, the result ID, the eager report and a build counter."""
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=90, questions=16, seed=3)
+    df_marks.insert(1, 'Section', np.resize(['A', 'B'], len(df_marks)))
+    flask_app = copo.create_app({'TESTING': True})
+    monkeypatch.setattr(copo, '_result_store', None)
+    copo.get_parse_cache().clear()
+
+    saved = []
+    save_pending_report = copo.save_pending_report
+
+    def saving(results_dfs, **kw):
+        result_id = save_pending_report(results_dfs, **kw)
+        saved.append((result_id, results_dfs, kw))
+        return result_id
+
+    monkeypatch.setattr(copo, 'save_pending_report', saving)
+    builds = []
+    build_results_workbook = copo.build_results_workbook
+    monkeypatch.setattr(copo, 'build_results_workbook',
+                        lambda *args: builds.append(args) or build_results_workbook(*args))
+
+    client = flask_app.test_client()
+    response = client.post('/calculate', data={
+        'input_method': 'upload', 'threshold': '55', 'course_code_calc': 'CS99',
+        'college_name_calc': 'Test College', 'department_name_calc': 'CSE',
+        **upload_files(cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    [(result_id, results_dfs, kw)] = saved
+    assert f'/download_results/{result_id}'.encode() in response.data
+    eager = build_results_workbook(results_dfs, kw['cn'], kw['dn'], kw['cc'])
+    return client, result_id, eager, builds
+
+
+def test_calculate_does_not_build_the_report(calculated):
+    _, _, _, builds = calculated
+    assert builds == []
+
+
+def test_first_download_equals_the_eager_report(calculated):
+    client, result_id, eager, builds = calculated
+    response = client.get(f'/download_results/{result_id}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    sheets = cell_values(response.data)
+    assert list(sheets)[:4] == ['Direct_CO', 'Indirect_CO', 'Final_CO', 'Final_PO']
+    assert 'A_Final_CO' in sheets and 'B_Final_PO' in sheets
+    assert sheets == cell_values(eager)
+    assert len(builds) == 1
+
+
+def test_later_downloads_reuse_the_built_report(calculated):
+    client, result_id, _, builds = calculated
+    first = client.get(f'/download_results/{result_id}').data
+    assert client.get(f'/download_results/{result_id}').data == first
+    assert len(builds) == 1
+    # the report took the place of its spec: still one store entry per result
+    store = copo.get_result_store()
+    assert list(store._entries) == [result_id] and store.get(result_id) == first
+
+
+def test_downloaded_reports_do_not_evict_other_results(calculated, monkeypatch):
+    client, result_id, _, builds = calculated
+    store = copo.get_result_store()
+    monkeypatch.setattr(store, 'max_entries', 2)
+    other_id = copo.store_result(b'{}')
+    first = client.get(f'/download_results/{result_id}').data
+    assert store.get(other_id) == b'{}'
+    assert client.get(f'/download_results/{result_id}').data == first
+    assert len(builds) == 1
+
+
+def test_unknown_result_id(calculated):
+    client, _, _, builds = calculated
+    response = client.get('/download_results/not-a-result')
+    assert response.status_code == 200
+    assert b'No results available' in response.data
+    assert builds == []
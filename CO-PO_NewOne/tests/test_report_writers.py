@@ -0,0 +1,32 @@
+"""Both report writers draw the same chart: value and category labels on every bar."""
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import app as copo
+from report_writers import REPORT_WRITERS
+
+CHART = '{http://schemas.openxmlformats.org/drawingml/2006/chart}'
+
+
+@pytest.fixture(params=['openpyxl', 'xlsxwriter'])
+def writer_class(request):
+    if request.param == 'xlsxwriter':
+        pytest.importorskip('xlsxwriter')
+    return REPORT_WRITERS[request.param]
+
+
+def test_bar_chart_labels_show_value_and_category(writer_class):
+    df = pd.DataFrame({'Course Outcome': ['CO1', 'CO2', 'CO3'], 'Final Attainment Level': [2.4, 0.4, 0.6]})
+    output = BytesIO()
+    with writer_class(output) as writer:
+        copo.setup_results_sheet(writer, df, 'Final_CO', 'College', 'Dept', 'CS82')
+    with zipfile.ZipFile(output) as z:
+        chart = ET.fromstring(z.read('xl/charts/chart1.xml'))
+    labels = chart.find(f'.//{CHART}ser/{CHART}dLbls')
+    shown = {flag.tag[len(CHART):]: flag.get('val') in ('1', 'true') for flag in labels}
+    assert shown['showVal'] and shown['showCatName']
+    assert not shown.get('showSerName')
@@ -0,0 +1,12 @@
+"""SQLiteResultStore: results round-trip and every connection is closed after use."""
+from result_store import SQLiteResultStore
+
+
+def test_put_and_get_close_their_connections(tmp_path, sqlite_connections):
+    store = SQLiteResultStore(str(tmp_path / 'results.sqlite3'), max_entries=2, ttl_seconds=60)
+    for i in range(3):
+        store.put(f'r{i}', f'data {i}'.encode())
+    assert store.get('r0') is None  # past max_entries
+    assert store.get('r2') == b'data 2'
+    assert store.get('missing') is None
+    sqlite_connections()
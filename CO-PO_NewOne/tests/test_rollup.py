@@ -0,0 +1,70 @@
+"""RollupStore: courses with an outcome that has no level (NaN) are stored without it."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from rollup_store import RollupStore
+
+TOOL_MAP = pd.DataFrame({'Tool_Question': ['T1_Q1', 'T1_Q2', 'SEE_Q1'], 'CO': ['CO1', 'CO2', 'CO1'],
+                         'Max_Marks': [10, 4, 40], 'Assessment_Type': ['CIE', 'CIE', 'SEE']})
+MARKS = pd.DataFrame({'USN': ['a', 'b'], 'T1_Q1_Marks': [5, 3], 'T1_Q2_Marks': [4, 2], 'SEE_Q1_Marks': [20, 30]})
+
+
+def course(code, df_co_po, co2_ratings):
+    """The rollup dict for one course, as calculate_course and run_batch_course build it."""
+    df_survey = pd.DataFrame({'USN': ['a', 'b'], 'CO1_Rating': [3, 2], 'CO2_Rating': co2_ratings})
+    combined, _ = copo.run_section_pipeline(copo.CourseMarks.from_frame(MARKS), TOOL_MAP, df_co_po, df_survey,
+                                            **copo.read_pipeline_params({}))
+    final_co = dict(combined.final_co)
+    return {'course': code, 'students': len(MARKS), 'direct_co': dict(combined.direct_co),
+            'indirect_co': dict(combined.indirect_co), 'final_co': final_co,
+            'final_po': dict(combined.final_po), 'po_weights': copo.course_po_weights(final_co, df_co_po)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RollupStore(str(tmp_path / 'rollup.sqlite3'), copo.po_levels_from_sums)
+
+
+def test_nan_final_co_does_not_lose_the_rollup(store):
+    df_co_po = pd.DataFrame({'CO': ['CO1', 'CO2'], 'PO1': [3, 0], 'PO2': [0, 2]})
+    whole = course('CS1', df_co_po, [3, 2])
+    partial = course('CS2', df_co_po, [np.nan, np.nan])  # nobody rated CO2
+    assert np.isnan(partial['final_co']['CO2']) and np.isnan(partial['final_po']['PO2'])
+
+    store.save_courses('CSE', '2024', [whole, partial])
+
+    assert [row[2] for row in store.programs()] == [2]
+    final_co = store.course_matrix('CSE', '2024', 'course_co', 'final')
+    assert final_co.loc['CS2', 'CO1'] == pytest.approx(partial['final_co']['CO1'])
+    assert np.isnan(final_co.loc['CS2', 'CO2'])
+    summary = store.program_summary('CSE', '2024').set_index('po')
+    # PO1 from both courses, PO2 from the one that has a level for it
+    assert summary.loc['PO1', 'courses'] == 2
+    assert summary.loc['PO1', 'attainment'] == pytest.approx(
+        (whole['final_po']['PO1'] + partial['final_po']['PO1']) / 2, abs=1e-3)
+    assert summary.loc['PO2', 'courses'] == 1
+    assert summary.loc['PO2', 'attainment'] == pytest.approx(whole['final_po']['PO2'])
+
+
+def test_course_with_no_levels_is_still_listed(store):
+    df_co_po = pd.DataFrame({'CO': ['CO1', 'CO2'], 'PO1': [3, 2]})
+    partial = course('CS2', df_co_po, [np.nan, np.nan])
+    assert np.isnan(partial['final_po']['PO1'])
+
+    store.save_courses('CSE', '2024', [partial])
+    assert [row[:3] for row in store.programs()] == [('CSE', '2024', 1)]
+    assert store.program_summary('CSE', '2024').empty
+
+
+def test_every_call_closes_its_connection(tmp_path, sqlite_connections):
+    store = RollupStore(str(tmp_path / 'rollup.sqlite3'), copo.po_levels_from_sums)
+    df_co_po = pd.DataFrame({'CO': ['CO1', 'CO2'], 'PO1': [3, 1]})
+    store.save_courses('CSE', '2024', [course('CS1', df_co_po, [3, 2]), course('CS2', df_co_po, [2, 2])])
+    store.programs()
+    store.program_summary('CSE', '2024')
+    store.course_matrix('CSE', '2024')
+    store.delete_course('CSE', '2024', 'CS2')
+    store.rebuild()
+    sqlite_connections()
@@ -0,0 +1,88 @@
+"""Sample downloads: cached bytes equal a fresh build, per header, with ETags."""
+import zipfile
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import app as copo
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(copo, '_sample_cache', None)
+    return copo.create_app({'TESTING': True}).test_client()
+
+
+def cell_values(data):
+    wb = openpyxl.load_workbook(BytesIO(data))
+    return {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+
+def expected_sheets(sample, cn, dn, cc):
+    """The metadata header and each sample table from row 6, as the route has always written them."""
+    sheets = {}
+    for sheet_name, table in copo.SAMPLE_WORKBOOKS[sample][1]:
+        df = pd.DataFrame(table)
+        header = [[f'{cn} - {dn}'], [f'Course Code: {cc}'], [], [], []]
+        sheets[sheet_name] = (header, [list(df.columns)] + df.values.tolist())
+    return sheets
+
+
+@pytest.mark.parametrize('sample', ['student', 'copomatrix', 'survey'])
+def test_sample_workbook_contents(client, sample):
+    response = client.get(f'/download_sample/{sample}?cn=RVCE&dn=CSE&cc=CS82')
+    assert response.status_code == 200
+    assert f'filename=CS82_{copo.SAMPLE_WORKBOOKS[sample][0]}' in response.headers['Content-Disposition']
+    sheets = cell_values(response.data)
+    expected = expected_sheets(sample, 'RVCE', 'CSE', 'CS82')
+    assert list(sheets) == list(expected)
+    for name, (header, table) in expected.items():
+        rows = [[v for v in row if v is not None] for row in sheets[name]]
+        assert rows[:5] == header
+        assert rows[5:] == table
+
+
+def test_cached_bytes_equal_a_fresh_build(client, monkeypatch):
+    first = client.get('/download_sample/student?cc=CS82').data
+    assert client.get('/download_sample/student?cc=CS82').data == first
+    monkeypatch.setattr(copo, '_sample_cache', None)
+    assert cell_values(client.get('/download_sample/student?cc=CS82').data) == cell_values(first)
+
+
+def test_samples_are_built_once_per_header(client, monkeypatch):
+    builds = []
+    report_writer = copo.report_writer
+    monkeypatch.setattr(copo, 'report_writer', lambda output: builds.append(1) or report_writer(output))
+    for _ in range(3):
+        client.get('/download_sample/survey?cc=CS82')
+    assert len(builds) == 1
+    other = client.get('/download_sample/survey?cc=CS83')
+    assert len(builds) == 2
+    assert cell_values(other.data)['Survey'][1][0] == 'Course Code: CS83'
+
+
+def test_zip_holds_the_cached_workbooks(client):
+    response = client.get('/download_sample/all?cc=CS82')
+    assert response.mimetype == 'application/zip'
+    assert 'filename=CS82_all_samples.zip' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(BytesIO(response.data)) as z:
+        assert z.namelist() == [f'CS82_{filename}' for filename, _ in copo.SAMPLE_WORKBOOKS.values()]
+        for sample in copo.SAMPLE_WORKBOOKS:
+            assert z.read(copo.sample_filename(sample, 'CS82')) == client.get(
+                f'/download_sample/{sample}?cc=CS82').data
+    assert client.get('/download_sample/all?cc=CS82').data == response.data
+
+
+def test_repeat_download_with_etag_is_304(client):
+    response = client.get('/download_sample/copomatrix')
+    etag = response.headers['ETag']
+    again = client.get('/download_sample/copomatrix', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert client.get('/download_sample/copomatrix?cc=other', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_alias_and_unknown_sample(client):
+    assert client.get('/download_sample/COPOMAP').data == client.get('/download_sample/copomatrix').data
+    assert client.get('/download_sample/nothing').status_code == 404
@@ -0,0 +1,86 @@
+"""Per-section attainment: each section against the whole pipeline run on that section's students."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import make_cohort
+
+PARAMS = copo.read_pipeline_params({'threshold': 55})
+
+
+def as_dicts(tables):
+    return {field: dict(getattr(tables, field)) for field in tables._fields}
+
+
+def subset_pipeline(df_marks, df_tool_map, df_co_po, df_survey):
+    """The whole-course pipeline on some students, without a Section column (the reference)."""
+    df_marks = df_marks.drop(columns=[c for c in df_marks.columns if copo.is_section_column(c)])
+    df_survey = df_survey.drop(columns=[c for c in df_survey.columns if copo.is_section_column(c)])
+    return as_dicts(copo.run_section_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **PARAMS).combined)
+
+
+def random_course(seed, survey_sections):
+    rng = np.random.default_rng(seed)
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=int(rng.integers(30, 120)), questions=18,
+                                                             tools=4, cos=4, seed=seed)
+    labels = rng.choice(np.array(['A', 'B', 'C', 2.0, None], dtype=object), len(df_marks), p=[.3, .3, .2, .1, .1])
+    df_marks.insert(2, 'Section', labels)
+    if survey_sections:
+        df_survey.insert(1, 'Cohort', labels)
+    # some students skipped the survey; section C none of them answered
+    answered = (rng.random(len(df_survey)) < 0.85) & (labels != 'C')
+    return df_marks, df_tool_map, df_co_po, df_survey[answered].reset_index(drop=True)
+
+
+@pytest.mark.parametrize('survey_sections', [False, True])
+@pytest.mark.parametrize('seed', range(8))
+def test_each_section_matches_pipeline_on_its_students(seed, survey_sections):
+    df_marks, df_tool_map, df_co_po, df_survey = random_course(seed, survey_sections)
+    result = copo.run_section_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **PARAMS)
+
+    assert as_dicts(result.combined) == subset_pipeline(df_marks, df_tool_map, df_co_po, df_survey)
+    labels = df_marks['Section'].map(copo.section_label)
+    assert list(result.sections) == sorted(labels.dropna().unique())
+    survey_labels = (df_survey['Cohort'] if survey_sections else
+                     df_survey['USN'].map(dict(zip(df_marks['USN'], df_marks['Section'])))).map(copo.section_label)
+    for section, tables in result.sections.items():
+        survey = df_survey[survey_labels == section]
+        expected = subset_pipeline(df_marks[labels == section], df_tool_map, df_co_po,
+                                   survey if len(survey) else df_survey)
+        assert as_dicts(tables) == expected, section
+
+
+def test_no_section_column_no_sections():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=40, seed=1)
+    result = copo.run_section_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **PARAMS)
+    assert dict(result.sections) == {}
+
+
+@pytest.mark.parametrize('value, label', [
+    ('A', 'A'), (' B ', 'B'), (2.0, '2'), (2.5, '2.5'), (3, '3'), (None, None), (np.nan, None),
+])
+def test_section_label(value, label):
+    assert copo.section_label(value) == label
+
+
+def test_report_sheet_names_are_valid_and_unique():
+    tables = copo.AttainmentTables.from_levels({'CO1': 2.0}, {'CO1': 3.0}, {'CO1': 2.2}, {'PO1': 2.2})
+    long_label = 'Evening batch / part-time students'
+    sheets = copo.section_report_sheets({'A': tables, 'B:1': tables, long_label: tables,
+                                         long_label[:22] + ' (2)': tables})
+    names = list(sheets)
+    assert names[:4] == ['A_Final_CO', 'A_Final_PO', 'B-1_Final_CO', 'B-1_Final_PO']
+    assert len(set(names)) == len(names) == 8
+    assert all(len(name) <= 31 and not set(name) & set('[]:*?/\\') for name in names)
+    pd.testing.assert_frame_equal(sheets['A_Final_PO'], tables.frame('final_po'))
+
+
+def test_summary_counts_students_per_section():
+    df_marks, df_tool_map, df_co_po, df_survey = random_course(3, survey_sections=False)
+    result = copo.run_section_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **PARAMS)
+    df_co, df_po = copo.section_summary(result.combined, result.sections, df_marks)
+    labels = df_marks['Section'].map(copo.section_label)
+    assert list(df_co['Section']) == ['All students'] + list(result.sections)
+    assert list(df_co['Students']) == [len(df_marks)] + [int((labels == s).sum()) for s in result.sections]
+    assert df_po.iloc[0, 2:].to_dict() == dict(result.combined.final_po)
@@ -0,0 +1,65 @@
+"""Deferred imports: the app starts without pandas/numpy/openpyxl and loads them on first use or on preload."""
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ['pandas', 'numpy', 'openpyxl', 'requests']
+
+
+def run_fresh(code, **env):
+    """Runs code in a new interpreter next to app.py and returns what it prints as JSON."""
+    result = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True,
+                            env={**os.environ, **env}, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+LOADED = f'[name for name in {HEAVY!r} if name in sys.modules]'
+
+
+def test_import_and_upload_page_skip_heavy_modules():
+    loaded = run_fresh(f"""
+import json, sys
+import app
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+assert client.get('/metrics').status_code == 200
+print(json.dumps({LOADED}))
+""", COPO_PRELOAD='0')
+    assert loaded == []
+
+
+def test_first_use_loads_and_rebinds():
+    result = run_fresh(f"""
+import json, sys
+import app
+before = type(app.pd).__name__
+client = app.app.test_client()
+assert client.get('/download_sample/survey').status_code == 200
+print(json.dumps({{'before': before, 'after': type(app.pd).__name__, 'pd': app.pd is sys.modules['pandas'],
+                  'loaded': {LOADED}}}))
+""", COPO_PRELOAD='0')
+    assert result['before'] == 'LazyModule'
+    assert result['after'] == 'module' and result['pd']
+    assert {'pandas', 'numpy'} <= set(result['loaded'])
+
+
+def test_preload_from_the_environment():
+    result = run_fresh(f"""
+import json, sys
+import app
+print(json.dumps({{'loaded': {LOADED}, 'np': app.np is sys.modules['numpy']}}))
+""", COPO_PRELOAD='1')
+    assert result == {'loaded': HEAVY, 'np': True}
+
+
+def test_preload_from_create_app():
+    result = run_fresh(f"""
+import json, sys
+import app
+app.create_app({{'PRELOAD_HEAVY_MODULES': True}})
+print(json.dumps({{'loaded': {LOADED}, 'pd': app.pd is sys.modules['pandas']}}))
+""", COPO_PRELOAD='0')
+    assert result == {'loaded': HEAVY, 'pd': True}
@@ -0,0 +1,108 @@
+"""Per-student export: chunked rows against per-student row sums, and the CSV/Excel streams."""
+from io import BytesIO, StringIO
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import app as copo
+from report_writers import REPORT_WRITERS
+from synthetic import make_cohort
+
+
+def per_student_rows(df_marks, df_tool_map, threshold_percentage):
+    """One row per student per (tool, CO) with marks columns and max marks, by plain row sums (the reference)."""
+    prefixes = df_tool_map['Tool_Question'].str.split('_').str[0]
+    rows = []
+    for tool in prefixes.unique():
+        df_tool = df_tool_map[prefixes == tool]
+        for co in df_tool['CO'].astype(str).unique():
+            questions = df_tool[df_tool['CO'].astype(str) == co]
+            cols = [q + '_Marks' for q in questions['Tool_Question'] if q + '_Marks' in df_marks.columns]
+            max_marks = questions['Max_Marks'].sum()
+            if not cols or max_marks == 0:
+                continue
+            threshold = max_marks * (threshold_percentage / 100.0)
+            for usn, obtained in zip(df_marks['USN'], df_marks[cols].fillna(0).sum(axis=1)):
+                rows.append((usn, tool, co, obtained, max_marks, round(threshold, 3),
+                             'Pass' if obtained >= threshold else 'Fail'))
+    return pd.DataFrame(rows, columns=copo.STUDENT_EXPORT_COLUMNS)
+
+
+def sorted_rows(df):
+    return df.sort_values(['USN', 'Tool', 'CO']).reset_index(drop=True)
+
+
+def exported(df_marks, df_tool_map, threshold, chunk_rows=2000):
+    chunks = copo.iter_student_co_scores(df_marks, df_tool_map, threshold, chunk_rows=chunk_rows)
+    return pd.concat(list(chunks), ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def cohort():
+    df_marks, df_tool_map, _, _ = make_cohort(students=75, questions=20, tools=4, cos=4, seed=11)
+    # a question without a marks column, and a CO whose questions are worth nothing
+    df_tool_map = pd.concat([df_tool_map, pd.DataFrame({
+        'Tool_Question': ['T1_Q99', 'T2_Q98'], 'CO': ['CO1', 'CO9'], 'Max_Marks': [5, 0],
+        'Assessment_Type': ['CIE', 'CIE']})], ignore_index=True)
+    df_marks.iloc[::7, 3] = np.nan
+    return df_marks, df_tool_map
+
+
+@pytest.mark.parametrize('threshold', [40, 55, 72.5])
+def test_rows_match_per_student_row_sums(cohort, threshold):
+    df_marks, df_tool_map = cohort
+    result = sorted_rows(exported(df_marks, df_tool_map, threshold))
+    expected = sorted_rows(per_student_rows(df_marks, df_tool_map, threshold))
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_chunk_size_does_not_change_the_rows(cohort):
+    df_marks, df_tool_map = cohort
+    pd.testing.assert_frame_equal(exported(df_marks, df_tool_map, 55, chunk_rows=7),
+                                  exported(df_marks, df_tool_map, 55, chunk_rows=10_000))
+
+
+def test_pass_rows_give_the_attainment_levels(cohort):
+    df_marks, df_tool_map = cohort
+    rows = exported(df_marks, df_tool_map, 55)
+    pass_share = (rows['Status'] == 'Pass').groupby([rows['Tool'], rows['CO']]).mean()
+    levels = copo.calculate_all_tool_co_attainments(copo.CourseMarks.from_frame(df_marks), df_tool_map,
+                                                    list(rows['Tool'].unique()), 55, 70, 55, 40)
+    for (tool, co), share in pass_share.items():
+        expected = 3 if share >= 0.7 else 2 if share >= 0.55 else 1 if share >= 0.4 else 0
+        assert levels[tool][co] == expected, (tool, co)
+
+
+def test_csv_stream(cohort):
+    df_marks, df_tool_map = cohort
+    chunks = copo.iter_student_co_scores(df_marks, df_tool_map, 55, chunk_rows=10)
+    text = ''.join(copo.stream_student_csv(chunks))
+    pd.testing.assert_frame_equal(pd.read_csv(StringIO(text)), pd.read_csv(StringIO(
+        exported(df_marks, df_tool_map, 55).to_csv(index=False))))
+
+
+@pytest.fixture(params=['openpyxl', 'xlsxwriter'])
+def writer_class(request):
+    if request.param == 'xlsxwriter':
+        pytest.importorskip('xlsxwriter')
+    return REPORT_WRITERS[request.param]
+
+
+def test_xlsx_stream(cohort, writer_class):
+    df_marks, df_tool_map = cohort
+    chunks = copo.iter_student_co_scores(df_marks, df_tool_map, 55, chunk_rows=10)
+    data = b''.join(copo.stream_student_xlsx(chunks, 'College', 'CSE', 'CS99', writer_class))
+    ws = openpyxl.load_workbook(BytesIO(data), read_only=True)['Student_CO_Attainment']
+    values = list(ws.iter_rows(values_only=True))
+    assert values[0][0] == 'College - CSE' and values[1][0] == 'Course Code: CS99'
+    assert list(values[4]) == copo.STUDENT_EXPORT_COLUMNS
+    result = pd.DataFrame(values[5:], columns=copo.STUDENT_EXPORT_COLUMNS)
+    pd.testing.assert_frame_equal(result, exported(df_marks, df_tool_map, 55), check_dtype=False)
+
+
+def test_no_cells_means_no_rows(cohort):
+    df_marks, df_tool_map = cohort
+    df_tool_map = df_tool_map.assign(Max_Marks=0)
+    assert list(copo.iter_student_co_scores(df_marks, df_tool_map, 55)) == []
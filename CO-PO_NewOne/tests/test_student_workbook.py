@@ -0,0 +1,86 @@
+"""The student workbook upload path: only the needed sheets and columns, marks kept exact."""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import make_cohort, xlsx_bytes
+
+
+@pytest.fixture
+def decimal_course():
+    """Two students; the first has 5.2 + 0.4, exactly 40% of 14 in float64."""
+    df_marks = pd.DataFrame({
+        'USN': ['1RV001', '1RV002'],
+        'STUDENT NAME': ['A', 'B'],
+        'T1_Q1_Marks': [5.2, 0.0],
+        'T1_Q2_Marks': [0.4, 0.0],
+        'SEE_Q1_Marks': [20.0, 5.0],
+        'REMARKS': ['x', 'y'],
+    })
+    df_tool_map = pd.DataFrame({
+        'Tool_Question': ['T1_Q1', 'T1_Q2', 'SEE_Q1'],
+        'CO': ['CO1', 'CO1', 'CO1'],
+        'Max_Marks': [10, 4, 40],
+        'Assessment_Type': ['CIE', 'CIE', 'SEE'],
+    })
+    df_co_po = pd.DataFrame({'CO': ['CO1'], 'PO1': [3]})
+    df_survey = pd.DataFrame({'USN': ['1RV001', '1RV002'], 'CO1_Rating': [3, 2]})
+    student = xlsx_bytes({'1_Student_Marks': df_marks, '2_Tool_CO_Mapping': df_tool_map,
+                          'Notes': pd.DataFrame({'a': [1]})})
+    return student, xlsx_bytes({'CO_PO': df_co_po}), xlsx_bytes({'Survey': df_survey})
+
+
+def test_only_marks_columns_are_kept(decimal_course):
+    sheets = copo.parse_student_workbook(BytesIO(decimal_course[0]))
+    assert set(sheets) == {copo.MARKS_SHEET, copo.TOOL_MAP_SHEET}
+    assert list(sheets[copo.MARKS_SHEET].columns) == ['USN', 'T1_Q1_Marks', 'T1_Q2_Marks', 'SEE_Q1_Marks']
+
+
+def test_decimal_marks_are_not_narrowed(decimal_course):
+    df_marks = copo.parse_student_workbook(BytesIO(decimal_course[0]))[copo.MARKS_SHEET]
+    marks = df_marks[['T1_Q1_Marks', 'T1_Q2_Marks']].to_numpy()
+    assert marks.dtype == np.float64
+    np.testing.assert_array_equal(marks, [[5.2, 0.4], [0.0, 0.0]])
+
+
+def test_upload_path_levels(decimal_course):
+    copo.get_parse_cache().clear()
+    # twice: a fresh parse, then a parse cache hit
+    for _ in range(2):
+        df_marks, df_tool_map, df_co_po, df_survey = copo.load_course_inputs(*decimal_course)
+        levels = copo.calculate_all_tool_co_attainments(df_marks, df_tool_map, ['T1', 'SEE'], 40, 70, 55, 40)
+        # one of two students reaches 5.6 of 14 on T1: 50%, level 1
+        assert levels == {'T1': {'CO1': 1}, 'SEE': {'CO1': 1}}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_a_full_read(seed):
+    df_marks, df_tool_map, _, _ = make_cohort(students=120, questions=30, tools=5, cos=4, seed=seed)
+    df_marks.insert(2, 'Section', np.resize(['A', 'B'], len(df_marks)))
+    df_marks['REMARKS'] = 'ok'
+    student = xlsx_bytes({'Instructions': pd.DataFrame({'Step': ['Fill in marks']}),
+                          '1_Student_Marks': df_marks, '2_Tool_CO_Mapping': df_tool_map,
+                          'Scratch': pd.DataFrame(np.ones((50, 20)))})
+
+    full = pd.read_excel(BytesIO(student), sheet_name=None)
+    sheets = copo.parse_student_workbook(BytesIO(student))
+    marks_cols = [col for col in full[copo.MARKS_SHEET].columns if str(col).endswith('_Marks')]
+    np.testing.assert_array_equal(sheets[copo.MARKS_SHEET][marks_cols].to_numpy(dtype=float),
+                                  full[copo.MARKS_SHEET][marks_cols].fillna(0).to_numpy(dtype=float))
+    assert list(sheets[copo.MARKS_SHEET]['Section']) == list(full[copo.MARKS_SHEET]['Section'])
+    pd.testing.assert_frame_equal(sheets[copo.TOOL_MAP_SHEET], full[copo.TOOL_MAP_SHEET])
+
+    tools = list(df_tool_map['Tool_Question'].str.split('_').str[0].unique())
+    assert (copo.calculate_all_tool_co_attainments(copo.CourseMarks.from_frame(sheets[copo.MARKS_SHEET]),
+                                                   sheets[copo.TOOL_MAP_SHEET], tools, 55, 70, 55, 40)
+            == copo.calculate_all_tool_co_attainments(full[copo.MARKS_SHEET], full[copo.TOOL_MAP_SHEET],
+                                                      tools, 55, 70, 55, 40))
+
+
+def test_missing_sheet():
+    student = xlsx_bytes({'1_Student_Marks': pd.DataFrame({'USN': ['1RV001']})})
+    with pytest.raises(ValueError, match="Student Data must have sheets '1_Student_Marks' and '2_Tool_CO_Mapping'"):
+        copo.parse_student_workbook(BytesIO(student))
@@ -0,0 +1,124 @@
+"""Indirect attainment: the wide sheet against the per-column loop, and long/CSV surveys against the wide form."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from synthetic import xlsx_bytes
+
+
+def per_column_loop(df_survey):
+    """calculate_indirect_co_attainment as it was before the single reduction (the reference)."""
+    indirect = {}
+    for col in [col for col in df_survey.columns if 'CO' in col and '_Rating' in col]:
+        avg_rating = df_survey[col].mean() if not df_survey.empty else 0
+        indirect[col.replace('_Rating', '')] = round(avg_rating, 3) if not df_survey.empty else 0
+    return indirect
+
+
+def wide_survey(seed, students=None, cos=None):
+    rng = np.random.default_rng(seed)
+    students = students if students is not None else int(rng.integers(1, 200))
+    cos = cos or int(rng.integers(1, 8))
+    ratings = rng.integers(1, 4, size=(students, cos)).astype(float)
+    ratings[rng.random(ratings.shape) < 0.1] = np.nan
+    df = pd.DataFrame(ratings, columns=[f'CO{i}_Rating' for i in range(1, cos + 1)])
+    df.insert(0, 'USN', [f'1RV{i:05d}' for i in range(students)])
+    return df
+
+
+def long_rows(df_wide, course='CS82'):
+    """The same answers as one (Course, USN, CO, Rating) row each."""
+    df = df_wide.melt(id_vars=['USN'], var_name='CO', value_name='Rating')
+    df['CO'] = df['CO'].str.replace('_Rating', '')
+    df.insert(0, 'Course', course)
+    return df
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_wide_matches_per_column_loop(seed):
+    df = wide_survey(seed)
+    # a CO nobody rated is NaN either way
+    pd.testing.assert_series_equal(pd.Series(copo.calculate_indirect_co_attainment(df), dtype=float),
+                                   pd.Series(per_column_loop(df), dtype=float))
+
+
+def test_empty_wide_survey():
+    df = wide_survey(0, students=0, cos=3)
+    assert copo.calculate_indirect_co_attainment(df) == per_column_loop(df) == {'CO1': 0, 'CO2': 0, 'CO3': 0}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_long_rows_equal_the_wide_sheet(seed):
+    df = wide_survey(seed, students=50)
+    long = long_rows(df).sample(frac=1, random_state=seed)  # answer order does not matter
+    assert copo.calculate_indirect_co_attainment(long) == pytest.approx(copo.calculate_indirect_co_attainment(df))
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+
+@pytest.mark.parametrize('chunk_rows', [7, 100, 100_000])
+def test_csv_aggregated_in_chunks_equals_the_wide_sheets(chunk_rows):
+    surveys = {course: wide_survey(seed, students=60, cos=4) for seed, course in enumerate(['CS81', 'CS82', 'MA11'])}
+    export = pd.concat([long_rows(df, course) for course, df in surveys.items()], ignore_index=True)
+    export = export.sample(frac=1, random_state=0)
+    aggregated = copo.aggregate_survey_csv(csv_bytes(export), chunk_rows=chunk_rows)
+    for course, df in surveys.items():
+        rows = copo.course_survey(aggregated, course)
+        assert copo.calculate_indirect_co_attainment(rows) == pytest.approx(
+            copo.calculate_indirect_co_attainment(df)), course
+        answered = df.drop(columns='USN').notna().sum()
+        assert rows.set_index('CO')['Responses'].to_dict() == {
+            col.replace('_Rating', ''): n for col, n in answered.items()}
+
+
+def test_weights_and_scales():
+    export = pd.DataFrame({
+        'Course': ['CS82'] * 5,
+        'CO': ['CO1', 'CO1', 'CO2', 'CO2', 'CO2'],
+        'Rating': [5, 1, 4, 2, np.nan],
+        'Weight': [3, 1, 1, 1, 1],
+        'Scale_Min': [1, 1, 0, 0, 0],
+        'Scale_Max': [5, 5, 4, 4, 4],
+    })
+    # CO1: 5 -> 3 (x3) and 1 -> 1; CO2: 4 -> 3 and 2 -> 2, the blank answer skipped
+    expected = {'CO1': 2.5, 'CO2': 2.5}
+    assert copo.calculate_indirect_co_attainment(export) == expected
+    assert copo.calculate_indirect_co_attainment(copo.aggregate_survey_csv(csv_bytes(export), chunk_rows=2)) == expected
+
+
+def test_scale_for_the_whole_export():
+    export = pd.DataFrame({'Course': ['CS82'] * 2, 'CO': ['CO1', 'CO1'], 'Rating': [5, 3]})
+    aggregated = copo.aggregate_survey_csv(csv_bytes(export), scale=(1, 5), chunk_rows=10)
+    assert copo.calculate_indirect_co_attainment(aggregated) == {'CO1': 2.5}
+
+
+def test_course_survey():
+    export = long_rows(wide_survey(1, students=5, cos=2), 'CS82')
+    assert copo.course_survey(export, 'cs82 ') is export  # one course: used as it is
+    both = pd.concat([export, long_rows(wide_survey(2, students=5, cos=2), 'CS81')], ignore_index=True)
+    assert list(copo.course_survey(both, 'cs81')['Course'].unique()) == ['CS81']
+    with pytest.raises(ValueError, match="no responses for course 'EE11'; it covers CS81, CS82"):
+        copo.course_survey(both, 'EE11')
+
+
+def test_read_survey_from_a_csv_upload_equals_the_workbook():
+    df = wide_survey(3, students=40, cos=3)
+    export = pd.concat([long_rows(df, 'CS82'), long_rows(wide_survey(4, students=40, cos=3), 'CS81')])
+    with copo.create_app({'TESTING': True}).app_context():
+        from_csv = copo.read_survey(csv_bytes(export), course_code='CS82')
+        from_workbook = copo.read_survey(xlsx_bytes({'Survey': df}), course_code='CS82')
+    assert copo.calculate_indirect_co_attainment(from_csv) == pytest.approx(
+        copo.calculate_indirect_co_attainment(from_workbook))
+
+
+def test_attach_shared_survey():
+    export = pd.concat([long_rows(wide_survey(5, students=20, cos=2), course) for course in ['CS81', 'CS82']])
+    courses = {'CS81': {'all_data': b'...'}, 'CS82': {'survey': b'own'}, 'CS83': {}}
+    with copo.create_app({'TESTING': True}).app_context():
+        copo.attach_shared_survey(courses, csv_bytes(export))
+    assert list(courses['CS81']['survey']['Course'].unique()) == ['CS81']
+    assert courses['CS82']['survey'] == b'own'
+    assert 'survey' not in courses['CS83']
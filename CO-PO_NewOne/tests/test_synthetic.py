@@ -0,0 +1,98 @@
+"""Synthetic cohorts and the pipeline benchmark: seeded, valid uploads, and the regression check."""
+import json
+import sys
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+import bench_pipeline
+from synthetic import cohort_workbooks, make_cohort, tool_names
+
+
+def workbook_parts(data):
+    """An xlsx file's ZIP members, less docProps/core.xml (it holds the creation time, to the second)."""
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        return {name: z.read(name) for name in z.namelist() if name != 'docProps/core.xml'}
+
+
+def test_same_seed_same_cohort():
+    for first, second in zip(make_cohort(students=50, questions=18, seed=4),
+                             make_cohort(students=50, questions=18, seed=4)):
+        pd.testing.assert_frame_equal(first, second)
+    assert ([workbook_parts(data) for data in cohort_workbooks(*make_cohort(seed=4))]
+            == [workbook_parts(data) for data in cohort_workbooks(*make_cohort(seed=4))])
+
+
+def test_other_seed_other_marks():
+    first, second = make_cohort(seed=1)[0], make_cohort(seed=2)[0]
+    assert not first.equals(second)
+
+
+@pytest.mark.parametrize('tools, names', [
+    (1, ['SEE']), (2, ['T1', 'SEE']), (3, ['T1', 'ASSIGN', 'SEE']), (5, ['T1', 'T2', 'T3', 'ASSIGN', 'SEE']),
+])
+def test_tool_names(tools, names):
+    assert tool_names(tools) == names
+
+
+def test_cohort_layout():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=30, questions=11, tools=4, cos=3,
+                                                             pos=5, psos=1)
+    assert list(df_tool_map['Tool_Question']) == ['T1_Q1', 'T2_Q1', 'ASSIGN_Q1', 'SEE_Q1', 'T1_Q2', 'T2_Q2',
+                                                  'ASSIGN_Q2', 'SEE_Q2', 'T1_Q3', 'T2_Q3', 'ASSIGN_Q3']
+    assert list(df_tool_map['Max_Marks']) == [6, 4, 5, 5, 10, 6, 4, 5, 5, 10, 6]
+    assert set(df_tool_map.loc[df_tool_map['Assessment_Type'] == 'SEE', 'Tool_Question']) == {'SEE_Q1', 'SEE_Q2'}
+    assert list(df_marks.columns[:2]) == ['USN', 'STUDENT NAME']
+    marks = df_marks.iloc[:, 2:].to_numpy()
+    assert (np.nan_to_num(marks) <= df_tool_map['Max_Marks'].to_numpy()).all()
+    assert list(df_co_po.columns) == ['CO', 'PO1', 'PO2', 'PO3', 'PO4', 'PO5', 'PSO1']
+    assert list(df_survey.columns) == ['USN', 'CO1_Rating', 'CO2_Rating', 'CO3_Rating']
+    assert df_survey.iloc[:, 1:].isin([1, 2, 3]).all().all()
+
+
+def test_workbooks_pass_validation_and_parse_back():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=40, questions=14, seed=9)
+    sources = cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)
+    with copo.create_app({'TESTING': True}).app_context():
+        copo.get_parse_cache().clear()
+        copo.validate_course_inputs(*sources)
+        course_marks, tool_map, co_po, survey = copo.load_sources('upload', sources)
+    np.testing.assert_array_equal(course_marks.marks.astype(float),
+                                  np.nan_to_num(df_marks.iloc[:, 2:].to_numpy()))
+    pd.testing.assert_frame_equal(tool_map[df_tool_map.columns], df_tool_map, check_dtype=False)
+    pd.testing.assert_frame_equal(co_po, df_co_po, check_dtype=False)
+    pd.testing.assert_frame_equal(survey, df_survey, check_dtype=False)
+
+
+def stages(**best):
+    return {'stages': {name: {'best_s': seconds} for name, seconds in best.items()}}
+
+
+def test_compare_flags_only_measurable_slowdowns(capsys):
+    baseline = stages(parse=1.0, direct_co=0.001, report=0.5, dropped=0.1)
+    current = stages(parse=1.5, direct_co=0.004, report=0.55, added=0.2)
+    assert bench_pipeline.compare(current, baseline, tolerance=0.25, min_delta=0.005) == ['parse']
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+def test_benchmark_writes_json_and_fails_against_a_faster_baseline(tmp_path, monkeypatch):
+    output = tmp_path / 'bench.json'
+    cohort = ['--students', '40', '--questions', '10', '--tools', '3', '--cos', '2', '--repeat', '1']
+    monkeypatch.setattr(sys, 'argv', ['bench_pipeline.py', *cohort, '--skip-http', '--output', str(output)])
+    assert bench_pipeline.main() == 0
+    result = json.loads(output.read_text())
+    assert result['meta']['cohort'] == {'students': 40, 'questions': 10, 'tools': 3, 'cos': 2, 'pos': 11,
+                                        'seed': 0}
+    assert result['stages'] and all(stats['best_s'] > 0 for stats in result['stages'].values())
+
+    for stats in result['stages'].values():
+        stats['best_s'] /= 100
+    baseline = tmp_path / 'old.json'
+    baseline.write_text(json.dumps(result))
+    monkeypatch.setattr(sys, 'argv', ['bench_pipeline.py', *cohort, '--skip-http', '--output', str(output),
+                                      '--baseline', str(baseline), '--min-delta', '0'])
+    assert bench_pipeline.main() == 1
@@ -0,0 +1,79 @@
+"""Several threads computing the same course from the same input objects."""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as copo
+from bench_threads import result_key
+from synthetic import cohort_workbooks, make_cohort
+
+THREADS = 8
+RUNS = 24
+
+
+@pytest.fixture(scope='module')
+def cohort():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=400, questions=40, tools=5, cos=5, seed=7)
+    df_marks.insert(1, 'Section', np.resize(['A', 'B', 'C'], len(df_marks)))
+    return df_marks, df_tool_map, df_co_po, df_survey
+
+
+def input_state(inputs):
+    """Copies of a course's inputs: DataFrames, and a CourseMarks' marks, USNs and sections."""
+    return [df.copy(deep=True) if isinstance(df, pd.DataFrame) else
+            (df.marks.copy(), list(df.columns), list(df.usns), list(df.sections)) for df in inputs]
+
+
+def assert_unchanged(inputs, copies):
+    for df, copy in zip(inputs, copies):
+        if isinstance(df, pd.DataFrame):
+            pd.testing.assert_frame_equal(df, copy)
+        else:
+            marks, columns, usns, sections = copy
+            np.testing.assert_array_equal(df.marks, marks)
+            assert df.marks.dtype == marks.dtype
+            assert (list(df.columns), list(df.usns), list(df.sections)) == (columns, usns, sections)
+
+
+def threaded(fn):
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(lambda _: fn(), range(RUNS)))
+
+
+def test_run_section_pipeline_on_shared_inputs(cohort):
+    df_marks, df_tool_map, df_co_po, df_survey = cohort
+    course_marks = copo.CourseMarks.from_frame(df_marks)
+    params = copo.read_pipeline_params({'threshold': 55})
+    inputs = [course_marks, df_tool_map, df_co_po, df_survey]
+    copies = input_state(inputs)
+
+    def run():
+        return result_key(copo.run_section_pipeline(course_marks, df_tool_map, df_co_po, df_survey, **params))
+
+    expected = run()
+    assert threaded(run) == [expected] * RUNS
+    assert_unchanged(inputs, copies)
+
+
+def test_calculate_course_on_shared_inputs(cohort):
+    sources = cohort_workbooks(*cohort)
+    form = {'threshold': '55', 'course_code_calc': 'CS99'}
+    flask_app = copo.create_app({'TESTING': True})
+    copo.get_parse_cache().clear()
+
+    def run():
+        with flask_app.app_context():
+            context = copo.calculate_course(form, 'upload', sources)
+        del context['result_id']
+        return context
+
+    expected = run()
+    # every thread reads the same cached DataFrames from here on
+    cached = copo.load_course_inputs(*sources)
+    copies = input_state(cached)
+    results = threaded(run)
+    assert all(context == expected for context in results)
+    assert_unchanged(cached, copies)
+    assert_unchanged(copo.load_course_inputs(*sources), copies)
@@ -0,0 +1,74 @@
+"""The one-pass tool/CO engine against the per-tool loop it replaced, edge cases included."""
+import numpy as np
+import pytest
+
+import app as copo
+from synthetic import make_cohort
+
+
+def per_tool_loop(df_marks, df_tool_map_meta, tool_type, threshold_percentage, thr3_pct, thr2_pct, thr1_pct):
+    """calculate_tool_co_attainment as it was before the matrix engine (the reference)."""
+    df_tool_map = df_tool_map_meta[df_tool_map_meta['Tool_Question'].str.startswith(tool_type)]
+    if df_tool_map.empty or df_marks.empty:
+        return {}
+    co_results = {}
+    total_students = len(df_marks)
+    for co_name in df_tool_map['CO'].unique():
+        co_questions = df_tool_map[df_tool_map['CO'] == co_name]
+        mark_cols_for_co = [q + '_Marks' for q in co_questions['Tool_Question'].tolist()
+                            if q + '_Marks' in df_marks.columns]
+        if not mark_cols_for_co:
+            co_results[co_name] = 0
+            continue
+        max_marks = co_questions['Max_Marks'].sum()
+        if max_marks == 0:
+            co_results[co_name] = 0
+            continue
+        obtained_marks_sum = df_marks[mark_cols_for_co].fillna(0).sum(axis=1)
+        threshold_score = max_marks * (threshold_percentage / 100.0)
+        percentage = (obtained_marks_sum >= threshold_score).sum() / total_students
+        co_results[co_name] = copo.get_co_attainment_level(percentage, thr3_pct, thr2_pct, thr1_pct)
+    return co_results
+
+
+def random_course(seed):
+    """A synthetic course with the irregularities hand-made sheets have."""
+    rng = np.random.default_rng(seed)
+    df_marks, df_tool_map, _, _ = make_cohort(students=int(rng.integers(1, 150)), questions=int(rng.integers(3, 40)),
+                                              tools=int(rng.integers(1, 7)), cos=int(rng.integers(1, 7)),
+                                              absent_rate=0.1, seed=seed)
+    df_tool_map = df_tool_map.copy()
+    n = len(df_tool_map)
+    # a question without a marks column, one with no max marks, a tool whose name prefixes another
+    df_marks = df_marks.drop(columns=[df_tool_map['Tool_Question'].iloc[int(rng.integers(n))] + '_Marks'])
+    df_tool_map.loc[int(rng.integers(n)), 'Max_Marks'] = 0
+    if seed % 3 == 0:
+        df_tool_map.loc[int(rng.integers(n)), 'Tool_Question'] = 'T10_Q1'
+        df_marks['T10_Q1_Marks'] = rng.integers(0, 6, size=len(df_marks)).astype(float)
+    return df_marks, df_tool_map
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_all_tools_match_per_tool_loop(seed):
+    df_marks, df_tool_map = random_course(seed)
+    tools = df_tool_map['Tool_Question'].str.split('_', expand=True)[0].unique()
+    cut_offs = (30 + seed % 50, 70, 55, 40)
+    result = copo.calculate_all_tool_co_attainments(df_marks, df_tool_map, tools, *cut_offs)
+    for tool in tools:
+        expected = per_tool_loop(df_marks, df_tool_map, tool, *cut_offs)
+        assert list(result[tool].items()) == list(expected.items()), tool
+
+
+def test_no_students_gives_no_levels():
+    df_marks, df_tool_map = random_course(1)
+    assert copo.calculate_tool_co_attainment(df_marks.iloc[:0], df_tool_map, 'T1', 60, 70, 55, 40) == {}
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_course_marks_and_frame_agree(seed):
+    df_marks, df_tool_map = random_course(seed)
+    tools = df_tool_map['Tool_Question'].str.split('_', expand=True)[0].unique()
+    from_frame = copo.calculate_all_tool_co_attainments(df_marks, df_tool_map, tools, 60, 70, 55, 40)
+    from_marks = copo.calculate_all_tool_co_attainments(copo.CourseMarks.from_frame(df_marks), df_tool_map,
+                                                        tools, 60, 70, 55, 40)
+    assert from_marks == from_frame
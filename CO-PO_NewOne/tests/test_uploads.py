@@ -0,0 +1,121 @@
+"""Upload limits and spooling: the per-file and archive caps, and the memory a large upload takes."""
+import hashlib
+import io
+import os
+import tracemalloc
+import zipfile
+
+import pytest
+from werkzeug.test import create_environ
+
+import app as copo
+
+MB = 1024 * 1024
+BOUNDARY = 'copo-test-boundary'
+
+
+def blob(size):
+    return os.urandom(size)  # incompressible, so a ZIP of it is as large as it
+
+
+def zip_of(size):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as z:
+        z.writestr('notes/readme.bin', blob(size))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_client():
+    def make(**config):
+        flask_app = copo.create_app({'TESTING': True, 'MAX_CONTENT_LENGTH': 4 * MB,
+                                     'UPLOAD_MAX_FILE_BYTES': 256 * 1024, **config})
+        return flask_app.test_client()
+    return make
+
+
+def test_file_over_the_per_file_cap_is_413(make_client):
+    client = make_client()
+    response = client.post('/calculate', data={'all_data_file': (io.BytesIO(blob(300 * 1024)), 'big.xlsx')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert b'big.xlsx is larger than' in response.data
+
+
+def test_batch_zip_may_use_the_whole_request(make_client):
+    client = make_client()
+    response = client.post('/calculate_batch', data={'batch_file': (io.BytesIO(zip_of(MB)), 'courses.zip')},
+                           content_type='multipart/form-data')
+    # past the per-file cap, but read: the ZIP just has no course workbooks in it
+    assert response.status_code == 200
+    assert b'No course workbooks found' in response.data
+
+
+def test_batch_zip_over_the_request_cap_is_413(make_client):
+    client = make_client(MAX_CONTENT_LENGTH=MB)
+    response = client.post('/calculate_batch', data={'batch_file': (io.BytesIO(zip_of(2 * MB)), 'courses.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+def test_batch_zip_over_the_archive_cap_is_413(make_client):
+    client = make_client(UPLOAD_MAX_ARCHIVE_BYTES=512 * 1024)
+    response = client.post('/calculate_batch', data={'batch_file': (io.BytesIO(zip_of(MB)), 'courses.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert b'courses.zip is larger than' in response.data
+
+
+def multipart_body(path, content, filename='marks.xlsx'):
+    """Writes a one-file multipart/form-data body to path; returns its length."""
+    with open(path, 'wb') as f:
+        f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="all_data_file"; '
+                f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+        f.write(content)
+        f.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+        return f.tell()
+
+
+def parse_peak(path, length, **config):
+    """Parses the multipart body at path as an UploadRequest; returns (upload, traced peak bytes)."""
+    flask_app = copo.create_app({'MAX_CONTENT_LENGTH': 64 * MB, 'UPLOAD_MAX_FILE_BYTES': 64 * MB, **config})
+    with open(path, 'rb') as body, flask_app.app_context():
+        environ = create_environ(method='POST', input_stream=body, content_length=length,
+                                 content_type=f'multipart/form-data; boundary={BOUNDARY}')
+        request = copo.UploadRequest(environ)
+        tracemalloc.start()
+        try:
+            upload = request.files['all_data_file'].stream
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return upload, peak
+
+
+def test_large_upload_is_spooled_not_held_in_memory(tmp_path):
+    content = blob(24 * MB)
+    path = tmp_path / 'body'
+    length = multipart_body(path, content)
+
+    upload, peak = parse_peak(path, length)
+    assert isinstance(upload, copo.SpooledUpload)
+    # about the spooled MB and the parser's buffers, not the 24 MB file
+    assert peak < 4 * MB
+    assert upload.size == len(content)
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    with upload.open() as view:
+        assert isinstance(view, copo.MappedFile)
+        assert view[:64] == content[:64] and view[-64:] == content[-64:]
+
+
+def test_upload_under_the_spool_size_stays_in_memory(tmp_path):
+    # the same upload kept in memory, to show the bound above measures the spooling
+    content = blob(8 * MB)
+    path = tmp_path / 'body'
+    length = multipart_body(path, content)
+
+    upload, peak = parse_peak(path, length, UPLOAD_SPOOL_BYTES=16 * MB)
+    assert peak > len(content)
+    with upload.open() as view:
+        assert isinstance(view, io.BytesIO)
+        assert view.getvalue() == content
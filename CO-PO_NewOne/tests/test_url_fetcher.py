@@ -0,0 +1,115 @@
+"""UrlFetcher against a stand-in HTTP server on a local port."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import app as copo
+
+WORKBOOK = b'PK\x03\x04' + b'x' * 5000
+
+
+class Handler(BaseHTTPRequestHandler):
+    seen = []  # (path, If-None-Match) per request
+
+    def do_GET(self):
+        Handler.seen.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/course.xlsx':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(WORKBOOK)))
+            self.end_headers()
+            self.wfile.write(WORKBOOK)
+        elif self.path == '/not-modified.xlsx':
+            self.send_response(304)
+            self.end_headers()
+        elif self.path == '/declared-too-large.xlsx':
+            self.send_response(200)
+            self.send_header('Content-Length', str(10 * 1024 * 1024))
+            self.end_headers()
+        elif self.path == '/streamed-too-large.xlsx':
+            # no Content-Length: the body runs until the connection closes
+            self.send_response(200)
+            self.end_headers()
+            try:
+                for _ in range(40):
+                    self.wfile.write(b'y' * 1024)
+            except OSError:
+                pass
+        elif self.path == '/slow.xlsx':
+            time.sleep(1.5)
+            self.send_response(200)
+            self.end_headers()
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    Handler.seen = []
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    return copo.UrlFetcher(timeout=(2, 0.5), max_bytes=20 * 1024, cache_max_bytes=1024 * 1024)
+
+
+def test_success_and_conditional_get(server, fetcher):
+    url = f'{server}/course.xlsx'
+    assert fetcher.fetch(url) == WORKBOOK
+    # the second request revalidates with the ETag and the server answers 304
+    assert fetcher.fetch(url) == WORKBOOK
+    assert Handler.seen == [('/course.xlsx', None), ('/course.xlsx', '"v1"')]
+
+
+def test_fetch_all_keeps_order(server, fetcher):
+    urls = [f'{server}/course.xlsx', f'{server}/missing.xlsx']
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_all(urls)
+    assert fetcher.fetch_all(urls[:1] * 3) == [WORKBOOK] * 3
+
+
+def test_non_200_raises(server, fetcher):
+    with pytest.raises(requests.HTTPError) as excinfo:
+        fetcher.fetch(f'{server}/missing.xlsx')
+    assert excinfo.value.response.status_code == 404
+
+
+def test_304_without_a_cached_copy(server, fetcher):
+    with pytest.raises(ValueError, match='304 Not Modified'):
+        fetcher.fetch(f'{server}/not-modified.xlsx')
+
+
+@pytest.mark.parametrize('path', ['/declared-too-large.xlsx', '/streamed-too-large.xlsx'])
+def test_size_cap(server, fetcher, path):
+    with pytest.raises(ValueError, match='download limit'):
+        fetcher.fetch(f'{server}{path}')
+
+
+def test_read_timeout(server, fetcher):
+    start = time.perf_counter()
+    with pytest.raises(requests.Timeout):
+        fetcher.fetch(f'{server}/slow.xlsx')
+    assert time.perf_counter() - start < 1.5
+
+
+def test_only_http_links(fetcher):
+    with pytest.raises(ValueError, match='http'):
+        fetcher.fetch('file:///etc/passwd')
@@ -0,0 +1,113 @@
+"""Upload validation: the cell each problem is reported at, the limits, and how routes return the list."""
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort, upload_files
+
+# Columns: marks A USN, B STUDENT NAME, C T1_Q1, D ASSIGN_Q1, E SEE_Q1, ...; tool map A-D;
+# CO-PO A CO, B PO1, C PO2, ...; survey A USN, B CO1_Rating, ...
+BROKEN_COURSE_ERRORS = [
+    ('Student Data', '2_Tool_CO_Mapping', 'C6', "Max_Marks 'ten' is not a number"),
+    ('Student Data', '2_Tool_CO_Mapping', 'D7', "Assessment_Type 'LAB' must be CIE or SEE"),
+    ('Student Data', '2_Tool_CO_Mapping', 'A8', "no 'T1_Q9_Marks' column in '1_Student_Marks'"),
+    ('Student Data', '1_Student_Marks', 'C2', 'T1_Q1_Marks 7 is more than its Max_Marks (6)'),
+    ('Student Data', '1_Student_Marks', 'D5', "ASSIGN_Q1_Marks 'abs' is not a number"),
+    ('Survey', 'Survey', 'B4', "CO1_Rating 'good' is not a number"),
+    ('CO-PO Mapping', 'CO_PO_Mapping', 'C3', "PO2 level 5 must be 0, 1, 2, 3 or '-'"),
+    ('CO-PO Mapping', 'CO_PO_Mapping', 'A5', 'CO7 is not in the tool map or the survey'),
+]
+
+
+def course(students=20):
+    return make_cohort(students=students, questions=6, tools=3, cos=3, seed=0)
+
+
+def broken_course():
+    df_marks, df_tool_map, df_co_po, df_survey = (df.astype(object) for df in course())
+    df_marks.loc[0, 'T1_Q1_Marks'] = 7
+    df_marks.loc[3, 'ASSIGN_Q1_Marks'] = 'abs'
+    df_tool_map.loc[4, 'Max_Marks'] = 'ten'
+    df_tool_map.loc[5, 'Assessment_Type'] = 'LAB'
+    df_tool_map.loc[6] = ['T1_Q9', 'CO2', 5, 'CIE']
+    df_co_po.loc[1, 'PO2'] = 5
+    df_co_po.loc[3] = ['CO7'] + [1] * 13
+    df_survey.loc[2, 'CO1_Rating'] = 'good'
+    return cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)
+
+
+def validation_errors(sources, **config):
+    with copo.create_app({'TESTING': True, **config}).app_context():
+        copo.get_parse_cache().clear()
+        try:
+            copo.validate_course_inputs(*sources)
+        except copo.InputValidationError as e:
+            return [tuple(error) for error in e.errors]
+    return []
+
+
+def test_valid_course_passes():
+    assert validation_errors(cohort_workbooks(*course())) == []
+
+
+def test_each_problem_at_its_cell():
+    assert validation_errors(broken_course()) == BROKEN_COURSE_ERRORS
+
+
+def test_stops_after_max_errors():
+    assert validation_errors(broken_course(), VALIDATION_MAX_ERRORS=3) == BROKEN_COURSE_ERRORS[:3]
+
+
+def test_only_the_sample_rows_of_marks_are_read():
+    df_marks, df_tool_map, df_co_po, df_survey = (df.astype(object) for df in course(students=80))
+    df_marks.loc[70, 'SEE_Q1_Marks'] = 'x'
+    sources = cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)
+    assert validation_errors(sources, VALIDATION_SAMPLE_ROWS=50) == []
+    assert validation_errors(sources, VALIDATION_SAMPLE_ROWS=100) == [
+        ('Student Data', '1_Student_Marks', 'E72', "SEE_Q1_Marks 'x' is not a number")]
+
+
+def test_headers_below_row_1_and_missing_sheets():
+    df_marks, df_tool_map, df_co_po, df_survey = course()
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        df_marks.to_excel(writer, sheet_name='1_Student_Marks', index=False, startrow=2)
+        df_tool_map.to_excel(writer, sheet_name='2_Tool_CO_Mapping', index=False)
+    _, co_po, survey = cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)
+    errors = validation_errors((buf.getvalue(), co_po, survey))
+    assert errors[0] == ('Student Data', '1_Student_Marks', 'A3',
+                         'the column headers are on row 3; they must be on row 1 (delete the rows above them)')
+
+    wb = Workbook()
+    wb.active.title = '1_Student_Marks'
+    buf = BytesIO()
+    wb.save(buf)
+    assert validation_errors((buf.getvalue(), co_po, survey))[0] == (
+        'Student Data', None, None, "must have sheets '1_Student_Marks' and '2_Tool_CO_Mapping' "
+                                    "(missing '2_Tool_CO_Mapping')")
+
+
+def test_calculate_page_lists_the_cells():
+    client = copo.create_app({'TESTING': True}).test_client()
+    response = client.post('/calculate', data=upload_files(broken_course()), content_type='multipart/form-data')
+    page = response.get_data(as_text=True)
+    assert 'The files have 8 problem(s)' in page
+    for _, sheet, cell, _ in BROKEN_COURSE_ERRORS:
+        assert cell in page and sheet in page
+
+
+@pytest.mark.parametrize('accept', ['application/json', 'text/html'])
+def test_jobs_turn_bad_files_away_before_queueing(accept, monkeypatch):
+    monkeypatch.setattr(copo, 'get_job_queue', lambda: pytest.fail('queued a bad course'))
+    client = copo.create_app({'TESTING': True}).test_client()
+    response = client.post('/jobs', data=upload_files(broken_course()), content_type='multipart/form-data',
+                           headers={'Accept': accept})
+    if accept == 'application/json':
+        assert response.status_code == 400
+        assert [tuple(error[field] for field in copo.CellError._fields)
+                for error in response.get_json()['errors']] == BROKEN_COURSE_ERRORS
+    else:
+        assert "Max_Marks &#39;ten&#39; is not a number" in response.get_data(as_text=True)
@@ -0,0 +1,61 @@
+"""Upload validation is skipped for files that already passed it (parse cache record)."""
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort
+
+
+@pytest.fixture
+def course():
+    copo.get_parse_cache().clear()
+    return cohort_workbooks(*make_cohort(students=50, questions=20, tools=4, cos=3))
+
+
+@pytest.fixture
+def no_workbook_reads(monkeypatch):
+    def streaming_workbook(src):
+        raise AssertionError('validation read a workbook again')
+
+    def arm():
+        monkeypatch.setattr(copo, 'streaming_workbook', streaming_workbook)
+    return arm
+
+
+def test_cache_hit_skips_validation(course, no_workbook_reads):
+    first = copo.load_course_inputs(*course)
+    no_workbook_reads()
+    second = copo.load_course_inputs(*course)
+    assert second[0].marks.tolist() == first[0].marks.tolist()
+
+
+def test_job_submission_pass_is_reused_by_the_worker(course, no_workbook_reads):
+    # /jobs validates the uploads, then the worker loads the same bytes
+    copo.validate_course_inputs(*course)
+    no_workbook_reads()
+    copo.load_course_inputs(*course)
+
+
+def test_failures_are_not_recorded(course):
+    bad_student = cohort_workbooks(*make_cohort(students=50, questions=20, tools=4, cos=3))[1]
+    for _ in range(2):
+        with pytest.raises(copo.InputValidationError):
+            copo.load_course_inputs(bad_student, course[1], course[2])
+
+
+def test_pass_covers_the_three_files_together(course):
+    copo.load_course_inputs(*course)
+    other_mapping = cohort_workbooks(*make_cohort(students=50, questions=20, tools=4, cos=5))[1]
+    assert (copo.validation_cache_key(course, 'Student Data')
+            != copo.validation_cache_key((course[0], other_mapping, course[2]), 'Student Data'))
+    with pytest.raises(copo.InputValidationError):
+        copo.load_course_inputs(course[0], other_mapping, course[2])
+
+
+def test_paths_are_always_validated(course, tmp_path):
+    assert copo.validation_cache_key([str(tmp_path / 'a.xlsx')] + list(course[1:]), 'Student Data') is None
+
+
+def test_pass_record_survives_on_disk(tmp_path):
+    cache = copo.ParseCache(1 << 20, str(tmp_path), 1 << 20)
+    cache.put('abc-validated', {})
+    assert copo.ParseCache(1 << 20, str(tmp_path), 1 << 20).get('abc-validated') == {}
@@ -0,0 +1,114 @@
+"""What-if recalculation: PreparedCourse.evaluate and /api/whatif against a full pipeline run."""
+import numpy as np
+import pytest
+
+import app as copo
+from synthetic import cohort_workbooks, make_cohort, upload_files
+
+
+def pipeline_results(df_marks, df_tool_map, df_co_po, df_survey, params):
+    """run_calculation_pipeline's four tables as {outcome: level} dicts (the reference)."""
+    frames = copo.run_calculation_pipeline(df_marks, df_tool_map, df_co_po, df_survey, **params)
+    return {name: dict(zip(df.iloc[:, 0], df.iloc[:, 1].tolist()))
+            for name, df in zip(['direct_co', 'indirect_co', 'final_co', 'final_po'], frames)}
+
+
+def random_form(rng):
+    cie = float(rng.integers(0, 101))
+    direct = float(np.round(rng.uniform(0, 1), 2))
+    return {
+        'threshold': float(rng.integers(20, 90)),
+        'level3_pct': float(rng.integers(50, 95)),
+        'level2_pct': float(rng.integers(30, 70)),
+        'level1_pct': float(rng.integers(5, 40)),
+        'cie_weight': cie,
+        'see_weight': 100 - cie,
+        'direct_weight': direct,
+        'indirect_weight': round(1 - direct, 2),
+    }
+
+
+@pytest.fixture(scope='module')
+def cohort():
+    df_marks, df_tool_map, df_co_po, df_survey = make_cohort(students=150, questions=30, tools=5, cos=5, seed=21)
+    df_co_po = df_co_po.astype(object)
+    df_co_po.iloc[1, 3] = '-'  # left blank by hand
+    return df_marks, df_tool_map, df_co_po, df_survey
+
+
+@pytest.mark.parametrize('seed', range(15))
+def test_evaluate_matches_pipeline(cohort, seed):
+    rng = np.random.default_rng(seed)
+    start = copo.read_pipeline_params({})
+    prepared = copo.PreparedCourse(*cohort, start)
+    params_list = [copo.read_pipeline_params(random_form(rng)) for _ in range(4)]
+    for params, result in zip(params_list, prepared.evaluate(params_list)):
+        assert result == pipeline_results(*cohort, params)
+
+
+def test_evaluate_with_the_original_params(cohort):
+    params = copo.read_pipeline_params({'threshold': 55})
+    [result] = copo.PreparedCourse(*cohort, params).evaluate([params])
+    assert result == pipeline_results(*cohort, params)
+
+
+@pytest.fixture
+def calculated(cohort, monkeypatch):
+    """Runs /calculate once; returns the test client and the result ID."""
+    df_marks, df_tool_map, df_co_po, df_survey = cohort
+    monkeypatch.setattr(copo, '_result_store', None)
+    monkeypatch.setattr(copo, '_prepared_courses', None)
+    client = copo.create_app({'TESTING': True}).test_client()
+    saved = []
+    save_pending_report = copo.save_pending_report
+
+    def saving(*args, **kw):
+        saved.append(save_pending_report(*args, **kw))
+        return saved[-1]
+
+    monkeypatch.setattr(copo, 'save_pending_report', saving)
+    response = client.post('/calculate', data={
+        'input_method': 'upload', 'threshold': '55', 'course_code_calc': 'CS99',
+        **upload_files(cohort_workbooks(df_marks, df_tool_map, df_co_po, df_survey)),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return client, saved[0]
+
+
+def test_api_single_scenario_keeps_missing_fields(cohort, calculated):
+    client, result_id = calculated
+    response = client.post(f'/api/whatif/{result_id}', json={'threshold': 70, 'see_weight': 50})
+    assert response.status_code == 200
+    body = response.get_json()
+    params = copo.read_pipeline_params({'threshold': 70, 'see_weight': 50})
+    assert body.pop('params') == params
+    assert body == pipeline_results(*cohort, params)
+
+
+def test_api_scenarios(cohort, calculated):
+    client, result_id = calculated
+    rng = np.random.default_rng(0)
+    forms = [random_form(rng) for _ in range(5)]
+    body = client.post(f'/api/whatif/{result_id}', json={'scenarios': forms}).get_json()
+    assert len(body['scenarios']) == 5
+    for form, result in zip(forms, body['scenarios']):
+        params = copo.read_pipeline_params(form)
+        assert result.pop('params') == params
+        assert result == pipeline_results(*cohort, params)
+
+
+@pytest.mark.parametrize('body, error', [
+    ([1, 2], 'Expected a JSON object.'),
+    ({'scenarios': {'threshold': 50}}, "'scenarios' must be a list of objects."),
+    ({'threshold': 'lots'}, 'Invalid parameter value'),
+])
+def test_api_bad_bodies(calculated, body, error):
+    client, result_id = calculated
+    response = client.post(f'/api/whatif/{result_id}', json=body)
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+
+
+def test_api_unknown_result(calculated):
+    client, _ = calculated
+    assert client.post('/api/whatif/not-a-result', json={}).status_code == 404